@@ -77,6 +77,116 @@ def get_parser():
                       default="./tmp",
                       help="Location for saving intermediary pickling and JSON serialization of actions/hosts"
                       )
+  parser.add_argument(
+                      "-sb", "--save_backend",
+                      type=str,
+                      choices=[ "json", "sqlite" ],
+                      default="json",
+                      help="Storage of the workflow save file, default is json"
+                      )
+  parser.add_argument(
+                      "-si", "--snapshot_interval",
+                      type=int,
+                      default=600,
+                      help="Seconds between compacting the run journal into the save file while running"
+                      )
+  parser.add_argument(
+                      "-sc", "--schedule",
+                      type=str,
+                      choices=[ "critical_path", "fifo" ],
+                      default="fifo",
+                      help="Order to launch ready actions in, first-in first-out (default) or longest remaining "
+                           "critical path first"
+                      )
+  parser.add_argument(
+                      "-bf", "--backfill",
+                      action="store_true",
+                      help="Reserve resources for the first blocked action, only letting others start before it "
+                           "if they are estimated to finish in time"
+                      )
+  parser.add_argument(
+                      "-e", "--engine",
+                      type=str,
+                      choices=[ "threads", "asyncio" ],
+                      default="threads",
+                      help="Launch each action on its own thread (default) or multiplex all actions on one "
+                           "asyncio event loop"
+                      )
+  parser.add_argument(
+                      "-fs", "--fork_server",
+                      action="store_true",
+                      help="Fork actions from a server process with sane and workflow modules already imported, "
+                           "reduces startup time of short actions"
+                      )
+  parser.add_argument(
+                      "-dx", "--direct_exec",
+                      action="store_true",
+                      help="Run command-only actions directly with their precomputed environment, "
+                           "skipping the python action launcher"
+                      )
+  parser.add_argument(
+                      "-ph", "--pipe_handoff",
+                      action="store_true",
+                      help="Hand off actions to the action launcher through its stdin instead of writing save files "
+                           "for every launch"
+                      )
+  parser.add_argument(
+                      "-rc", "--result_cache",
+                      action="store_true",
+                      help="Restore results of actions identical to a previous successful run instead of running "
+                           "them again"
+                      )
+  parser.add_argument(
+                      "-bc", "--bypass_cache",
+                      action="store_true",
+                      help="Run all actions even if --result_cache has their results, still recording the new results"
+                      )
+  parser.add_argument(
+                      "-ud", "--skip_up_to_date",
+                      action="store_true",
+                      help="Skip actions whose declared output files are newer than their input files and those "
+                           "of their dependencies"
+                      )
+  parser.add_argument(
+                      "-uh", "--up_to_date_hash",
+                      action="store_true",
+                      help="With --skip_up_to_date, also compare input file sizes and hashes against the last "
+                           "successful run"
+                      )
+  parser.add_argument(
+                      "-oc", "--output_capture",
+                      choices=[ "full", "tail", "file", "none" ],
+                      default=None,
+                      help="How much launch output of each action to keep in memory, overriding the actions' "
+                           "own setting. "
+                           "The full output is always in the action runlog"
+                      )
+  parser.add_argument(
+                      "-ff", "--fail_fast",
+                      nargs="?",
+                      default=None,
+                      const="",
+                      metavar="PATTERN",
+                      help="Stop the workflow once an action fails, cancelling anything running and skipping the rest. "
+                           "If a python regex PATTERN is given, only failures of matching action ids do"
+                      )
+  parser.add_argument(
+                      "-bs", "--batch_size",
+                      type=int,
+                      default=32,
+                      help="Most actions with \"batch\" set to run in a single action launcher process"
+                      )
+  parser.add_argument(
+                      "-mw", "--max_workers",
+                      type=int,
+                      default=None,
+                      help="Most actions to run at once, overrides the host setting which defaults to its cpus resource"
+                      )
+  parser.add_argument(
+                      "-cd", "--compact_dag",
+                      action="store_true",
+                      help="Use a compact integer-indexed action graph, reduces memory for very large workflows"
+                      )
   parser.add_argument(
                       "-ll", "--log_location",
                       type=str,
@@ -179,6 +289,24 @@ def main():
   ##############################################################################
   orchestrator = sane.Orchestrator()
   orchestrator.save_location = options.save_location
+  orchestrator.snapshot_interval = options.snapshot_interval
+  orchestrator.save_backend = options.save_backend
+  orchestrator.compact_dag = options.compact_dag
+  orchestrator.schedule = options.schedule
+  orchestrator.backfill = options.backfill
+  orchestrator.max_workers = options.max_workers
+  orchestrator.engine = options.engine
+  orchestrator.fork_server = options.fork_server
+  orchestrator.direct_exec = options.direct_exec
+  orchestrator.batch_size = options.batch_size
+  orchestrator.pipe_handoff = options.pipe_handoff
+  orchestrator.result_cache = options.result_cache
+  orchestrator.bypass_result_cache = options.bypass_cache
+  orchestrator.skip_up_to_date = options.skip_up_to_date
+  orchestrator.up_to_date_hash = options.up_to_date_hash
+  orchestrator.fail_fast = options.fail_fast is not None
+  orchestrator.fail_fast_pattern = options.fail_fast or None
+  orchestrator.output_capture = options.output_capture
   orchestrator.log_location = options.log_location
   orchestrator.working_directory = options.working_dir
 
@@ -292,8 +420,13 @@ def main():
     orchestrator.force_local = options.force_local
 
   # Load any previous statefulness
-  if options.new and os.path.exists( orchestrator.save_file ):
-    os.remove( orchestrator.save_file )
+  if options.new:
+    # Keep the previous runtimes to prioritize actions
+    orchestrator.load_runtimes()
+    save_file = orchestrator.save_file
+    for filename in ( save_file, save_file + "-wal", save_file + "-shm", orchestrator.journal_file ):
+      if os.path.exists( filename ):
+        os.remove( filename )
   orchestrator.load()
 
   orchestrator.setup()
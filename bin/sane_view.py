@@ -3,7 +3,6 @@ import argparse
 import os
 import sys
 
-import json
 import math
 
 
@@ -101,8 +100,15 @@ def plot_resource_usage( start_time, ax, resource, resource_log, arrow_deltas, s
 def plot_usage( workflow_save, arrow_deltas, stem_timeline ):
   import matplotlib.pyplot as plt
 
-  resource_logs = json.load( open( workflow_save, "r" ) )["resource_usage"]
-  resource_logs.pop( "null", None )
+  import sane
+
+  if sane.state_db.is_state_db( workflow_save ):
+    with sane.state_db.StateDB( workflow_save, readonly=True ) as db:
+      times = db.runs()
+      resource_logs = { t : db.resource_usage( t ) for t in times }
+  else:
+    resource_logs = sane.orchestrator.load_save_file( workflow_save )["resource_usage"]
+    resource_logs.pop( "null", None )
 
   times = list( resource_logs.keys() )
   print( f"index   time" )
@@ -150,19 +156,26 @@ def plot_usage( workflow_save, arrow_deltas, stem_timeline ):
   plt.show()
 
 
-def show_status( workflow_save ):
+def load_actions( workflow_save, last_run, field, only ):
   import sane
-  actions = json.load( open( workflow_save, "r" ) )["actions"]
-  longest_action = len( max( actions.keys(), key=len ) )
-  statuses = [ f"{node:<{longest_action}}: " + actions[node]["status"] for node in actions.keys() ]
-  sane.orchestrator.print_actions( statuses, max_line=150 )
+  if sane.state_db.is_state_db( workflow_save ):
+    with sane.state_db.StateDB( workflow_save, readonly=True ) as db:
+      return db.actions( last_run=last_run, **{ field : only } )
+
+  actions = sane.orchestrator.load_save_file( workflow_save )["actions"]
+  if only is not None:
+    actions = { node : results for node, results in actions.items() if results[field] == only }
+  return actions
 
 
-def show_state( workflow_save ):
+def show_field( workflow_save, last_run, field, only ):
   import sane
-  actions = json.load( open( workflow_save, "r" ) )["actions"]
+  actions = load_actions( workflow_save, last_run, field, only )
+  if len( actions ) == 0:
+    print( "No actions found" )
+    return
   longest_action = len( max( actions.keys(), key=len ) )
-  statuses = [ f"{node:<{longest_action}}: " + actions[node]["state"] for node in actions.keys() ]
+  statuses = [ f"{node:<{longest_action}}: " + actions[node][field] for node in actions.keys() ]
   sane.orchestrator.print_actions( statuses, max_line=150 )
 
 
@@ -177,15 +190,27 @@ def get_parser():
                       )
   base.add_argument(
                     "-f", "--filename",
-                    help="Use non-standard filename",
+                    help="Use non-standard filename, default is orchestrator.db if present otherwise orchestrator.json",
                     type=str,
-                    default="orchestrator.json"
+                    default=None
                     )
   parser = argparse.ArgumentParser()
   subparsers = parser.add_subparsers( required=True, dest="cmd" )
-  usage   = subparsers.add_parser( "usage",  help="View resource usage", parents=[base] )
+  usage   = subparsers.add_parser( "usage", help="View resource usage", parents=[base] )
   status  = subparsers.add_parser( "status", help="View action status", parents=[base] )
-  status  = subparsers.add_parser( "state",  help="View action state", parents=[base] )
+  state   = subparsers.add_parser( "state", help="View action state", parents=[base] )
+  for action_view in ( status, state ):
+    action_view.add_argument(
+                              "-lr", "--last_run",
+                              action="store_true",
+                              help="Only show actions from the last run (requires an SQLite workflow save)"
+                              )
+    action_view.add_argument(
+                              "-o", "--only",
+                              type=str,
+                              default=None,
+                              help=f"Only show actions with this {action_view.prog.split()[-1]}"
+                              )
   usage.add_argument(
                       "-a", "--arrows",
                       action="store_true",
@@ -208,13 +233,17 @@ def main():
 
   parser = get_parser()
   options = parser.parse_args()
+  if options.filename is None:
+    options.filename = "orchestrator.json"
+    if os.path.isfile( os.path.join( options.workflow_save, "orchestrator.db" ) ):
+      options.filename = "orchestrator.db"
   filename = os.path.join( options.workflow_save, options.filename )
   if options.cmd == "usage":
     plot_usage( filename, options.arrows, options.stems )
-  elif options.cmd == "status":
-    show_status( filename )
-  elif options.cmd == "state":
-    show_state( filename )
+  else:
+    if options.last_run and not sane.state_db.is_state_db( filename ):
+      parser.error( "--last_run requires an SQLite workflow save" )
+    show_field( filename, options.last_run, options.cmd, options.only )
 
 if __name__ == "__main__":
   main()
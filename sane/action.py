@@ -1,7 +1,16 @@
+import asyncio
+import collections
+import copy
+import hashlib
+import inspect
+import json
 import os
+import uuid
 import shutil
 import re
 import io
+import select
+import signal
 import subprocess
 import threading
 import datetime
@@ -13,6 +22,7 @@ import sane.logger as slogger
 import sane.save_state as state
 import sane.options as opts
 import sane.action_launcher as action_launcher
+import sane.fork_server as fork_server
 import sane.resources as res
 from sane.helpers import copydoc, recursive_update
 
@@ -115,6 +125,276 @@ def _dependency_met( dep_type, state, status, submit_ok ):
   return RequirementsState.UNMET
 
 
+# Most bytes of command output read at once
+_CHUNK_SIZE = 64 * 1024
+# Bytes of command output buffered before writing to a logfile
+_LOGFILE_BUFFER = 64 * 1024
+# Seconds a logfile may hold unwritten command output
+_FLUSH_INTERVAL = 1.0
+# Seconds between splitting buffered command output into lines to log
+_ECHO_INTERVAL = 0.1
+# Most lines of command output logged per echo if the logfile already keeps all of them
+_ECHO_LINES = 1000
+
+# Ways to keep the output of a launch, see Action.output_capture
+_CAPTURE_MODES = ( "full", "tail", "file", "none" )
+
+
+# Source of Action classes by class for cache_key(), reading it is slow
+_class_sources = {}
+
+
+def _class_source( cls ) -> str:
+  if cls not in _class_sources:
+    try:
+      _class_sources[cls] = inspect.getsource( cls )
+    except ( OSError, TypeError ):
+      # Defined somewhere without source, the name is the best we can do
+      _class_sources[cls] = f"{cls.__module__}.{cls.__qualname__}"
+  return _class_sources[cls]
+
+
+# Seconds between asking a timed out or stopped command to terminate and killing it
+_TIMEOUT_GRACE = 10.0
+
+
+class _GroupKiller:
+  # Terminates, then kills, the process group of a command still running after its timeout or once stopped,
+  # timed from a thread or on the event loop running the command if one is given
+  def __init__( self, pgid : int, timeout : float = None, grace : float = _TIMEOUT_GRACE, loop=None ):
+    self.pgid    = pgid
+    # Why the command was terminated, if it was
+    self.expired = False
+    self.stopped = False
+    self._grace  = grace
+    self._stop   = threading.Event()
+    self._done   = threading.Event()
+    self._loop   = loop
+    self._handle = None
+    self._signalled = False
+    if loop is None:
+      threading.Thread( target=self._watch, args=( timeout, ), daemon=True ).start()
+    elif timeout is not None:
+      self._handle = loop.call_later( timeout, self._terminate_later, True )
+
+  def _signal( self, sig ) -> bool:
+    try:
+      os.killpg( self.pgid, sig )
+      return True
+    except ( ProcessLookupError, PermissionError ):
+      # Already gone
+      return False
+
+  def _terminate( self, expired ) -> bool:
+    # Only the first reason counts
+    if self._done.is_set() or self._signalled:
+      return False
+    self._signalled = True
+    self.expired = expired
+    self.stopped = not expired
+    return self._signal( signal.SIGTERM )
+
+  def _watch( self, timeout ):
+    stopped = self._stop.wait( timeout )
+    if self._terminate( not stopped ) and not self._done.wait( self._grace ):
+      self._signal( signal.SIGKILL )
+
+  def _terminate_later( self, expired ):
+    if self._terminate( expired ):
+      self._handle = self._loop.call_later( self._grace, self._signal, signal.SIGKILL )
+
+  def stop( self ):
+    # Safe to call from any thread
+    if self._loop is None:
+      self._stop.set()
+    else:
+      try:
+        self._loop.call_soon_threadsafe( self._terminate_later, False )
+      except RuntimeError:
+        # The loop is closed so the command is long done
+        pass
+
+  def cancel( self ):
+    self._done.set()
+    self._stop.set()
+    if self._handle is not None:
+      self._handle.cancel()
+
+
+def _write_stdin( stdin, input : bytes ) -> None:
+  # Same handling as subprocess.Popen.communicate(), a command may exit without reading its stdin
+  try:
+    if input is not None:
+      stdin.write( input )
+    stdin.close()
+  except BrokenPipeError:
+    pass
+
+
+class _OutputTee:
+  """Duplicate chunks of subprocess output to a logfile, a capture buffer, and a log function per line
+
+  The logfile gets the output as is with bounded buffering, and is flushed once output has waited
+  :py:data:`_FLUSH_INTERVAL` seconds. Complete lines are only split out for the log function every
+  :py:data:`_ECHO_INTERVAL` seconds, and if the logfile already keeps everything only the last
+  :py:data:`_ECHO_LINES` lines of each echo are logged. If ``capture`` is an ``int`` rather than
+  a ``bool``, only about that many of the last bytes are captured.
+  """
+  def __init__( self, logfile, log, capture ):
+    self._logfile = None
+    self._logfile_name = logfile
+    if logfile is not None:
+      self._logfile = open( logfile, "wb", buffering=_LOGFILE_BUFFER )
+    # Keep a duplicate of the output as well in memory as a string, or only its tail
+    self._output = None
+    self._tail   = None
+    if isinstance( capture, bool ):
+      self._output = io.BytesIO() if capture else None
+    elif capture is not None:
+      self._tail = collections.deque()
+      self._tail_size    = 0
+      self._tail_maxsize = capture
+    self._log = log
+
+    # Output not echoed yet, and whether it holds a complete line
+    self._pending   = []
+    self._has_lines = False
+    self._unflushed = False
+    self._flush_at  = 0.0
+    self._echo_at   = 0.0
+
+  def write( self, chunk : bytes ):
+    now = time.monotonic()
+    # Always store in logfile if possible
+    if self._logfile is not None:
+      self._logfile.write( chunk )
+      if not self._unflushed:
+        self._unflushed = True
+        self._flush_at  = now + _FLUSH_INTERVAL
+
+    if self._output is not None:
+      self._output.write( chunk )
+    elif self._tail is not None:
+      self._tail.append( chunk )
+      self._tail_size += len( chunk )
+      while self._tail_size - len( self._tail[0] ) >= self._tail_maxsize:
+        self._tail_size -= len( self._tail.popleft() )
+
+    # Also duplicate output to stdout if requested
+    if self._log is not None:
+      self._pending.append( chunk )
+      self._has_lines = self._has_lines or b"\n" in chunk
+
+    self.flush( now )
+
+  def wait_time( self ) -> float:
+    """Seconds until buffered output is due to be written out, or ``None`` if there is none"""
+    due = []
+    if self._unflushed:
+      due.append( self._flush_at )
+    if self._has_lines:
+      due.append( self._echo_at )
+    if len( due ) == 0:
+      return None
+    return max( min( due ) - time.monotonic(), 0.0 )
+
+  def flush( self, now : float = None, force : bool = False ):
+    """Write out buffered output that is due, or all of it if ``force``"""
+    if now is None:
+      now = time.monotonic()
+    if self._unflushed and ( force or now >= self._flush_at ):
+      self._logfile.flush()
+      self._unflushed = False
+    if ( self._has_lines or force ) and len( self._pending ) > 0 and ( force or now >= self._echo_at ):
+      self._echo( force )
+      self._echo_at = now + _ECHO_INTERVAL
+
+  def _echo( self, final : bool ):
+    data = b"".join( self._pending )
+    self._pending.clear()
+    self._has_lines = False
+    if not final:
+      # Keep any partial line for later
+      end = data.rfind( b"\n" ) + 1
+      if end < len( data ):
+        self._pending.append( data[end:] )
+      data = data[:end]
+
+    lines = data.decode( 'utf-8', 'replace' )
+    if lines.endswith( "\n" ):
+      lines = lines[:-1]
+    lines = lines.split( "\n" )
+    if self._logfile is not None and len( lines ) > _ECHO_LINES:
+      self._log( f"[{len( lines ) - _ECHO_LINES} lines not shown, see {self._logfile_name}]" )
+      lines = lines[-_ECHO_LINES:]
+    for line in lines:
+      self._log( line )
+
+  def close( self ) -> str:
+    """Close the logfile and return the captured output, or ``None`` if not capturing"""
+    self.flush( force=True )
+    if self._logfile is not None:
+      self._logfile.close()
+    content = None
+    if self._output is not None:
+      content = self._output.getvalue().decode( 'utf-8' )
+      self._output.close()
+    elif self._tail is not None:
+      data = b"".join( self._tail )
+      if len( data ) > self._tail_maxsize:
+        data = data[-self._tail_maxsize:]
+        # Start at a full line if there is one
+        start = data.find( b"\n" ) + 1
+        if 0 < start < len( data ):
+          data = data[start:]
+      content = data.decode( 'utf-8', 'replace' )
+    return content
+
+
+class OutputReference:
+  """Output of a command kept in a file instead of in memory, only read when asked for
+
+  Given as the ``content`` of :py:meth:`Action.post_launch` and :py:meth:`Host.post_launch() <sane.Host.post_launch>`
+  when the :py:attr:`Action.output_capture` is ``"file"``. Converting it to ``str`` reads all of the output.
+  """
+  def __init__( self, path : str ):
+    #: Absolute path to the file with the output, usually the :py:attr:`Action.runlog`
+    self.path = path
+
+  def read( self ) -> str:
+    """All of the output"""
+    with open( self.path, "r", errors="replace" ) as f:
+      return f.read()
+
+  def tail( self, size : int ) -> str:
+    """At most the last ``size`` bytes of output"""
+    with open( self.path, "rb" ) as f:
+      end = f.seek( 0, os.SEEK_END )
+      f.seek( max( end - size, 0 ) )
+      return f.read().decode( 'utf-8', 'replace' )
+
+  def __str__( self ) -> str:
+    return self.read()
+
+  def __repr__( self ) -> str:
+    return f"OutputReference( {self.path!r} )"
+
+
+def _read_output( fd : int, output : _OutputTee ):
+  # Read output in chunks as it comes, writing out what is buffered whenever the command is quiet long enough
+  poller = select.poll()
+  poller.register( fd, select.POLLIN )
+  while True:
+    wait = output.wait_time()
+    if wait is not None and len( poller.poll( wait * 1000 ) ) == 0:
+      output.flush()
+      continue
+    chunk = os.read( fd, _CHUNK_SIZE )
+    if chunk == b"":
+      return
+    output.write( chunk )
+
+
 class Action( state.SaveState, res.ResourceRequestor ):
   """A single task
 
@@ -140,6 +420,36 @@ class Action( state.SaveState, res.ResourceRequestor ):
 
     #: Stub :py:meth:`launch()` to skip execution of :py:meth:`run()`
     self.dry_run = False
+    #: Weight used in place of the historical runtime when dispatching by :py:meth:`Orchestrator.critical_path`
+    self.priority = None
+    #: Allow running in the same :ref:`action_launcher.py` process as other ready actions using the same
+    #: :py:class:`~sane.Environment`, see :py:func:`launch_batch`. Output, state, and timing are still kept per action
+    self.batch = False
+    #: Files this action reads, relative to its :py:attr:`working_directory` unless absolute and
+    #: :py:meth:`dereferenced <dereference>` when used,
+    #: see :py:attr:`Orchestrator.skip_up_to_date <sane.Orchestrator.skip_up_to_date>`
+    self.input_files = []
+    #: Files this action produces, in the same form as :py:attr:`input_files`
+    self.output_files = []
+    #: Seconds this action may run when launched locally before it is killed along with anything it started,
+    #: see :py:attr:`local_timeout`
+    self.timeout = None
+    #: Most times the :py:class:`~sane.Orchestrator` launches this action in one run, failed launches are
+    #: attempted again while :py:meth:`should_retry` allows it
+    self.max_attempts = 1
+    #: Seconds to wait before the first retry, doubled for each retry after
+    self.retry_backoff = 1.0
+    #: Exit codes of failed launches to retry, see :py:meth:`should_retry`
+    self.retry_exit_codes = []
+    #: Python re patterns, failed launches with output matching any of them are retried, see :py:meth:`should_retry`
+    self.retry_output = []
+    #: Output of each :py:meth:`launch` kept for :py:meth:`post_launch`, either ``"full"`` (all of it in memory),
+    #: ``"tail"`` (only the last :py:attr:`output_capture_size` bytes), ``"file"`` (an :py:class:`OutputReference`
+    #: to the :py:attr:`runlog`), or ``"none"``. Launches through a host ``launch_wrapper`` use ``"file"`` instead
+    #: of ``"none"``, as the host needs the output of the submission
+    self.output_capture = "full"
+    #: Bytes of output kept when :py:attr:`output_capture` is ``"tail"``
+    self.output_capture_size = 64 * 1024
     self.wrap_stdout = True
 
     self.working_directory = "./"
@@ -165,22 +475,41 @@ class Action( state.SaveState, res.ResourceRequestor ):
     # Use the run lock for mutually exclusive run logic (eg. clean logging)
     self._run_lock = None
     self.__wake__    = None
+    # Address of the fork server to launch through, if the orchestrator started one
+    self.__fork_server__ = None
+    # Precomputed environment to run the command directly with, if the orchestrator allows it
+    self.__direct_env__  = None
+    # If the last launch was killed for running longer than its local_timeout
+    self.__timed_out__   = False
+    # If this action was stopped with cancel(), kept until it is set pending again
+    self.__cancelled__   = False
+    # Earlier failed attempts of the current run, kept until it is set pending again
+    self.__retries__     = []
+    # Run local launches in their own process group so cancel() can stop them, set by the orchestrator
+    self.__cancellable__ = False
+    # Stops the command of the local launch currently running
+    self.__killer__      = None
+    # Saved host to hand off with this action through the launcher stdin instead of save files
+    self.__handoff__     = None
 
     super().__init__( filename=f"action_{id}", logname=id, base=Action )
 
-  def save( self ) -> None:
+  def _pickle( self ) -> bytes:
     # Quickly remove sync objects then restore
-    tmp_run_lock = self._run_lock
-    tmp_wake     = self.__wake__
-    tmp_logger   = self.logger
-    self._run_lock = None
-    self.__wake__  = None
-    self.logger    = None
-    super().save()
+    transient = {
+                  attr : getattr( self, attr )
+                  for attr in (
+                                "_run_lock", "__wake__", "logger", "__fork_server__", "__direct_env__", "__handoff__",
+                                "__cancellable__", "__killer__"
+                                )
+                  }
+    for attr in transient:
+      setattr( self, attr, None )
+    data = super()._pickle()
     # Now restore
-    self._run_lock = tmp_run_lock
-    self.__wake__  = tmp_wake
-    self.logger    = tmp_logger
+    for attr, value in transient.items():
+      setattr( self, attr, value )
+    return data
 
   def __orch_wake__( self ) -> None:
     """Wake up the :py:class:`Orchestrator` from another thread.
@@ -230,6 +559,8 @@ class Action( state.SaveState, res.ResourceRequestor ):
     """
     self._state  = ActionState.PENDING
     self._status = ActionStatus.NONE
+    self.__cancelled__ = False
+    self.__retries__   = []
 
   def set_state_error( self ) -> None:
     """Internal, only to report SANE errors"""
@@ -274,6 +605,10 @@ class Action( state.SaveState, res.ResourceRequestor ):
           "outputs"   : :py:attr:`outputs`, (:py:meth:`dereferenced <dereference>`)
           "timestamp" : :py:attr:`__timestamp__`, (if available)
           "time"      : :py:attr:`__time__`, (if available)
+          "timed_out" : killed for exceeding :py:attr:`local_timeout`, (if available)
+          "cancelled" : stopped by :py:meth:`cancel`, (if available)
+          "retries"   : ``list`` of earlier failed attempts that were retried, each with their
+                        "timestamp", "time", "retval", and "runlog", (if available)
         }
 
     When set, the provided ``dict`` should match the above format
@@ -289,6 +624,10 @@ class Action( state.SaveState, res.ResourceRequestor ):
     if self.state == ActionState.FINISHED:
       results["timestamp"] = self.__timestamp__
       results["time"]      = self.__time__
+      results["timed_out"] = self.__timed_out__
+      results["retries"]   = self.__retries__
+    if self.state in ( ActionState.FINISHED, ActionState.SKIPPED ):
+      results["cancelled"] = self.__cancelled__
     return results
 
   @results.setter
@@ -299,12 +638,32 @@ class Action( state.SaveState, res.ResourceRequestor ):
     if self.state == ActionState.FINISHED:
       self.__timestamp__ = results["timestamp"]
       self.__time__      = results["time"]
+      self.__timed_out__ = results.get( "timed_out", False )
+      self.__retries__   = results.get( "retries", [] )
+    self.__cancelled__ = results.get( "cancelled", False )
 
   @property
   def host_info( self ) -> dict:
     """Info ``dict`` provided from the :py:attr:`~Orchestrator.current_host` using the :py:class:`Host.info`"""
     return self.__host_info__
 
+  @property
+  def local_timeout( self ) -> float:
+    """Seconds a local :py:meth:`launch` may run before it is killed, or ``None`` for no limit
+
+    This is :py:attr:`timeout` if set, otherwise the ``"timelimit"`` resource requested
+    on the host in :py:attr:`host_info`. Launches through a host ``launch_wrapper`` are
+    left to the host to limit.
+    """
+    if self.timeout is not None:
+      return float( self.timeout )
+    timelimit = self.resources( self.host_info.get( "name" ) ).get( "timelimit" )
+    if timelimit is not None:
+      timelimit = res.timelimit_to_timedelta( timelimit )
+    if timelimit is not None:
+      return timelimit.total_seconds()
+    return None
+
   @property
   def info( self ) -> dict:
     """:py:class:`Action` info ``dict`` (:py:meth:`dereferenced <dereference>`) provided to direct
@@ -344,7 +703,13 @@ class Action( state.SaveState, res.ResourceRequestor ):
     self.default_log_level = slogger.ACT_INFO
     # Create our own logger instance
     self.logger = slogger.logging.getLogger( __name__ ).getChild( self.id )
-    file_handler = slogger.logging.FileHandler( self.logfile, mode="w" )
+    # Loggers are shared by id, replace the logfile of any previous action with this id
+    for handler in list( self.logger.handlers ):
+      if isinstance( handler, slogger.PooledFileHandler ):
+        self.logger.removeHandler( handler )
+        handler.close()
+    # The logfile is only created once written to, and only kept open while used
+    file_handler = slogger.PooledFileHandler( self.logfile, slogger.log_file_pool )
     file_handler.setFormatter( slogger.log_formatter )
     self.logger.addHandler( file_handler )
     self.logger.setLevel( slogger.STDOUT )
@@ -480,8 +845,8 @@ class Action( state.SaveState, res.ResourceRequestor ):
     """
     return True
 
-  def _find_cmd( self, cmd, working_dir ):
-    inpath = shutil.which( cmd ) is not None
+  def _find_cmd( self, cmd, working_dir, path=None ):
+    inpath = shutil.which( cmd, path=path ) is not None
     found_cmd = cmd
 
     if not inpath and not os.path.isabs( cmd ):
@@ -520,6 +885,15 @@ class Action( state.SaveState, res.ResourceRequestor ):
       raise NotADirectoryError( f"Provided path does not exist as directory : '{resolved_path}" )
     return resolved_path
 
+  def resolve_files( self, files : List[str], working_directory : str ) -> List[str]:
+    """Absolute paths of :py:meth:`dereferenced <dereference>` ``files``, such as :py:attr:`input_files`
+
+    :param working_directory: base directory to evaluate :py:attr:`working_directory` from, relative
+                              ``files`` are then evaluated from that resolved directory
+    """
+    action_dir = self.resolve_path( self.working_directory, working_directory )
+    return [ self.resolve_path( str( f ), action_dir ) for f in self.dereference( list( files ), log=False ) ]
+
   def file_exists_in_path( self, input_path : str, file : str, allow_dry_run : bool = True ):
     """Check if a specified file exists within a provided path
 
@@ -534,6 +908,35 @@ class Action( state.SaveState, res.ResourceRequestor ):
     else:
       return True
 
+  def _command_args( self, cmd : str, arguments : list, log_level ) -> list:
+    args = [cmd]
+
+    if arguments is not None:
+      args.extend( arguments )
+
+    args = [ str( arg ) for arg in args ]
+
+    command = " ".join( [ arg if " " not in arg else "\"{0}\"".format( arg ) for arg in args ] )
+    self.log( "Running command:", level=log_level )
+    self.log( "  {0}".format( command ), level=log_level )
+    return args
+
+  def _output_tee( self, logfile : str, verbose : bool, capture : bool, log_level ) -> "_OutputTee":
+    if logfile is not None:
+      self.log( "Command output will be captured to logfile {0}".format( logfile ), level=log_level )
+    if verbose:
+      self.log( "Command output will be printed to this terminal" )
+
+    log = None
+    if verbose and self.__exec_raw__:
+      def log( msg ):
+        slogger.emit( self.logger.getChild( "raw" ), slogger.STDOUT, msg )
+    elif verbose:
+      # Use a raw logger to ensure this also gets captured by the logging handlers
+      def log( msg ):
+        self.log( msg, level=slogger.STDOUT )
+    return _OutputTee( logfile, log, capture )
+
   def execute_subprocess(
                           self,
                           cmd : str,
@@ -543,15 +946,21 @@ class Action( state.SaveState, res.ResourceRequestor ):
                           dry_run=False,
                           capture=False,
                           shell=False,
-                          log_level=slogger.ACT_INFO
+                          log_level=slogger.ACT_INFO,
+                          env : dict = None,
+                          cwd : str = None,
+                          input : bytes = None,
+                          timeout : float = None
                           ) -> Tuple[int, str]:
     """Execution wrapper for running a command using :py:class:`subprocess.Popen`
 
     Notably, this wrapper handles:
 
     * command and argument aggregation
-    * internal, logfile, and verbose logging with flushing in realtime
-    * wrapping of stdout using internal log levels
+    * internal, logfile, and verbose logging, reading output in chunks with the logfile
+      flushed and verbose lines logged within a second of the command writing them
+    * wrapping of stdout using internal log levels, only logging the latest lines of
+      very chatty commands if everything is kept in a ``logfile``
     * returning return value along with captured stdout (if ``capture`` enabled)
     
     Prefer using this function if stdout log wrapping is desired. If none of the
@@ -563,111 +972,416 @@ class Action( state.SaveState, res.ResourceRequestor ):
     :param logfile:   optional logfile to write command output to
     :param verbose:   optional output the command stdout and stderr to terminal
     :param dry_run:   optional do not call :py:class:`subprocess.Popen`, i.e. stub this call
-    :param capture:   optional capture stderr/stdout to ``str`` return
+    :param capture:   optional capture stderr/stdout to ``str`` return, or if an ``int`` only about that
+                      many of the last bytes starting at a full line
     :param shell:     optional treat execution as shell command (see :py:class:`subprocess.Popen` for more detail)
+    :param env:       optional environment variables of the command instead of inheriting them
+    :param cwd:       optional directory to run the command in instead of the current directory
+    :param input:     optional data to send to the command stdin, written in full before any output
+                      is read so the command should read it first
+    :param timeout:   optional seconds after which the command and every process it started are
+                      terminated, then killed if still running after a grace period. The command runs
+                      in its own session and process group to do so, and the return value is then
+                      that of the terminated command
     :return: ``tuple`` of execution return value and any stderr/stdout capture
     :rtype: tuple[int, str]
     """
-    args = [cmd]
-
-    if arguments is not None:
-      args.extend( arguments )
+    args = self._command_args( cmd, arguments, log_level )
 
-    args = [ str( arg ) for arg in args ]
-
-    command = " ".join( [ arg if " " not in arg else "\"{0}\"".format( arg ) for arg in args ] )
-    self._acquire()
-    self.log( "Running command:", level=log_level )
-    self.log( "  {0}".format( command ), level=log_level )
-    self._release()
-
-    retval  = -1
-    content = None
+    if dry_run:
+      self.log( "Doing dry-run, no ouptut", level=log_level )
+      return 0, "12345"
 
-    if not dry_run:
-      ############################################################################
-      ##
-      ## Call subprocess
-      ##
-      # https://stackoverflow.com/a/18422264
-      if logfile is not None:
-        self.log( "Command output will be captured to logfile {0}".format( logfile ), level=log_level )
-      if verbose:
-        self.log( "Command output will be printed to this terminal" )
-
-      # Keep a duplicate of the output as well in memory as a string
-      output = None
-      if capture:
-        output = io.BytesIO()
+    # https://stackoverflow.com/a/18422264
+    output = self._output_tee( logfile, verbose, capture, log_level )
 
-      if shell:
-        args = " ".join( args )
+    if shell:
+      args = " ".join( args )
 
+    try:
       proc = subprocess.Popen(
                               args,
                               stdin=subprocess.PIPE,
                               stdout=subprocess.PIPE,
                               stderr=subprocess.STDOUT,
-                              shell=shell
+                              shell=shell,
+                              env=env,
+                              cwd=cwd,
+                              start_new_session=self._own_group( timeout )
                               )
+      killer = self._watch_group( proc.pid, timeout )
+      try:
+        _write_stdin( proc.stdin, input )
 
-      logfileOutput = None
-      if logfile is not None:
-        logfileOutput = open( logfile, "w+", buffering=1 )
-
-      # Temporarily swap in a very crude logger
-      log = lambda *args: self.log( *args, level=slogger.STDOUT )
-      if self.__exec_raw__:
-        log = lambda msg: self.logger.getChild( "raw" ).log( slogger.STDOUT, msg )
-
-      for c in iter( lambda: proc.stdout.readline(), b"" ):
-        # Always store in logfile if possible
-        if logfileOutput is not None:
-          logfileOutput.write( c.decode( 'utf-8', 'replace' ) )
-          logfileOutput.flush()
-
-        if capture:
-          output.write( c )
-
-        # Also duplicate output to stdout if requested
-        if verbose:
-          # Use a raw logger to ensure this also gets captured by the logging handlers
-          log( c.decode( 'utf-8', 'replace' ).rstrip( "\n" ) )
-          # print( c.decode( 'utf-8', 'replace' ), flush=True, end="" )
-          # sys.stdout.buffer.write(c)
-          # sys.stdout.flush()
-
-      # We don't mind doing this as the process should block us until we are ready to continue
-      dump, err    = proc.communicate()
-      retval       = proc.returncode
-
-      if logfile is not None:
-        logfileOutput.close()
-      ##
-      ##
-      ##
-      ############################################################################
-    else:
+        _read_output( proc.stdout.fileno(), output )
+        proc.stdout.close()
+
+        # We don't mind doing this as the process should block us until we are ready to continue
+        retval       = proc.wait()
+      finally:
+        self._unwatch_group( killer )
+    finally:
+      content = output.close()
+
+    self._check_killed( killer, timeout )
+    return retval, content
+
+  async def execute_subprocess_async(
+                                      self,
+                                      cmd : str,
+                                      arguments : list = None,
+                                      logfile : str = None,
+                                      verbose=False,
+                                      dry_run=False,
+                                      capture=False,
+                                      shell=False,
+                                      log_level=slogger.ACT_INFO,
+                                      env : dict = None,
+                                      cwd : str = None,
+                                      input : bytes = None,
+                                      timeout : float = None
+                                      ) -> Tuple[int, str]:
+    """Coroutine equivalent of :py:meth:`execute_subprocess` using :external:py:mod:`asyncio` subprocesses
+
+    Output is read without blocking the event loop, so many commands may run at
+    once on a single thread. All parameters and the return value are the same as
+    :py:meth:`execute_subprocess`, and ``timeout`` is timed on the event loop.
+    If cancelled, the command is killed.
+    """
+    args = self._command_args( cmd, arguments, log_level )
+
+    if dry_run:
       self.log( "Doing dry-run, no ouptut", level=log_level )
-      retval = 0
-      output = "12345"
-
-    # self.log( "\n" )
-    # print( "\n", flush=True, end="" )
-
-    if not dry_run:
-      if capture:
-        if False:  # TODO Not sure which conditional is supposed to lead here
-          output.seek(0)
-          content = output.read()
-        else:
-          content = output.getvalue().decode( 'utf-8' )
-        output.close()
-    else:
-      content = output
+      return 0, "12345"
 
+    output = self._output_tee( logfile, verbose, capture, log_level )
+
+    try:
+      pipes = {
+                "stdin" : subprocess.PIPE, "stdout" : subprocess.PIPE, "stderr" : subprocess.STDOUT,
+                "env" : env, "cwd" : cwd, "start_new_session" : self._own_group( timeout )
+                }
+      if shell:
+        proc = await asyncio.create_subprocess_shell( " ".join( args ), **pipes )
+      else:
+        proc = await asyncio.create_subprocess_exec( *args, **pipes )
+
+      killer = self._watch_group( proc.pid, timeout, loop=asyncio.get_event_loop() )
+      try:
+        if input is not None:
+          proc.stdin.write( input )
+          try:
+            await proc.stdin.drain()
+          except ( BrokenPipeError, ConnectionResetError ):
+            pass
+        proc.stdin.close()
+        while True:
+          try:
+            chunk = await asyncio.wait_for( proc.stdout.read( _CHUNK_SIZE ), output.wait_time() )
+          except asyncio.TimeoutError:
+            output.flush()
+            continue
+          if chunk == b"":
+            break
+          output.write( chunk )
+        retval = await proc.wait()
+      except asyncio.CancelledError:
+        proc.kill()
+        raise
+      finally:
+        self._unwatch_group( killer )
+    finally:
+      content = output.close()
+
+    self._check_killed( killer, timeout )
     return retval, content
 
+  def _execute_forked(
+                        self,
+                        cmd : str,
+                        arguments : list,
+                        logfile : str = None,
+                        verbose=False,
+                        capture=False,
+                        log_level=slogger.ACT_INFO,
+                        input : bytes = None,
+                        timeout : float = None
+                        ) -> Tuple[int, str]:
+    # Same as execute_subprocess() of the action launcher, but forked from the fork server
+    args = self._command_args( cmd, arguments, log_level )
+    self.log( f"Forking command from fork server at {self.__fork_server__}", level=log_level )
+
+    output = self._output_tee( logfile, verbose, capture, log_level )
+    try:
+      # The launcher arguments are always last, after any interpreter
+      proc = fork_server.ForkedProcess(
+                                        self.__fork_server__,
+                                        args[-2:],
+                                        input=input,
+                                        new_session=self._own_group( timeout )
+                                        )
+      killer = self._watch_group( proc.pid, timeout )
+      try:
+        _read_output( proc.stdout.fileno(), output )
+        retval = proc.wait()
+      finally:
+        self._unwatch_group( killer )
+    finally:
+      content = output.close()
+
+    self._check_killed( killer, timeout )
+    return retval, content
+
+  def _own_group( self, timeout : float ) -> bool:
+    # Commands that may have to be killed get their own session and process group
+    # Transient, so None once loaded by the launcher
+    return timeout is not None or bool( self.__cancellable__ )
+
+  def _watch_group( self, pgid : int, timeout : float, loop=None ) -> _GroupKiller:
+    if not self._own_group( timeout ):
+      return None
+    killer = _GroupKiller( pgid, timeout, loop=loop )
+    self.__killer__ = killer
+    # Cancelled before the command started
+    if self.__cancelled__:
+      killer.stop()
+    return killer
+
+  def _unwatch_group( self, killer : _GroupKiller ) -> None:
+    if killer is not None:
+      killer.cancel()
+      self.__killer__ = None
+
+  def _check_killed( self, killer : _GroupKiller, timeout : float ) -> None:
+    if killer is not None and killer.expired:
+      self.__timed_out__ = True
+      self.log( f"Command timed out after {timeout:g} seconds and was killed", level=40 )
+    elif killer is not None and killer.stopped:
+      self.log( "Command was cancelled and killed", level=40 )
+
+  def should_retry( self, retval : int, content : str ) -> bool:
+    """Whether to attempt a failed :py:meth:`launch` again, as long as fewer than :py:attr:`max_attempts` were made
+
+    By default any failure is retried, unless :py:attr:`retry_exit_codes` or :py:attr:`retry_output` are set.
+    Then only failures with one of those exit codes or output matching one of those patterns are.
+    Launches that timed out are treated the same as any other failure.
+
+    :param retval:  return value of the failed :py:meth:`launch`
+    :param content: output of the failed :py:meth:`launch` as kept by :py:attr:`output_capture`
+    :return: ``True`` to retry
+    """
+    if len( self.retry_exit_codes ) == 0 and len( self.retry_output ) == 0:
+      return True
+    if retval in self.retry_exit_codes:
+      return True
+    if content is None:
+      return False
+    content = str( content )
+    return any( re.search( pattern, content, re.MULTILINE ) is not None for pattern in self.retry_output )
+
+  def _prepare_retry( self, retval : int ) -> None:
+    # Keep the failed attempt around and queue this action again
+    attempt = len( self.__retries__ ) + 1
+    runlog = self.runlog
+    if runlog is not None and os.path.isfile( runlog ):
+      attempt_log = os.path.splitext( runlog )[0] + f".attempt{attempt}.runlog"
+      os.replace( runlog, attempt_log )
+      runlog = attempt_log
+    attempt_info = { "timestamp" : self.__timestamp__, "time" : self.__time__, "retval" : retval, "runlog" : runlog }
+    self.__retries__.append( attempt_info )
+    self._state  = ActionState.PENDING
+    self._status = ActionStatus.NONE
+    self.__timed_out__ = False
+
+  def cancel( self ) -> None:
+    """Stop this :py:class:`Action` as soon as possible, recording it as cancelled in its :py:attr:`results`
+
+    If a local :py:meth:`launch` is running, its command and everything it started are terminated,
+    then killed if still running after a grace period. This is only possible when the
+    :py:class:`~sane.Orchestrator` launched it to be cancellable, see
+    :py:attr:`Orchestrator.fail_fast <sane.Orchestrator.fail_fast>`.
+    Safe to call from any thread.
+    """
+    self.__cancelled__ = True
+    killer = self.__killer__
+    if killer is not None:
+      killer.stop()
+
+  def cache_key( self, host : str, environment, dependency_keys : Dict[str, str] ) -> str:
+    """Content hash of everything that determines what this :py:class:`Action` does when launched
+
+    Used by the :py:attr:`Orchestrator.result_cache <sane.Orchestrator.result_cache>` to find
+    previous successful runs of identical work. The default implementation hashes:
+
+    * the :py:meth:`dereferenced <dereference>` :py:attr:`config` and the :py:attr:`working_directory`
+    * the :py:attr:`Environment.definition <sane.Environment.definition>` of ``environment``
+    * the :py:meth:`resources` requested on ``host``
+    * ``dependency_keys``, the cache key and :py:attr:`status` of each of the :py:attr:`dependencies`
+    * the source of this class and any base classes deriving from :py:class:`Action`
+
+    Override this to include anything else the action reads, such as input files.
+
+    :param host:            name of the :py:attr:`~sane.Orchestrator.current_host`
+    :param environment:     :py:class:`~sane.Environment` the action will use
+    :param dependency_keys: ``dict`` of :py:attr:`id` to ``[ cache key, status ]`` of each dependency
+    :return: hex digest of the hash
+    """
+    classes = [ cls for cls in type( self ).__mro__ if issubclass( cls, Action ) and cls is not Action ]
+    sources = [ _class_source( cls ) for cls in classes ]
+    content = {
+                "type"              : f"{type( self ).__module__}.{type( self ).__qualname__}",
+                "sources"           : sources,
+                "config"            : self.dereference( copy.deepcopy( self.config ), log=False ),
+                "working_directory" : self.working_directory,
+                "environment"       : environment.definition if environment is not None else None,
+                "resources"         : self.resources( host ),
+                "dependencies"      : dependency_keys
+                }
+    return hashlib.sha256( json.dumps( content, sort_keys=True, default=str ).encode() ).hexdigest()
+
+  def direct_exec_compatible( self ) -> bool:
+    """Check if launching this :py:class:`Action` only runs ``config["command"]``
+
+    This is the case when :py:meth:`run()`, :py:meth:`pre_run()`, :py:meth:`post_run()`, and
+    :py:meth:`execute_subprocess()` are not overridden, a ``"command"`` is set, and the default
+    :ref:`action_launcher.py` is used. Such an :py:class:`Action` may be run without
+    :ref:`action_launcher.py` if its :py:class:`~sane.Environment` can be precomputed,
+    see :py:attr:`Orchestrator.direct_exec <sane.Orchestrator.direct_exec>`.
+    """
+    for method in ( "run", "pre_run", "post_run", "execute_subprocess" ):
+      if getattr( type( self ), method ) is not getattr( Action, method ):
+        return False
+    return "command" in self.config and self._launch_cmd == action_launcher.__file__
+
+  def _direct_command( self, action_dir : str ) -> Tuple[str, list]:
+    # Same as the default run(), without modifying the config
+    config = self.dereference( copy.deepcopy( self.config ) )
+    command = self._find_cmd( config["command"], action_dir, path=self.__direct_env__.get( "PATH", os.defpath ) )
+    return command, config.get( "arguments" )
+
+  def _launch_setup( self, working_directory : str, launch_wrapper : Tuple[str, list] ) -> Tuple[str, str, list, bytes]:
+    self.__timestamp__ = datetime.datetime.now().replace( microsecond=0 ).isoformat()
+    self.label_length = self.max_label_length
+    thread_name = threading.current_thread().name
+    logname     = self.id
+    if thread_name is not None:
+      logname = "{0:<10} [{1}".format( f"{thread_name}]", self.id )
+    self.logname = logname
+
+    self.push_logscope( "launch" )
+    self.log( f"Action logfile captured at {self.logfile}", level=slogger.MAIN_LOG )
+
+    self._acquire()
+    ok = self.pre_launch()
+    self._release()
+    if ok is not None and not ok:
+      raise AssertionError( "pre_launch() returned False" )
+
+    # Set current state of this instance
+    self._state = ActionState.RUNNING
+    self._status = ActionStatus.NONE
+    self.__timed_out__ = False
+    # Let the orchestrator record that this started
+    self.__orch_wake__()
+
+    # Immediately save the current state of this action, unless it can be handed off
+    # through the launcher stdin, as anything running under a wrapper may need the files
+    handoff = self.__handoff__ is not None and launch_wrapper is None
+    if handoff:
+      self.log( "Handing off action information for launch through stdin..." )
+    else:
+      self.log( "Saving action information for launch..." )
+    self.label_length = slogger.DEFAULT_LABEL_LENGTH
+    self.logname = self.id
+    stdin = None
+    if handoff:
+      stdin = self.dumps() + self.__handoff__
+    else:
+      self.save()
+    self.label_length = self.max_label_length
+    self.logname = logname
+
+    # Self-submission of execute, but allowing more complex handling by re-entering into this script
+    action_dir = self.resolve_path( self.working_directory, working_directory )
+
+    self.log( f"Using working directory : '{action_dir}'" )
+
+    cmd = self._find_cmd( self._launch_cmd, action_dir )
+    args = [ action_dir, self.save_file if stdin is None else "-" ]
+    # python wheel build strips executable attribute and there's no recourse that
+    # keeps it in the package directory, so launch it with python3
+    if os.path.splitext( cmd )[1] == ".py" and not os.access( action_launcher.__file__, os.X_OK ):
+      args.insert( 0, cmd )
+      cmd = "python3"
+
+    if launch_wrapper is not None:
+      args.insert( 0, cmd )
+      cmd = self._find_cmd( launch_wrapper[0], action_dir )
+      args[:0] = launch_wrapper[1]
+
+    if self.logfile is None:
+      self.log( "Action will not be saved to logfile", level=30 )
+    return action_dir, cmd, args, stdin
+
+  def _launch_capture( self ) -> Union[bool, int]:
+    # What execute_subprocess() should capture for the output_capture of this action
+    if self.output_capture not in _CAPTURE_MODES:
+      modes = ", ".join( _CAPTURE_MODES )
+      raise ValueError( f"Unknown output_capture '{self.output_capture}', must be one of {modes}" )
+    if self.output_capture == "full":
+      return True
+    if self.output_capture == "tail":
+      return int( self.output_capture_size )
+    return False
+
+  def _launch_content( self, content : str, launch_wrapper : Tuple[str, list] ) -> Union[str, "OutputReference"]:
+    # What post_launch() gets as the output for the output_capture of this action
+    if self.dry_run or self.runlog is None:
+      return content
+    if self.output_capture == "file" or ( self.output_capture == "none" and launch_wrapper is not None ):
+      return OutputReference( self.runlog )
+    return content
+
+  def _launch_finish(
+                      self,
+                      retval : int,
+                      content : str,
+                      launch_wrapper : Tuple[str, list],
+                      start_time : float
+                      ) -> None:
+    self._state = ActionState.FINISHED
+    if retval != 0 or self.__timed_out__:
+      self._status = ActionStatus.FAILURE
+    else:
+      if launch_wrapper is None:
+        self._status = ActionStatus.SUCCESS
+      else:
+        # No idea what the wrapper might do, this is our best guess
+        self._status = ActionStatus.SUBMITTED
+
+    self._acquire()
+    ok = self.post_launch( retval, content )
+    self._release()
+    if ok is not None and not ok:
+      raise AssertionError( "post_launch() returned False" )
+
+    # notify we have finished
+    self.logname = self.id
+    self.pop_logscope()
+    self.__orch_wake__()
+    self.__time__ = "{:.6f}".format( time.perf_counter() - start_time )
+
+  def _launch_failed( self, e : Exception, start_time : float ) -> None:
+    # We failed :( still notify the orchestrator
+    self.set_state_error()
+    self._release()
+    self.log( f"Exception caught, cleaning up : {e}", level=40 )
+    self.logname = self.id
+    self.label_length = slogger.DEFAULT_LABEL_LENGTH
+    self.pop_logscope()
+    self.__orch_wake__()
+    self.__time__ = "{:.6f}".format( time.perf_counter() - start_time )
+
   def launch( self, working_directory : str, launch_wrapper : Tuple[str, list] = None ) -> Tuple[int, str]:
     """Main entry point for executing an :py:class:`Action` within a workflow
 
@@ -682,9 +1396,16 @@ class Action( state.SaveState, res.ResourceRequestor ):
     The order of operations, as they concern the user, are:
 
       #. :py:meth:`pre_launch()` (shared :py:class:`Action` mutex locked around this call)
-      #. :py:meth:`save()`
+      #. :py:meth:`save()`, or hand off the action and host through the :ref:`action_launcher.py` stdin
+         when :py:attr:`Orchestrator.pipe_handoff <sane.Orchestrator.pipe_handoff>` is set and there is
+         no ``launch_wrapper``
       #. resolve internal launch command (:ref:`action_launcher.py`) and ``launch_wrapper``
-      #. :py:meth:`execute_subprocess()` of resolved command, capturing to :py:attr:`runlog` using :py:attr:`dry_run` if set
+      #. :py:meth:`execute_subprocess()` of resolved command, capturing to :py:attr:`runlog` using
+         :py:attr:`dry_run` if set, or fork the launcher from the
+         :py:attr:`Orchestrator.fork_server <sane.Orchestrator.fork_server>` if one is running
+         and there is no ``launch_wrapper``, or run ``config["command"]`` directly when
+         :py:attr:`Orchestrator.direct_exec <sane.Orchestrator.direct_exec>` applies, killing it after
+         :py:attr:`local_timeout` if there is no ``launch_wrapper``
       #. final :py:attr:`state` and :py:attr:`status` recorded
       #. :py:meth:`post_launch()` called with output of (4) (shared :py:class:`Action` mutex locked around this call)
       #. :py:meth:`__orch_wake__` the :py:class:`Orchestrator`
@@ -712,104 +1433,100 @@ class Action( state.SaveState, res.ResourceRequestor ):
              (or ``launch_wrapper`` output if provided)
     :rtype: tuple[int,str]
     """
+    start_time = time.perf_counter()
     try:
-      self.__timestamp__ = datetime.datetime.now().replace( microsecond=0 ).isoformat()
-      start_time = time.perf_counter()
-      self.label_length = self.max_label_length
-      thread_name = threading.current_thread().name
-      logname     = self.id
-      if thread_name is not None:
-        logname = "{0:<10} [{1}".format( f"{thread_name}]", self.id )
-      self.logname = logname
-
-      self.push_logscope( "launch" )
-      self.log( f"Action logfile captured at {self.logfile}", level=slogger.MAIN_LOG )
-
-      self._acquire()
-      ok = self.pre_launch()
-      self._release()
-      if ok is not None and not ok:
-        raise AssertionError( "pre_launch() returned False" )
-
-      # Set current state of this instance
-      self._state = ActionState.RUNNING
-      self._status = ActionStatus.NONE
-
-      # Immediately save the current state of this action
-      self.log( "Saving action information for launch..." )
-      self.label_length = slogger.DEFAULT_LABEL_LENGTH
-      self.logname = self.id
-      self.save()
-      self.label_length = self.max_label_length
-      self.logname = logname
-
-      # Self-submission of execute, but allowing more complex handling by re-entering into this script
-      action_dir = self.resolve_path( self.working_directory, working_directory )
-
-      self.log( f"Using working directory : '{action_dir}'" )
-
-      cmd = self._find_cmd( self._launch_cmd, action_dir )
-      args = [ action_dir, self.save_file ]
-      # python wheel build strips executable attribute and there's no recourse that
-      # keeps it in the package directory, so launch it with python3
-      if os.path.splitext( cmd )[1] == ".py" and not os.access( action_launcher.__file__, os.X_OK ):
-        args.insert( 0, cmd )
-        cmd = "python3"
-
-      if launch_wrapper is not None:
-        args.insert( 0, cmd )
-        cmd = self._find_cmd( launch_wrapper[0], action_dir )
-        args[:0] = launch_wrapper[1]
-
-      retval = -1
-      content = ""
-      if self.logfile is None:
-        self._acquire()
-        self.log( "Action will not be saved to logfile", level=30 )
-        self._release()
-      retval, content = self.execute_subprocess(
+      action_dir, cmd, args, stdin = self._launch_setup( working_directory, launch_wrapper )
+      timeout = self.local_timeout if launch_wrapper is None else None
+      capture = self._launch_capture()
+      if self.__direct_env__ is not None and launch_wrapper is None and self.direct_exec_compatible():
+        self.log( "Running command directly, skipping action_launcher.py" )
+        cmd, args = self._direct_command( action_dir )
+        retval, content = self.execute_subprocess(
+                                                  cmd,
+                                                  args,
+                                                  logfile=self.runlog,
+                                                  capture=capture,
+                                                  verbose=True,
+                                                  dry_run=self.dry_run,
+                                                  log_level=slogger.MAIN_LOG,
+                                                  env=self.__direct_env__,
+                                                  cwd=action_dir,
+                                                  timeout=timeout
+                                                  )
+      elif (
+          self.__fork_server__ is not None and launch_wrapper is None and not self.dry_run
+          and self._launch_cmd == action_launcher.__file__
+      ):
+        retval, content = self._execute_forked(
                                                 cmd,
                                                 args,
                                                 logfile=self.runlog,
-                                                capture=True,
+                                                capture=capture,
                                                 verbose=True,
-                                                dry_run=self.dry_run,
-                                                log_level=slogger.MAIN_LOG
+                                                log_level=slogger.MAIN_LOG,
+                                                input=stdin,
+                                                timeout=timeout
                                                 )
-
-      self._state = ActionState.FINISHED
-      if retval != 0:
-        self._status = ActionStatus.FAILURE
       else:
-        if launch_wrapper is None:
-          self._status = ActionStatus.SUCCESS
-        else:
-          # No idea what the wrapper might do, this is our best guess
-          self._status = ActionStatus.SUBMITTED
-
-      self._acquire()
-      ok = self.post_launch( retval, content )
-      self._release()
-      if ok is not None and not ok:
-        raise AssertionError( "post_launch() returned False" )
-
-      # notify we have finished
-      if thread_name is not None:
-        self.logname = self.id
-      self.pop_logscope()
-      self.__orch_wake__()
-      self.__time__ = "{:.6f}".format( time.perf_counter() - start_time )
+        retval, content = self.execute_subprocess(
+                                                  cmd,
+                                                  args,
+                                                  logfile=self.runlog,
+                                                  capture=capture,
+                                                  verbose=True,
+                                                  dry_run=self.dry_run,
+                                                  log_level=slogger.MAIN_LOG,
+                                                  input=stdin,
+                                                  timeout=timeout
+                                                  )
+      content = self._launch_content( content, launch_wrapper )
+      self._launch_finish( retval, content, launch_wrapper, start_time )
       return retval, content
     except Exception as e:
-      # We failed :( still notify the orchestrator
-      self.set_state_error()
-      self._release()
-      self.log( f"Exception caught, cleaning up : {e}", level=40 )
-      self.logname = self.id
-      self.label_length = slogger.DEFAULT_LABEL_LENGTH
-      self.pop_logscope()
-      self.__orch_wake__()
-      self.__time__ = "{:.6f}".format( time.perf_counter() - start_time )
+      self._launch_failed( e, start_time )
+      raise e
+
+  async def launch_async( self, working_directory : str, launch_wrapper : Tuple[str, list] = None ) -> Tuple[int, str]:
+    """Coroutine equivalent of :py:meth:`launch` using :py:meth:`execute_subprocess_async`
+
+    Used by the :py:class:`~sane.Orchestrator` ``"asyncio"`` :py:attr:`~sane.Orchestrator.engine`.
+    The order of operations and error handling are identical to :py:meth:`launch`.
+    :py:meth:`pre_launch()` and :py:meth:`post_launch()` are called on the
+    event loop thread, so they should not block for long.
+
+    .. danger:: Avoid modifying or overriding this function in any derived :py:class:`Action`
+    """
+    start_time = time.perf_counter()
+    try:
+      action_dir, cmd, args, stdin = self._launch_setup( working_directory, launch_wrapper )
+      timeout = self.local_timeout if launch_wrapper is None else None
+      capture = self._launch_capture()
+      env = None
+      cwd = None
+      if self.__direct_env__ is not None and launch_wrapper is None and self.direct_exec_compatible():
+        self.log( "Running command directly, skipping action_launcher.py" )
+        cmd, args = self._direct_command( action_dir )
+        env = self.__direct_env__
+        cwd = action_dir
+        stdin = None
+      retval, content = await self.execute_subprocess_async(
+                                                            cmd,
+                                                            args,
+                                                            logfile=self.runlog,
+                                                            capture=capture,
+                                                            verbose=True,
+                                                            dry_run=self.dry_run,
+                                                            log_level=slogger.MAIN_LOG,
+                                                            env=env,
+                                                            cwd=cwd,
+                                                            input=stdin,
+                                                            timeout=timeout
+                                                            )
+      content = self._launch_content( content, launch_wrapper )
+      self._launch_finish( retval, content, launch_wrapper, start_time )
+      return retval, content
+    except Exception as e:
+      self._launch_failed( e, start_time )
       raise e
 
   def ref_string( self, input_str ):
@@ -969,6 +1686,9 @@ class Action( state.SaveState, res.ResourceRequestor ):
   def post_launch( self, retval, content ) -> bool:
     """Called after execution of ``action_launcher.py`` with the output of :py:meth:`execute_subprocess()`. See :py:meth:`launch`
 
+    The ``content`` is a ``str`` unless :py:attr:`output_capture` is ``"file"`` (an :py:class:`OutputReference`)
+    or ``"none"`` (``None``).
+
     :return: If return is ``False``, :py:class:`Action` is assumed to have a :py:attr:`~ActionStatus.FAILURE`
     """
     pass
@@ -1035,6 +1755,17 @@ class Action( state.SaveState, res.ResourceRequestor ):
 
     * ``"environment"`` => :py:attr:`environment`
     * ``"working_directory"`` => :py:attr:`working_directory`
+    * ``"priority"`` => :py:attr:`priority`
+    * ``"batch"`` => :py:attr:`batch`
+    * ``"input_files"`` => :py:attr:`input_files`
+    * ``"output_files"`` => :py:attr:`output_files`
+    * ``"timeout"`` => :py:attr:`timeout`
+    * ``"max_attempts"`` => :py:attr:`max_attempts`
+    * ``"retry_backoff"`` => :py:attr:`retry_backoff`
+    * ``"retry_exit_codes"`` => :py:attr:`retry_exit_codes`
+    * ``"retry_output"`` => :py:attr:`retry_output`
+    * ``"output_capture"`` => :py:attr:`output_capture`
+    * ``"output_capture_size"`` => :py:attr:`output_capture_size`
 
     The following key is loaded and calls :py:func:`~helpers.recursive_update`
     preserve any unmodified existing values:
@@ -1067,6 +1798,52 @@ class Action( state.SaveState, res.ResourceRequestor ):
     if dir is not None:
       self.working_directory = dir
 
+    priority = options.pop( "priority", None )
+    if priority is not None:
+      self.priority = float( priority )
+
+    batch = options.pop( "batch", None )
+    if batch is not None:
+      self.batch = batch
+
+    input_files = options.pop( "input_files", None )
+    if input_files is not None:
+      self.input_files = input_files
+
+    output_files = options.pop( "output_files", None )
+    if output_files is not None:
+      self.output_files = output_files
+
+    timeout = options.pop( "timeout", None )
+    if timeout is not None:
+      self.timeout = float( timeout )
+
+    max_attempts = options.pop( "max_attempts", None )
+    if max_attempts is not None:
+      self.max_attempts = int( max_attempts )
+
+    retry_backoff = options.pop( "retry_backoff", None )
+    if retry_backoff is not None:
+      self.retry_backoff = float( retry_backoff )
+
+    retry_exit_codes = options.pop( "retry_exit_codes", None )
+    if retry_exit_codes is not None:
+      self.retry_exit_codes = retry_exit_codes
+
+    retry_output = options.pop( "retry_output", None )
+    if retry_output is not None:
+      self.retry_output = retry_output
+
+    output_capture = options.pop( "output_capture", None )
+    if output_capture is not None:
+      if output_capture not in _CAPTURE_MODES:
+        raise ValueError( f"Unknown output_capture '{output_capture}', must be one of {', '.join( _CAPTURE_MODES )}" )
+      self.output_capture = output_capture
+
+    output_capture_size = options.pop( "output_capture_size", None )
+    if output_capture_size is not None:
+      self.output_capture_size = int( output_capture_size )
+
     act_config = options.pop( "config", None )
     if act_config is not None:
       recursive_update( self.config, act_config )
@@ -1074,3 +1851,110 @@ class Action( state.SaveState, res.ResourceRequestor ):
     self.add_dependencies( *options.pop( "dependencies", {} ).items() )
 
     super().load_core_options( options, origin )
+
+
+def launch_batch( actions : List[Action], working_directory : str, futures : list ) -> None:
+  """Launch several :py:class:`Action` through a single :ref:`action_launcher.py` process
+
+  Each action goes through the same steps as :py:meth:`Action.launch`, except
+  that all of them are run in sequence by one launcher that only sets up each
+  :py:class:`~sane.Environment` once. The launcher output is split back into
+  the :py:attr:`~Action.runlog` of each action, and each action is finished,
+  including :py:meth:`~Action.post_launch` and waking the :py:class:`~sane.Orchestrator`,
+  as soon as it completes.
+
+  :param futures: a :external:py:class:`concurrent.futures.Future` for each action,
+                  set to what :py:meth:`Action.launch` would return or raise
+  """
+  marker = f"\x1esane-batch-{uuid.uuid4().hex}"
+  launched = {}
+  inputs   = []
+  cmd = None
+  for index, ( action, future ) in enumerate( zip( actions, futures ) ):
+    if not future.set_running_or_notify_cancel():
+      continue
+    start_time = time.perf_counter()
+    try:
+      action_dir, cmd, args, stdin = action._launch_setup( working_directory, None )
+      # The launcher arguments are always last, after any interpreter
+      launched[index] = ( action_dir, args[-1], start_time )
+      prefix = args[:-2]
+      if stdin is not None:
+        inputs.append( stdin )
+    except Exception as e:
+      action._launch_failed( e, start_time )
+      future.set_exception( e )
+
+  if len( launched ) == 0:
+    return
+
+  # The launcher numbers only the actions it was given, in order
+  order = list( launched.keys() )
+  args = [ cmd ] + prefix + [ "--batch", marker ]
+  for action_dir, save_file, start_time in launched.values():
+    args.extend( [ action_dir, save_file ] )
+  first = actions[next( iter( launched ) )]
+  first.log( "Running command:", level=slogger.MAIN_LOG )
+  first.log( "  {0}".format( " ".join( args ) ), level=slogger.MAIN_LOG )
+  first.log( "Batched with : " + ", ".join( actions[index].id for index in launched ), level=slogger.MAIN_LOG )
+
+  def finish( index, retval, content ):
+    action = actions[index]
+    start_time = launched.pop( index )[2]
+    try:
+      content = action._launch_content( content, None )
+      action._launch_finish( retval, content, None, start_time )
+    except Exception as e:
+      action._launch_failed( e, start_time )
+      futures[index].set_exception( e )
+    else:
+      futures[index].set_result( ( retval, content ) )
+
+  cancellable = any( bool( actions[index].__cancellable__ ) for index in launched )
+  proc = subprocess.Popen(
+                          args,
+                          stdin=subprocess.PIPE,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT,
+                          start_new_session=cancellable
+                          )
+  # Cancelling any of the actions stops the whole batch
+  killer = _GroupKiller( proc.pid ) if cancellable else None
+  for index in launched:
+    actions[index].__killer__ = killer
+    if killer is not None and actions[index].__cancelled__:
+      killer.stop()
+  # Handed off actions are read back in order by the launcher
+  _write_stdin( proc.stdin, b"".join( inputs ) )
+  current = None
+  output  = None
+  for line in iter( lambda: proc.stdout.readline(), b"" ):
+    if line.startswith( marker.encode() ):
+      fields = line.decode().split()
+      index = order[int( fields[2] )]
+      if fields[1] == "begin" and index in launched:
+        current = index
+        action = actions[index]
+        action.__timestamp__ = datetime.datetime.now().replace( microsecond=0 ).isoformat()
+        launched[index] = launched[index][:2] + ( time.perf_counter(), )
+        output = action._output_tee( action.runlog, True, action._launch_capture(), slogger.MAIN_LOG )
+      elif fields[1] == "end" and index == current:
+        finish( index, int( fields[3] ), output.close() )
+        current = None
+        output  = None
+    elif output is not None:
+      output.write( line )
+    else:
+      # Launcher output outside of any action
+      first.log( line.decode( "utf-8", "replace" ).rstrip( "\n" ), level=slogger.STDOUT )
+
+  proc.stdout.close()
+  proc.wait()
+  if killer is not None:
+    killer.cancel()
+    for action in actions:
+      action.__killer__ = None
+  # Anything not reported did not finish
+  content = output.close() if output is not None else ""
+  for index in list( launched.keys() ):
+    finish( index, proc.returncode if proc.returncode != 0 else -1, content if index == current else "" )
@@ -1,21 +1,23 @@
 #!/usr/bin/env python3
+import io
 import sys
 import os
 
 
-if __name__ == "__main__":
-  filepath = os.path.dirname( os.path.abspath( __file__ ) )
-  package_path = os.path.abspath( os.path.join( filepath, ".." ) )
-  if package_path not in sys.path:
-    sys.path.append( package_path )
+def _handoff_stream():
+  # Read everything up front so the sender never blocks on a full pipe while actions produce output
+  return io.BytesIO( sys.stdin.buffer.read() )
 
-  import sane
 
-  working_directory = sys.argv[1]
-  action_file       = sys.argv[2]
-  sane.internal_logger.setLevel( sane.logger.STDOUT )
+def _load( working_directory, action_file, hosts=None, stream=None ):
+  import sane
 
-  action = sane.save_state.load( action_file )
+  if action_file == "-":
+    # Handed off through stdin, the action followed by its host
+    action = sane.save_state.load_stream( stream )
+    hosts = { action.host_info["file"] : sane.save_state.load_stream( stream ) }
+  else:
+    action = sane.save_state.load( action_file )
   action.push_logscope( "launch" )
   action.log(  "*" * 15 + "{:^15}".format( "Inside action_launcher.py" ) + "*" * 15 )
   cwd = os.getcwd()
@@ -29,7 +31,10 @@ if __name__ == "__main__":
   if "file" not in action.host_info:
     raise Exception( "Missing host file!" )
 
-  host = sane.save_state.load( action.host_info["file"] )
+  if hosts is not None and action.host_info["file"] in hosts:
+    host = hosts[action.host_info["file"]]
+  else:
+    host = sane.save_state.load( action.host_info["file"] )
 
   action.log( f"Loaded Host \"{host.name}\"" )
   environment = host.has_environment( action.environment )
@@ -37,8 +42,10 @@ if __name__ == "__main__":
     raise Exception( f"Missing environment \"{action.environment}\"!" )
 
   action.log( f"Using Environment \"{environment.name}\"" )
-  environment.setup()
+  return action, environment
 
+
+def _run( action ):
   if action.wrap_stdout:
     action.__exec_raw__ = False
 
@@ -51,5 +58,80 @@ if __name__ == "__main__":
     action.log( f"No return value provided by Action {action.id}", level=40 )
 
   action.log(  "*" * 15 + "{:^15}".format( "Finished action_launcher.py" ) + "*" * 15 )
+  return retval
+
+
+def launch( working_directory, action_file, hosts=None ):
+  """Load the :py:class:`~sane.Action` saved at ``action_file``, set up its environment and run it
+
+  If ``action_file`` is ``"-"``, the saved action and then its host are instead read from stdin,
+  see :py:attr:`Orchestrator.pipe_handoff <sane.Orchestrator.pipe_handoff>`.
+
+  :param hosts: optional ``dict`` of already loaded :py:class:`~sane.Host` by save file to use
+                instead of loading the host of the action again
+  :return: the return value of :py:meth:`Action.run() <sane.Action.run>`
+  """
+  import sane
+
+  sane.internal_logger.setLevel( sane.logger.STDOUT )
+
+  stream = _handoff_stream() if action_file == "-" else None
+  action, environment = _load( working_directory, action_file, hosts, stream )
+  environment.setup()
+  return _run( action )
+
+
+def launch_batch( marker, launches, hosts=None ):
+  """Run several :py:class:`~sane.Action` in sequence within this process, see :py:func:`launch`
+
+  The environment is only set up again if it differs from that of the previous action.
+  Every ``action_file`` that is ``"-"`` is read from stdin in order.
+  The output of each action is delimited by ``"<marker> begin <index>"`` and
+  ``"<marker> end <index> <return value>"`` lines.
+
+  :param launches: ``list`` of ``( working_directory, action_file )`` pairs
+  :return: ``0`` once all actions have run, regardless of their return values
+  """
+  import traceback
+  import sane
+
+  sane.internal_logger.setLevel( sane.logger.STDOUT )
+
+  stream = None
+  if any( action_file == "-" for working_directory, action_file in launches ):
+    stream = _handoff_stream()
+
+  environment = None
+  for index, ( working_directory, action_file ) in enumerate( launches ):
+    print( f"{marker} begin {index}", flush=True )
+    try:
+      action, action_environment = _load( working_directory, action_file, hosts, stream )
+      if environment is None or action_environment.name != environment.name:
+        action_environment.setup()
+        environment = action_environment
+      retval = _run( action )
+    except SystemExit as e:
+      retval = e.code
+    except Exception:
+      traceback.print_exc()
+      retval = 1
+
+    if retval is None:
+      retval = 0
+    elif not isinstance( retval, int ):
+      retval = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    print( f"{marker} end {index} {retval}", flush=True )
+  return 0
+
+
+if __name__ == "__main__":
+  filepath = os.path.dirname( os.path.abspath( __file__ ) )
+  package_path = os.path.abspath( os.path.join( filepath, ".." ) )
+  if package_path not in sys.path:
+    sys.path.append( package_path )
 
-  exit( retval )
+  if sys.argv[1] == "--batch":
+    exit( launch_batch( sys.argv[2], list( zip( sys.argv[3::2], sys.argv[4::2] ) ) ) )
+  exit( launch( sys.argv[1], sys.argv[2] ) )
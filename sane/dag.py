@@ -1,19 +1,70 @@
 import queue
+import heapq
+import array
 import collections
+import collections.abc
+
+
+class TraversalList( dict ):
+  """Remaining in-degree of each node left to traverse, keyed by node
+
+  Alongside the counts this keeps a heap of the nodes that have reached zero
+  ordered by their DAG insertion index, so that ready nodes can be retrieved
+  in a deterministic order without scanning every remaining node.
+  """
+  def __init__( self, *args, **kwargs ):
+    super().__init__( *args, **kwargs )
+    self._ready = []
+
+  def copy( self ):
+    other = TraversalList( self )
+    other._ready = self._ready.copy()
+    return other
 
 
 class DAG:
   def __init__( self ):
     self._nodes  = collections.OrderedDict()
     self._rnodes = collections.OrderedDict()
+    # Insertion order of each node
+    self._index  = {}
+    # Topological order of each node, kept up to date as edges are added
+    self._order  = {}
+    self._sorted = None
+    self._valid  = True
 
   def clear( self ):
     self._nodes.clear()
     self._rnodes.clear()
+    self._index.clear()
+    self._order.clear()
+    self._sorted = None
+    self._valid  = True
+
+  @property
+  def valid( self ):
+    """Whether the graph is still acyclic after all edges added so far"""
+    return self._valid
+
+  def __len__( self ):
+    return len( self._nodes )
+
+  def __contains__( self, node ):
+    return node in self._nodes
+
+  def children( self, node ):
+    return self._nodes[node]
+
+  def parents( self, node ):
+    return self._rnodes[node]
 
   def add_node( self, node ):
     if node not in self._nodes:
       self._nodes[node] = []
+      self._index[node] = len( self._index )
+      self._order[node] = len( self._order )
+      if self._sorted is not None:
+        self._sorted.append( node )
     if node not in self._rnodes:
       self._rnodes[node] = []
 
@@ -24,7 +75,55 @@ class DAG:
     self._nodes[parent].append( child )
     self._rnodes[child].append( parent )
 
+    if self._valid and self._order[parent] >= self._order[child]:
+      self._reorder( parent, child )
+
+  def _reorder( self, parent, child ):
+    # Online topological ordering (Pearce & Kelly), only the nodes whose order
+    # lies between the child and parent are searched and shuffled
+    lower = self._order[child]
+    upper = self._order[parent]
+
+    forward = []
+    visited = { child }
+    stack   = [ child ]
+    while len( stack ) > 0:
+      key = stack.pop()
+      forward.append( key )
+      for neighbor in self._nodes[key]:
+        if neighbor == parent:
+          # Cycle, there is no longer any valid order to maintain
+          self._valid  = False
+          self._sorted = None
+          return
+        if neighbor not in visited and self._order[neighbor] < upper:
+          visited.add( neighbor )
+          stack.append( neighbor )
+
+    backward = []
+    visited  = { parent }
+    stack    = [ parent ]
+    while len( stack ) > 0:
+      key = stack.pop()
+      backward.append( key )
+      for neighbor in self._rnodes[key]:
+        if neighbor not in visited and self._order[neighbor] > lower:
+          visited.add( neighbor )
+          stack.append( neighbor )
+
+    # Everything leading to the parent now goes before everything after the child
+    affected  = sorted( backward, key=self._order.__getitem__ ) + sorted( forward, key=self._order.__getitem__ )
+    positions = sorted( self._order[key] for key in affected )
+    for key, position in zip( affected, positions ):
+      self._order[key] = position
+    self._sorted = None
+
   def topological_sort( self ):
+    if self._valid:
+      if self._sorted is None:
+        self._sorted = sorted( self._nodes.keys(), key=self._order.__getitem__ )
+      return self._sorted.copy(), True
+
     in_degree = { key : len(self._rnodes[key]) for key in self._nodes.keys() }
 
     need_to_visit = queue.Queue()
@@ -55,49 +154,328 @@ class DAG:
       return not_visited, False
 
   def traversal_to( self, nodes ):
-    traversal  = []
-    current    = []
-    next_nodes = nodes.copy()
-
-    while len( next_nodes ) > 0:
-      current = next_nodes.copy()
-      next_nodes.clear()
-      visited = []
-
-      while len( current ) > 0:
-        key = current.pop()
-        next_nodes.extend( self._rnodes[key] )
-
-        visited.append( key )
-
-      traversal.append( list( set( visited ) ) )
+    # Gather all ancestors of the requested nodes exactly once
+    visited = set( nodes )
+    stack   = list( visited )
+    while len( stack ) > 0:
+      key = stack.pop()
+      for parent in self._rnodes[key]:
+        if parent not in visited:
+          visited.add( parent )
+          stack.append( parent )
 
-    # Clean it up
-    for i in reversed( range( 0, len( traversal ) ) ):
-      # For all previous appearing keys
-      for key in traversal[i]:
-        # Check prior listings and remove them since they are already listed
-        for j in range( 0, i ):
-          if key in traversal[j]:
-            traversal[j].remove( key )
+    # Each node belongs to the level of its longest path down to a requested node,
+    # so walk up from the nodes with no children left in the traversal
+    remaining = { key : 0 for key in visited }
+    for key in visited:
+      for parent in self._rnodes[key]:
+        remaining[parent] += 1
+    depth   = { key : 0 for key in visited }
+    current = [ key for key, count in remaining.items() if count == 0 ]
+    while len( current ) > 0:
+      key = current.pop()
+      for parent in self._rnodes[key]:
+        depth[parent] = max( depth[parent], depth[key] + 1 )
+        remaining[parent] -= 1
+        if remaining[parent] == 0:
+          current.append( parent )
 
-    return list( reversed( traversal ) )
+    traversal = [ [] for i in range( max( depth.values(), default=-1 ) + 1 ) ]
+    for key in sorted( visited, key=self._index.__getitem__ ):
+      traversal[-1 - depth[key]].append( key )
+    return traversal
 
   def traversal_list( self, nodes ):
     traversal_directed = self.traversal_to( nodes )
-    traversal = { key : len( self._rnodes[key] ) for node_set in traversal_directed for key in node_set }
+    traversal = TraversalList(
+                              ( key, len( self._rnodes[key] ) )
+                              for node_set in traversal_directed for key in node_set
+                              )
+    for key, count in traversal.items():
+      if count == 0:
+        traversal._ready.append( ( self._index[key], key ) )
+    heapq.heapify( traversal._ready )
     return traversal
 
   # This could be a static method but as traversal_list and node_complete are not
   # to give a similar interfacing I am keeping this as an instance method
   def get_next_nodes( self, traversal_list ):
     # Make the intra-level traversal deterministic based on order of node insertion
-    nodes = sorted( [ key for key, count in traversal_list.items() if count == 0], key=list(self._nodes.keys()).index )
+    if not isinstance( traversal_list, TraversalList ):
+      nodes = sorted( [ key for key, count in traversal_list.items() if count == 0 ], key=self._index.__getitem__ )
+    else:
+      nodes = []
+      while len( traversal_list._ready ) > 0:
+        index, key = heapq.heappop( traversal_list._ready )
+        # Nodes may have already been removed by the caller
+        if traversal_list.get( key ) == 0:
+          nodes.append( key )
     for n in nodes:
       del traversal_list[n]
     return nodes
 
   def node_complete( self, node, traversal_list ):
+    # Only the direct children of this node can become ready, so report back
+    # those that just had their last dependency satisfied
+    ready = []
     for child in self._nodes[node]:
       if child in traversal_list:
         traversal_list[child] -= 1
+        if traversal_list[child] == 0:
+          ready.append( child )
+          if isinstance( traversal_list, TraversalList ):
+            heapq.heappush( traversal_list._ready, ( self._index[child], child ) )
+    return ready
+
+
+class CompactTraversalList( collections.abc.MutableMapping ):
+  """Remaining in-degree of each node left to traverse for a :py:class:`CompactDAG`
+
+  Behaves as the ``dict`` returned by :py:meth:`DAG.traversal_list` but the
+  counts are held in a typed array indexed by the interned node, with ``-1``
+  marking nodes not part of the traversal.
+  """
+  def __init__( self, dag, counts, size ):
+    self._dag    = dag
+    self._counts = counts
+    self._size   = size
+    self._ready  = []
+
+  def __getitem__( self, node ):
+    index = self._dag._ids.get( node )
+    if index is None or self._counts[index] < 0:
+      raise KeyError( node )
+    return self._counts[index]
+
+  def __setitem__( self, node, count ):
+    index = self._dag._ids[node]
+    if self._counts[index] < 0:
+      self._size += 1
+    self._counts[index] = count
+
+  def __delitem__( self, node ):
+    index = self._dag._ids.get( node )
+    if index is None or self._counts[index] < 0:
+      raise KeyError( node )
+    self._counts[index] = -1
+    self._size -= 1
+
+  def __iter__( self ):
+    names = self._dag._names
+    for index, count in enumerate( self._counts ):
+      if count >= 0:
+        yield names[index]
+
+  def __len__( self ):
+    return self._size
+
+  def __repr__( self ):
+    return repr( dict( self.items() ) )
+
+  def copy( self ):
+    other = CompactTraversalList( self._dag, array.array( self._counts.typecode, self._counts ), self._size )
+    other._ready = self._ready.copy()
+    return other
+
+
+def _csr( nnodes, edges, side ):
+  # Edges are stored as flat ( parent, child ) pairs, side selects which end to index by
+  offsets = array.array( "l", [0] ) * ( nnodes + 1 )
+  for i in range( side, len( edges ), 2 ):
+    offsets[edges[i] + 1] += 1
+  for i in range( nnodes ):
+    offsets[i + 1] += offsets[i]
+  targets = array.array( "l", [0] ) * ( len( edges ) // 2 )
+  cursor  = array.array( "l", offsets )
+  for i in range( 0, len( edges ), 2 ):
+    source = edges[i + side]
+    targets[cursor[source]] = edges[i + 1 - side]
+    cursor[source] += 1
+  return offsets, targets
+
+
+class CompactDAG:
+  """A :py:class:`DAG` with nodes interned to integers and adjacency in compressed sparse rows
+
+  Nodes are numbered in order of insertion and edges are appended to a flat
+  typed array, from which forward and reverse CSR arrays are built on first use
+  after any change. This keeps very large graphs to a few machine words per
+  node and edge instead of Python lists and ``dict`` entries keyed by node.
+  """
+  def __init__( self ):
+    self._ids   = {}
+    self._names = []
+    self._edges = array.array( "l" )
+    self._csr   = None
+    self._order = None
+
+  def clear( self ):
+    self._ids.clear()
+    self._names.clear()
+    self._edges = array.array( "l" )
+    self._csr   = None
+    self._order = None
+
+  def __len__( self ):
+    return len( self._names )
+
+  def __contains__( self, node ):
+    return node in self._ids
+
+  def _adjacency( self ):
+    if self._csr is None:
+      self._csr = ( _csr( len( self._names ), self._edges, 0 ), _csr( len( self._names ), self._edges, 1 ) )
+    return self._csr
+
+  def _neighbors( self, csr, index ):
+    offsets, targets = csr
+    return targets[offsets[index]:offsets[index + 1]]
+
+  def children( self, node ):
+    return [ self._names[i] for i in self._neighbors( self._adjacency()[0], self._ids[node] ) ]
+
+  def parents( self, node ):
+    return [ self._names[i] for i in self._neighbors( self._adjacency()[1], self._ids[node] ) ]
+
+  def add_node( self, node ):
+    if node not in self._ids:
+      self._ids[node] = len( self._names )
+      self._names.append( node )
+      self._csr   = None
+      self._order = None
+
+  def add_edge( self, parent, child ):
+    self.add_node( parent )
+    self.add_node( child  )
+    self._edges.append( self._ids[parent] )
+    self._edges.append( self._ids[child] )
+    self._csr   = None
+    self._order = None
+
+  def _sort( self ):
+    if self._order is None:
+      forward, reverse = self._adjacency()
+      in_degree = array.array( "l", ( reverse[0][i + 1] - reverse[0][i] for i in range( len( self._names ) ) ) )
+      need_to_visit = collections.deque( i for i, degrees in enumerate( in_degree ) if degrees == 0 )
+      sort_order = array.array( "l" )
+      while len( need_to_visit ) > 0:
+        index = need_to_visit.popleft()
+        sort_order.append( index )
+        for neighbor in self._neighbors( forward, index ):
+          in_degree[neighbor] -= 1
+          if in_degree[neighbor] == 0:
+            need_to_visit.append( neighbor )
+      self._order = ( sort_order, in_degree )
+    return self._order
+
+  @property
+  def valid( self ):
+    """Whether the graph is acyclic"""
+    return len( self._sort()[0] ) == len( self._names )
+
+  def topological_sort( self ):
+    sort_order, in_degree = self._sort()
+    if len( sort_order ) == len( self._names ):
+      return [ self._names[i] for i in sort_order ], True
+    else:
+      print( "Error: Contains a cycle!" )
+      print( "  See the following nodes: " )
+      not_visited = [ self._names[i] for i, degrees in enumerate( in_degree ) if degrees >= 1 ]
+      print( not_visited )
+      return not_visited, False
+
+  def _traversal_depth( self, nodes ):
+    reverse = self._adjacency()[1]
+    nnodes  = len( self._names )
+    # Gather all ancestors of the requested nodes exactly once
+    visited = bytearray( nnodes )
+    members = array.array( "l" )
+    for node in nodes:
+      index = self._ids[node]
+      if not visited[index]:
+        visited[index] = 1
+        members.append( index )
+    stack = array.array( "l", members )
+    while len( stack ) > 0:
+      index = stack.pop()
+      for parent in self._neighbors( reverse, index ):
+        if not visited[parent]:
+          visited[parent] = 1
+          members.append( parent )
+          stack.append( parent )
+
+    # Each node belongs to the level of its longest path down to a requested node
+    remaining = array.array( "l", [0] ) * nnodes
+    for index in members:
+      for parent in self._neighbors( reverse, index ):
+        remaining[parent] += 1
+    depth   = array.array( "l", [0] ) * nnodes
+    current = array.array( "l", ( index for index in members if remaining[index] == 0 ) )
+    while len( current ) > 0:
+      index = current.pop()
+      for parent in self._neighbors( reverse, index ):
+        depth[parent] = max( depth[parent], depth[index] + 1 )
+        remaining[parent] -= 1
+        if remaining[parent] == 0:
+          current.append( parent )
+    return sorted( members ), depth
+
+  def traversal_to( self, nodes ):
+    members, depth = self._traversal_depth( nodes )
+    traversal = [ [] for i in range( max( ( depth[i] for i in members ), default=-1 ) + 1 ) ]
+    for index in members:
+      traversal[-1 - depth[index]].append( self._names[index] )
+    return traversal
+
+  def traversal_list( self, nodes ):
+    members, depth = self._traversal_depth( nodes )
+    offsets = self._adjacency()[1][0]
+    counts  = array.array( "l", [-1] ) * len( self._names )
+    ready   = []
+    for index in members:
+      counts[index] = offsets[index + 1] - offsets[index]
+      if counts[index] == 0:
+        ready.append( index )
+    traversal = CompactTraversalList( self, counts, len( members ) )
+    # Members are already sorted so this is a valid heap
+    traversal._ready = ready
+    return traversal
+
+  def get_next_nodes( self, traversal_list ):
+    # Make the intra-level traversal deterministic based on order of node insertion
+    if not isinstance( traversal_list, CompactTraversalList ):
+      nodes = sorted( [ key for key, count in traversal_list.items() if count == 0 ], key=self._ids.__getitem__ )
+      for n in nodes:
+        del traversal_list[n]
+      return nodes
+
+    nodes  = []
+    counts = traversal_list._counts
+    while len( traversal_list._ready ) > 0:
+      index = heapq.heappop( traversal_list._ready )
+      # Nodes may have already been removed by the caller
+      if counts[index] == 0:
+        counts[index] = -1
+        traversal_list._size -= 1
+        nodes.append( self._names[index] )
+    return nodes
+
+  def node_complete( self, node, traversal_list ):
+    forward = self._adjacency()[0]
+    ready = []
+    if not isinstance( traversal_list, CompactTraversalList ):
+      for child in self.children( node ):
+        if child in traversal_list:
+          traversal_list[child] -= 1
+          if traversal_list[child] == 0:
+            ready.append( child )
+      return ready
+
+    counts = traversal_list._counts
+    for child in self._neighbors( forward, self._ids[node] ):
+      if counts[child] > 0:
+        counts[child] -= 1
+        if counts[child] == 0:
+          ready.append( self._names[child] )
+          heapq.heappush( traversal_list._ready, child )
+    return ready
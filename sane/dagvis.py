@@ -1,7 +1,9 @@
-from sane.dag import DAG
+from typing import Union
 
+from sane.dag import DAG, CompactDAG
 
-def visualize( dag : DAG, nodes, align=False ):
+
+def visualize( dag : Union[DAG, CompactDAG], nodes, align=False ):
   traversal_list = dag.traversal_list( nodes )
   # Connections
   # p =  |  pass
@@ -16,7 +18,7 @@ def visualize( dag : DAG, nodes, align=False ):
 
   def rindex_with_children( nodes_ordered, visited ):
     for node in reversed( nodes_ordered ):
-      children = dag._nodes[node]
+      children = dag.children( node )
       all_visited = []
       for child in children:
         if child in traversal_list and child not in visited:
@@ -44,10 +46,10 @@ def visualize( dag : DAG, nodes, align=False ):
       col_chars = rows[-1][1]
 
       # Go from leftmost to the rightmost column of all direct parents and then find last available column
-      parents = dag._rnodes[node]
+      parents = dag.parents( node )
       indexes = [ node_cols[p] for p in parents ]
       last_c  = rindex_with_children( col_nodes, node_rows.keys() )
-      first_p = min( indexes, default=len(dag._nodes) )
+      first_p = min( indexes, default=len(dag) )
       curr_nodes = col_nodes[:last_c + 1].copy()
       curr_chars = [ "a" if i > first_p else "n" for i, char in enumerate( col_chars[:last_c + 1] ) ]
 
@@ -101,21 +101,25 @@ class Environment( match.NameMatch, opts.OptionLoader ):
     for line in output.getvalue().splitlines():
       self.log( line, level=25 )
 
-  def env_var_prepend( self, var, val ):
-    """Prepend ``val`` to environment variable ``var``"""
-    os.environ[var] = "{0}:{1}".format( val, os.environ[var] )
-
-  def env_var_append( self, var, val ):
-    """Append ``val`` to environment variable ``var``"""
-    os.environ[var] = "{1}:{0}".format( val, os.environ[var] )
-
-  def env_var_set( self, var, val ):
-    """Set environment variable ``var`` to ``val``"""
-    os.environ[var] = str( val )
-
-  def env_var_unset( self, var ):
-    """Unset environment variable ``var``"""
-    os.environ.pop( var, None )
+  def env_var_prepend( self, var, val, environ=None ):
+    """Prepend ``val`` to environment variable ``var`` of ``environ``, default `os.environ`_"""
+    environ = os.environ if environ is None else environ
+    environ[var] = "{0}:{1}".format( val, environ[var] )
+
+  def env_var_append( self, var, val, environ=None ):
+    """Append ``val`` to environment variable ``var`` of ``environ``, default `os.environ`_"""
+    environ = os.environ if environ is None else environ
+    environ[var] = "{1}:{0}".format( val, environ[var] )
+
+  def env_var_set( self, var, val, environ=None ):
+    """Set environment variable ``var`` of ``environ`` to ``val``, default `os.environ`_"""
+    environ = os.environ if environ is None else environ
+    environ[var] = str( val )
+
+  def env_var_unset( self, var, environ=None ):
+    """Unset environment variable ``var`` of ``environ``, default `os.environ`_"""
+    environ = os.environ if environ is None else environ
+    environ.pop( var, None )
 
   def env_script( self, script ):
     """Execute a script in a :external:py:class:`subprocess.Popen` and return
@@ -221,6 +225,19 @@ class Environment( match.NameMatch, opts.OptionLoader ):
     self.lmod_path = self._base.lmod_path
     self._lmod     = self._base._lmod
 
+  @property
+  def definition( self ) -> dict:
+    """Everything that determines what :py:meth:`setup()` does as a JSON serializable ``dict``, including base envs"""
+    return {
+            "type"      : f"{type( self ).__module__}.{type( self ).__qualname__}",
+            "name"      : self.name,
+            "lmod_path" : self.lmod_path,
+            "scripts"   : self._setup_scripts,
+            "lmod_cmds" : self._setup_lmod_cmds,
+            "env_vars"  : self._setup_env_vars,
+            "base"      : self._base.definition if self._base is not None else None
+            }
+
   def pre_setup( self ):
     """Called just before :py:meth:`setup()`"""
     pass
@@ -271,20 +288,52 @@ class Environment( match.NameMatch, opts.OptionLoader ):
         self.log( f"Running lmod cmd: '{cmd}' with args: '{args}' and kwargs: '{kwargs}'" )
         self.module( cmd, *args, **kwargs )
 
+    self._run_env_vars()
+
+    self.post_setup()
+
+  def _run_env_vars( self, environ=None ):
+    environ = os.environ if environ is None else environ
     for category, env_cmd in self._setup_env_vars.items():
       for cmd, var, val in env_cmd:
         self.log( f"Running env cmd: '{cmd}' with var: '{var}' and val: '{val}'" )
         if cmd == "set":
-          self.env_var_set( var, val )
+          self.env_var_set( var, val, environ=environ )
         elif cmd == "unset":
-          self.env_var_unset( var, val )
+          self.env_var_unset( var, environ=environ )
         elif cmd == "append":
-          self.env_var_append( var, val )
+          self.env_var_append( var, val, environ=environ )
         elif cmd == "prepend":
-          self.env_var_prepend( var, val )
-        self.log( f"  Environment variable {var}=" + os.environ[var] )
+          self.env_var_prepend( var, val, environ=environ )
+        self.log( f"  Environment variable {var}=" + environ.get( var, "" ) )
 
-    self.post_setup()
+  def precompute_env( self, environ ) -> dict:
+    """Compute the environment :py:meth:`setup()` would produce starting from ``environ`` without modifying it
+
+    This is only possible when setup consists solely of :py:meth:`setup_env_vars`
+    commands, for this :py:class:`Environment` and its base, and none of the
+    setup methods are overridden.
+
+    :return: a new ``dict`` of the resulting environment variables, or ``None``
+             if setup requires scripts, lmod, or custom code to run
+    """
+    for method in (
+                    "setup", "pre_setup", "post_setup",
+                    "env_var_set", "env_var_unset", "env_var_append", "env_var_prepend"
+                    ):
+      if getattr( type( self ), method ) is not getattr( Environment, method ):
+        return None
+    if len( self._setup_scripts ) > 0 or len( self._setup_lmod_cmds ) > 0:
+      return None
+
+    environ = dict( environ )
+    if self._base is not None:
+      environ = self._base.precompute_env( environ )
+      if environ is None:
+        return None
+
+    self._run_env_vars( environ )
+    return environ
 
   def match( self, requested_env ):
     """Return true if :py:attr:`~Environment.name` or :py:attr:`~Environment.aliases` is an exact match to ``requested_env``"""
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+import array
+import importlib
+import json
+import os
+import selectors
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import traceback
+
+
+def _send_fds( conn, payload : bytes, fds : list ):
+  conn.sendmsg( [ payload ], [ ( socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array( "i", fds ) ) ] )
+
+
+def _recv_fds( conn, max_size : int, max_fds : int ):
+  fds = array.array( "i" )
+  payload, ancdata, flags, addr = conn.recvmsg( max_size, socket.CMSG_LEN( max_fds * fds.itemsize ) )
+  for level, kind, data in ancdata:
+    if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+      fds.frombytes( data[:len( data ) - ( len( data ) % fds.itemsize )] )
+  return payload, list( fds )
+
+
+def _read_line( conn ) -> bytes:
+  line = b""
+  while not line.endswith( b"\n" ):
+    chunk = conn.recv( 1 )
+    if chunk == b"":
+      raise ChildProcessError( "Fork server closed the connection" )
+    line += chunk
+  return line
+
+
+def _exit_code( code ) -> int:
+  # Same interpretation as sys.exit()
+  if code is None:
+    return 0
+  if isinstance( code, int ):
+    return code & 0xff
+  print( code, file=sys.stderr )
+  return 1
+
+
+def _returncode( status ) -> int:
+  # Same convention as subprocess.Popen.returncode
+  if os.WIFSIGNALED( status ):
+    return -os.WTERMSIG( status )
+  return os.WEXITSTATUS( status )
+
+
+class ForkedProcess:
+  """An :ref:`action_launcher.py` forked by a :py:class:`ForkServer`
+
+  Provides the parts of :py:class:`subprocess.Popen` used to launch actions.
+  The ``stdout`` and ``stderr`` of the forked process are both sent to :py:attr:`stdout`.
+  """
+  def __init__( self, address : str, args : list, input : bytes = None, new_session : bool = False ):
+    """Ask the fork server at ``address`` to launch the action with :ref:`action_launcher.py` ``args``
+
+    :param input:       optional data for the stdin of the forked process, otherwise stdin is empty
+    :param new_session: start the forked process in its own session and process group
+    """
+    read, write = os.pipe()
+    fds = [ write ]
+    if input is not None:
+      stdin_read, stdin_write = os.pipe()
+      fds.append( stdin_read )
+    self._conn = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    try:
+      self._conn.connect( address )
+      _send_fds( self._conn, json.dumps( { "args" : args, "new_session" : new_session } ).encode() + b"\n", fds )
+      #: Process ID of the forked action launcher
+      self.pid = int( _read_line( self._conn ) )
+    except BaseException:
+      self._conn.close()
+      os.close( read )
+      if input is not None:
+        os.close( stdin_write )
+      raise
+    finally:
+      for fd in fds:
+        os.close( fd )
+
+    if input is not None:
+      # The launcher reads all of its stdin before producing any output
+      try:
+        remaining = memoryview( input )
+        while len( remaining ) > 0:
+          remaining = remaining[os.write( stdin_write, remaining ):]
+      except BrokenPipeError:
+        pass
+      finally:
+        os.close( stdin_write )
+    #: Binary file of the combined ``stdout`` and ``stderr`` output
+    self.stdout = os.fdopen( read, "rb" )
+    #: Exit code once :py:meth:`wait` returns, negative if killed by a signal
+    self.returncode = None
+
+  def wait( self ) -> int:
+    """Wait for the process to exit and return its :py:attr:`returncode`"""
+    if self.returncode is None:
+      try:
+        self.returncode = int( _read_line( self._conn ) )
+      finally:
+        self._conn.close()
+        self.stdout.close()
+    return self.returncode
+
+
+class ForkServer:
+  """Persistent process that forks :ref:`action_launcher.py` for each action
+
+  The server imports :py:mod:`sane`, the user ``modules``, and loads the ``preload``
+  save files (such as the :py:class:`~sane.Host`) once. Each :py:class:`ForkedProcess`
+  is then a fork of the server, skipping interpreter startup and imports, while still
+  running each action in its own process with its own :py:meth:`Environment.setup() <sane.Environment.setup>`.
+
+  The server stops accepting requests once :py:meth:`close` is called or the process
+  that started it exits, and exits once every forked process has been reported.
+  """
+  def __init__( self, modules : list, import_paths : list, preload : list = [] ):
+    self._directory = tempfile.mkdtemp( prefix="sane_fork_server_" )
+    #: Path of the Unix socket the server accepts launch requests on
+    self.address = os.path.join( self._directory, "socket" )
+    config = { "address" : self.address, "modules" : modules, "import_paths" : import_paths, "preload" : preload }
+    self._proc = subprocess.Popen(
+                                  [ sys.executable, os.path.abspath( __file__ ), json.dumps( config ) ],
+                                  stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE
+                                  )
+    if self._proc.stdout.readline().strip() != b"ready":
+      self.close()
+      raise ChildProcessError( "Fork server failed to start" )
+
+  def close( self ):
+    """Stop the server, waiting for it to report any already forked processes"""
+    if self._proc is not None:
+      self._proc.stdin.close()
+      self._proc.stdout.close()
+      self._proc.wait()
+      self._proc = None
+      shutil.rmtree( self._directory, ignore_errors=True )
+
+  def __enter__( self ):
+    return self
+
+  def __exit__( self, *args ):
+    self.close()
+
+
+def _child( request : dict, fds : list, hosts : dict ):
+  try:
+    if request.get( "new_session", False ):
+      os.setsid()
+    stdin = fds[1] if len( fds ) > 1 else os.open( os.devnull, os.O_RDONLY )
+    os.dup2( stdin, 0 )
+    os.dup2( fds[0], 1 )
+    os.dup2( fds[0], 2 )
+    os.close( stdin )
+    os.close( fds[0] )
+    sys.stdin = open( 0, "r", closefd=False )
+
+    import sane.action_launcher as action_launcher
+    code = action_launcher.launch( *request["args"], hosts=hosts )
+  except SystemExit as e:
+    code = e.code
+  except BaseException:
+    traceback.print_exc()
+    code = 1
+
+  try:
+    code = _exit_code( code )
+    sys.stdout.flush()
+    sys.stderr.flush()
+  finally:
+    os._exit( code if isinstance( code, int ) else 1 )
+
+
+def serve( address : str, modules : list, import_paths : list, preload : list ):
+  """Run the fork server main loop, see :py:class:`ForkServer`"""
+  sys.path[:0] = import_paths
+  import sane
+  import sane.action_launcher
+  for module in modules:
+    importlib.import_module( module )
+  hosts = { filename : sane.save_state.load( filename ) for filename in preload }
+
+  listener = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+  listener.bind( address )
+  listener.listen( 128 )
+
+  # Wake the loop when a forked process exits
+  wakeup_read, wakeup_write = os.pipe()
+  os.set_blocking( wakeup_read, False )
+  os.set_blocking( wakeup_write, False )
+  signal.signal( signal.SIGCHLD, lambda *args: None )
+  signal.set_wakeup_fd( wakeup_write )
+
+  selector = selectors.DefaultSelector()
+  selector.register( listener, selectors.EVENT_READ )
+  selector.register( wakeup_read, selectors.EVENT_READ )
+  selector.register( sys.stdin.fileno(), selectors.EVENT_READ )
+
+  print( "ready", flush=True )
+  null = os.open( os.devnull, os.O_WRONLY )
+  os.dup2( null, 1 )
+  os.close( null )
+
+  connections = {}
+  closing = False
+  while not closing or len( connections ) > 0:
+    for key, events in selector.select():
+      if key.fileobj is listener:
+        conn, addr = listener.accept()
+        payload, fds = _recv_fds( conn, 65536, 2 )
+        request = json.loads( payload )
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+          signal.set_wakeup_fd( -1 )
+          signal.signal( signal.SIGCHLD, signal.SIG_DFL )
+          selector.close()
+          listener.close()
+          conn.close()
+          for connection in connections.values():
+            connection.close()
+          os.close( wakeup_read )
+          os.close( wakeup_write )
+          _child( request, fds, hosts )
+        for fd in fds:
+          os.close( fd )
+        conn.sendall( f"{pid}\n".encode() )
+        connections[pid] = conn
+      elif key.fileobj == wakeup_read:
+        while True:
+          try:
+            if os.read( wakeup_read, 512 ) == b"":
+              break
+          except BlockingIOError:
+            break
+      elif len( os.read( sys.stdin.fileno(), 512 ) ) == 0:
+        # Our parent is done with us, finish reporting on already forked processes
+        selector.unregister( listener )
+        selector.unregister( sys.stdin.fileno() )
+        listener.close()
+        closing = True
+
+    # Report every process that exited
+    while len( connections ) > 0:
+      pid, status = os.waitpid( -1, os.WNOHANG )
+      if pid == 0:
+        break
+      conn = connections.pop( pid, None )
+      if conn is not None:
+        try:
+          conn.sendall( f"{_returncode( status )}\n".encode() )
+        except OSError:
+          pass
+        conn.close()
+
+
+if __name__ == "__main__":
+  package_path = os.path.abspath( os.path.join( os.path.dirname( os.path.abspath( __file__ ) ), ".." ) )
+  if package_path not in sys.path:
+    sys.path.append( package_path )
+
+  config = json.loads( sys.argv[1] )
+  serve( config["address"], config["modules"], config["import_paths"], config["preload"] )
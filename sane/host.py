@@ -1,3 +1,4 @@
+import os
 import socket
 from typing import Dict
 
@@ -28,6 +29,7 @@ class Host( match.NameMatch, state.SaveState, sane.resources.ResourceProvider ):
     #: Control when to kill the :py:attr:`watchdog_func`
     self.kill_watchdog   = False
     self.__wake__        = None
+    self._max_workers    = None
 
   def match( self, requested_host ):
     return self.partial_match( requested_host )
@@ -100,6 +102,31 @@ class Host( match.NameMatch, state.SaveState, sane.resources.ResourceProvider ):
     for env_name, env in self.environments.items():
       env._base = self.base_env
 
+  @property
+  def max_workers( self ) -> int:
+    """The maximum number of actions this host will launch concurrently from one workflow run
+
+    If not set, this defaults to the total ``"cpus"`` resource (after mapping
+    to the internal name) this host provides locally, or the number of CPUs of
+    the current machine if no such resource is provided.
+
+    :param workers: the maximum, or ``None`` to use the default
+    """
+    if self._max_workers is not None:
+      return self._max_workers
+
+    provider = self
+    if isinstance( self, sane.resources.NonLocalProvider ):
+      provider = self.local_resources
+    cpus = provider.map_resource( "cpus" )
+    if cpus in provider._resources and provider._resources[cpus].total > 0:
+      return provider._resources[cpus].total
+    return os.cpu_count() or 1
+
+  @max_workers.setter
+  def max_workers( self, workers : int ):
+    self._max_workers = workers
+
   def add_environment( self, env : sane.environment.Environment ):
     """Add an :py:class:`Environment` to the :py:attr:`environments` using :py:attr:`Environment.name` as the key"""
     env._base = self.base_env
@@ -117,6 +144,7 @@ class Host( match.NameMatch, state.SaveState, sane.resources.ResourceProvider ):
         {
           "aliases" : [ ...str.. ],
           "default_env" : "<env-name>",
+          "max_workers" : <int>,
           "config" : { ...anything... }
           "base_env" : { "type" : "<some_env_type>", ...env options... },
           "environments" :
@@ -131,6 +159,7 @@ class Host( match.NameMatch, state.SaveState, sane.resources.ResourceProvider ):
 
     * ``"aliases"`` => :py:attr:`aliases`
     * ``"default_env"`` => :py:attr:`default_env`
+    * ``"max_workers"`` => :py:attr:`max_workers`
 
     The following key is loaded and calls :py:func:`~helpers.recursive_update`
     preserve any unmodified existing values:
@@ -181,6 +210,10 @@ class Host( match.NameMatch, state.SaveState, sane.resources.ResourceProvider ):
     if default_env is not None:
       self.default_env = default_env
 
+    max_workers = options.pop( "max_workers", None )
+    if max_workers is not None:
+      self.max_workers = max_workers
+
     base_env = options.pop( "base_env", None )
     if base_env is not None:
       if self.base_env is None:
@@ -246,6 +279,17 @@ class Host( match.NameMatch, state.SaveState, sane.resources.ResourceProvider ):
     """
     pass
 
+  def cancel_actions( self, actions : Dict[str, sane.Action] ):
+    """Called within the main thread to stop anything this host still runs for already launched actions
+
+    Used when :py:attr:`Orchestrator.fail_fast <sane.Orchestrator.fail_fast>` stops the workflow,
+    for instance to cancel jobs submitted by a :py:meth:`launch_wrapper`. Local launches are
+    already stopped with :py:meth:`Action.cancel`.
+
+    :param dict[str,Action] actions: The launched :py:class:`Action` to stop, stored by :py:attr:`~Action.id`
+    """
+    pass
+
   @property
   def info( self ):
     """:py:class:`Host` info provided as a ``dict`` to the :py:class:`Action`
@@ -266,15 +310,16 @@ class Host( match.NameMatch, state.SaveState, sane.resources.ResourceProvider ):
     info["config"] = self.config
     return info
 
-  def save( self ):
+  def _pickle( self ):
     tmp_wake     = self.__wake__
     tmp_logger   = self.logger
     self.__wake__  = None
     self.logger    = None
-    super().save()
+    data = super()._pickle()
     # Now restore
     self.__wake__  = tmp_wake
     self.logger    = tmp_logger
+    return data
 
   def __orch_wake__( self ):
     """Wake up the :py:class:`Orchestrator` from another thread.
@@ -29,6 +29,7 @@ class HPCHost( sane.resources.NonLocalProvider, sane.host.Host ):
     self._state_cmd = None
     self._status_cmd = None
     self._submit_cmd = None
+    self._cancel_cmd = None
     self._resources_delim = None
     self._amount_delim = None
     self._submit_format = {
@@ -85,6 +86,11 @@ class HPCHost( sane.resources.NonLocalProvider, sane.host.Host ):
       submission.append( self._cmd_delim )
     return submission
 
+  @property
+  def job_ids( self ):
+    """A copy of the job ids of submitted actions by :py:attr:`Action.id`"""
+    return self._job_ids.copy()
+
   @property
   def watchdog_func( self ):
     return self.capture_job_complete
@@ -136,6 +142,26 @@ class HPCHost( sane.resources.NonLocalProvider, sane.host.Host ):
       self.log( "No HPC jobs to wait for" )
     super().post_run_actions( actions )
 
+  def cancel_actions( self, actions ):
+    for action_name, action in actions.items():
+      if action_name not in self._job_ids or action.status != sane.action.ActionStatus.SUBMITTED:
+        continue
+      job_id = self._job_ids[action_name]
+      self.log( f"Cancelling job ID {job_id} of Action '{action_name}'" )
+      if self.dry_run or self._cancel_cmd is None:
+        continue
+      proc = subprocess.Popen(
+                              ( self._cancel_cmd + f" {job_id}" ).split( " " ),
+                              stdin=subprocess.PIPE,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT
+                              )
+      output, err = proc.communicate()
+      if proc.returncode != 0:
+        # Most likely the job already finished, the watchdog reports on it either way
+        self.log( f"Could not cancel job ID {job_id} : {output.decode( 'utf-8' ).strip()}", level=30 )
+    super().cancel_actions( actions )
+
   def job_complete( self, job_id ):
     proc = subprocess.Popen(
                             ( self._state_cmd + f" {job_id}" ).split( " " ),
@@ -245,7 +271,9 @@ class HPCHost( sane.resources.NonLocalProvider, sane.host.Host ):
   def extract_job_id( self, content ):
     """Tell us how to extract the job id from the return stdout of submission
 
-    The return value should be the job id used in dependency and status checks
+    The ``content`` is the output of the submission as kept by
+    :py:attr:`Action.output_capture <sane.Action.output_capture>`, use ``str( content )`` to get
+    it as text. The return value should be the job id used in dependency and status checks
     """
     pass
 
@@ -278,6 +306,7 @@ class PBSHost( HPCHost ):
     self._state_cmd = "qstat -f -x"
     self._status_cmd = self._state_cmd  # same thing
     self._submit_cmd = "qsub"
+    self._cancel_cmd = "qdel"
     self._resources_delim = ":"
     self._amount_delim = "="
     self._submit_format["arguments"]  = "{0}"
@@ -383,7 +412,7 @@ class PBSHost( HPCHost ):
       return False
 
   def extract_job_id( self, content ):
-    found = re.match( self._job_id_regex, content )
+    found = re.match( self._job_id_regex, str( content ) )
     if found is None:
       self.log( "No job id found in output from job submission", level=40 )
       raise RuntimeError( "No job id found" )
@@ -1,10 +1,17 @@
-import io
+import collections
+import enum
 import logging
+import logging.handlers
+import os
+import queue
 import re
 import sys
+import threading
 
 
 DEFAULT_LABEL_LENGTH = 22
+# Most logfiles of PooledFileHandler kept open at once
+MAX_OPEN_LOGFILES    = 128
 STDOUT   = 18
 ACT_INFO = 19
 MAIN_LOG = 20
@@ -20,21 +27,32 @@ for i in range( logging.DEBUG, logging.INFO - 2 ):
 # https://stackoverflow.com/a/34626685
 class DispatchingFormatter:
   def __init__(self, formatters, default_formatter):
-    self._formatters = formatters
+    self._formatters = [ ( re.compile( fmt ), formatter ) for fmt, formatter in formatters.items() ]
     self._default_formatter = default_formatter
+    # Formatter by logger name, loggers are few and long lived
+    self._cache = {}
 
-  def format(self, record):
+  def _find_formatter( self, name ):
+    # The longest match wins
     formatter = None
     max_span  = 0
-    for fmt in self._formatters.keys():
-      found = re.match( fmt, record.name )
+    for pattern, candidate in self._formatters:
+      found = pattern.match( name )
       if found is not None:
-        span = found.span()[1] - found.span()[0]
+        span = found.end() - found.start()
         if span > max_span:
-          formatter = self._formatters[fmt]
+          formatter = candidate
+          max_span  = span
 
     if formatter is None:
       formatter = self._default_formatter
+    return formatter
+
+  def format(self, record):
+    formatter = self._cache.get( record.name )
+    if formatter is None:
+      formatter = self._find_formatter( record.name )
+      self._cache[record.name] = formatter
     return formatter.format(record)
 
 
@@ -44,6 +62,87 @@ class ParentLevelFilter( logging.Filter ):
     return record.levelno >= self.logger.getEffectiveLevel()
 
 
+class FilePool:
+  """Bounded set of open :py:class:`PooledFileHandler` files, closing the least recently used past ``max_open``"""
+  def __init__( self, max_open : int ):
+    self.max_open = max_open
+    # Least recently used first
+    self._open = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def __len__( self ) -> int:
+    return len( self._open )
+
+  def touch( self, handler : "PooledFileHandler" ):
+    """Mark the file of ``handler`` as just used, closing idle files if there are too many open"""
+    with self._lock:
+      self._open[handler] = None
+      self._open.move_to_end( handler )
+      excess = len( self._open ) - self.max_open
+      if excess <= 0:
+        return
+      idle = [ other for other in self._open if other is not handler ][:excess]
+    for other in idle:
+      # Files being written to are left open
+      if other._suspend():
+        self.forget( other )
+
+  def forget( self, handler : "PooledFileHandler" ):
+    with self._lock:
+      self._open.pop( handler, None )
+
+  def close_all( self ):
+    """Close every idle file in the pool, reopening them if written to again"""
+    with self._lock:
+      handlers = list( self._open )
+    for handler in handlers:
+      if handler._suspend():
+        self.forget( handler )
+
+
+class PooledFileHandler( logging.FileHandler ):
+  """:py:class:`logging.FileHandler` that only creates its file on the first record and shares a :py:class:`FilePool`
+
+  The file is truncated when first opened and appended to whenever the pool reopens it.
+  """
+  def __init__( self, filename : str, pool : FilePool ):
+    super().__init__( filename, mode="w", delay=True )
+    self._pool = pool
+
+  def _open( self ):
+    stream = super()._open()
+    self.mode = "a"
+    return stream
+
+  def emit( self, record ):
+    self._pool.touch( self )
+    if self.stream is None:
+      try:
+        self.stream = self._open()
+      except OSError:
+        self.handleError( record )
+        return
+    super().emit( record )
+
+  def _suspend( self ) -> bool:
+    # Close the file if nothing is writing to it, returning False if busy
+    if not self.lock.acquire( blocking=False ):
+      return False
+    try:
+      if self.stream is not None:
+        stream = self.stream
+        self.stream = None
+        stream.flush()
+        stream.close()
+      return True
+    finally:
+      self.lock.release()
+
+  def close( self ):
+    self._pool.forget( self )
+    super().close()
+
+
 # Initialize logging setup for package
 log_formatter = DispatchingFormatter(
     {
@@ -59,6 +158,7 @@ log_formatter = DispatchingFormatter(
     },
     logging.Formatter( "%(message)s" )
   )
+log_file_pool   = FilePool( MAX_OPEN_LOGFILES )
 console_handler = logging.StreamHandler( sys.stdout )
 console_handler.setFormatter( log_formatter )
 internal_logger = logging.getLogger( "sane" )
@@ -73,11 +173,111 @@ internal_filter.logger = internal_logger
 console_handler.addFilter( internal_filter )
 
 
+# Arguments that read the same whenever they are formatted
+_IMMUTABLE_TYPES = ( str, int, float, bytes, type( None ), enum.Enum )
+
+
+class _LazyMessage:
+  # Arguments of Logger.log() joined as print() would, only once a handler needs the message
+  # unless an argument may change before then (e.g. a dict of action outputs), then right away
+  __slots__ = ( "prefix", "args", "sep", "_message" )
+
+  def __init__( self, prefix, args, sep ):
+    self.prefix   = prefix
+    self.args     = args
+    self.sep      = sep
+    self._message = None
+    if not all( isinstance( arg, _IMMUTABLE_TYPES ) for arg in args ):
+      str( self )
+
+  def __str__( self ):
+    if self._message is None:
+      sep = " " if self.sep is None else self.sep
+      self._message = self.prefix + sep.join( [ str( arg ) for arg in self.args ] )
+    return self._message
+
+
+class _DispatchingListener( logging.handlers.QueueListener ):
+  # Hand each record to the handlers of the logger it was logged with, as if logged directly
+  def handle( self, record ):
+    logging.getLogger( record.name ).handle( record )
+
+
+# Records of every Logger while the listener runs, see start_listener()
+log_queue     = queue.Queue()
+queue_handler = logging.handlers.QueueHandler( log_queue )
+_listener       = None
+_listener_count = 0
+_listener_lock  = threading.Lock()
+
+
+def start_listener():
+  """Write all log records from a single background thread until :py:func:`stop_listener`
+
+  Logging threads then only format their message and queue the record, never waiting
+  on each other or on the console and files. Records of a thread keep their order.
+  Calls may be nested, the listener stops with the last :py:func:`stop_listener`.
+  """
+  global _listener, _listener_count
+  with _listener_lock:
+    _listener_count += 1
+    if _listener is None:
+      _listener = _DispatchingListener( log_queue )
+      _listener.start()
+
+
+def stop_listener():
+  """Stop the listener of :py:func:`start_listener` once every queued record is written"""
+  global _listener, _listener_count
+  with _listener_lock:
+    _listener_count = max( _listener_count - 1, 0 )
+    if _listener is None or _listener_count > 0:
+      return
+    listener  = _listener
+    _listener = None
+  listener.stop()
+  # Anything queued while stopping
+  while True:
+    try:
+      record = log_queue.get_nowait()
+    except queue.Empty:
+      break
+    listener.handle( record )
+    log_queue.task_done()
+
+
+def _find_caller():
+  # Like logging.Logger.findCaller(), but the caller is outside of this module rather than logging
+  frame = sys._getframe( 1 )
+  while frame is not None:
+    code = frame.f_code
+    if os.path.normcase( code.co_filename ) != _srcfile:
+      return code.co_filename, frame.f_lineno, code.co_name
+    frame = frame.f_back
+  return "(unknown file)", 0, "(unknown function)"
+
+
+_srcfile = os.path.normcase( _find_caller.__code__.co_filename )
+
+
+def emit( log, level : int, msg ):
+  """Log ``msg`` at ``level`` with the :py:class:`logging.Logger` ``log``, queued if the listener is running"""
+  if not log.isEnabledFor( level ):
+    return
+  filename, lineno, func = _find_caller()
+  record = log.makeRecord( log.name, level, filename, lineno, msg, None, None, func=func )
+  if _listener is None:
+    log.handle( record )
+  else:
+    # Queued as is so the message is only formatted by the listener
+    queue_handler.enqueue( record )
+
+
 def log_exceptions( etype, value, traceback ):
   from traceback import format_exception
   lines = format_exception( etype, value, traceback )
   for line in lines:
-    internal_logger.log( 50, line )
+    emit( internal_logger, 50, line )
 
 
 class Logger:
@@ -119,21 +319,16 @@ class Logger:
   def _set_label( self, name ):
     self._label             = "{0:<{1}}".format( "[{0}] ".format( name ), self.label_length + 3 )
 
-  def log( self, *args, level=None, **kwargs ) :
+  def log( self, *args, level=None, sep=None ) :
     if level is None:
       level = self.default_log_level
     if self.logger is None:
       self.logger = logger
+    if not self.logger.isEnabledFor( level ):
+      return
 
-    # https://stackoverflow.com/a/39823534
-    output = io.StringIO()
-    print( *args, file=output, end="", **kwargs )
-    contents = output.getvalue()
-    output.close()
-    self.logger.log( level, self._label + self._level_indentation * self._level + contents )
-    # Might need to find a way to flush...
-    # self._console_handler.flush()
-    return self._label + self._level_indentation * self._level + contents
+    # The label and indentation are taken now, the arguments are only joined once written
+    emit( self.logger, level, _LazyMessage( self._label + self._level_indentation * self._level, args, sep ) )
 
   def log_push( self, levels=1 ):
     self._level += levels
@@ -1,15 +1,19 @@
 from typing import Any, List, Dict, Callable
+import collections
 import functools
+import hashlib
 import importlib.util
 import json
 import os
 import pathlib
+import queue
 import shutil
 import sys
 import threading
+import time
 import re
 import datetime
-from concurrent.futures import ThreadPoolExecutor
+import concurrent.futures
 import xml.etree.ElementTree as xmltree
 import xml.dom.minidom
 
@@ -17,11 +21,16 @@ import xml.dom.minidom
 import sane.action
 import sane.dag as dag
 import sane.dagvis as dagvis
+import sane.fork_server as fork_server
 import sane.host
 import sane.hpc_host
+import sane.logger as slogger
 import sane.options as opts
+import sane.result_cache as result_cache
+import sane.state_db as state_db
 import sane.user_space as uspace
 import sane.utdict as utdict
+import sane.workers as workers
 from sane.helpers import copydoc, recursive_update
 
 _registered_functions = {}
@@ -72,6 +81,127 @@ class JSONCDecoder( json.JSONDecoder ):
     return super().decode( s )
 
 
+def stat_files( paths, file_stats : dict ) -> dict:
+  """Stat every path not already in ``file_stats`` once, adding ``( mtime, size )`` or ``None`` if missing
+
+  :return: ``file_stats``
+  """
+  for path in paths:
+    if path not in file_stats:
+      try:
+        stat = os.stat( path )
+        file_stats[path] = ( stat.st_mtime, stat.st_size )
+      except OSError:
+        file_stats[path] = None
+  return file_stats
+
+
+def hash_file( path ) -> str:
+  """sha256 hex digest of the contents of ``path``"""
+  digest = hashlib.sha256()
+  with open( path, "rb" ) as f:
+    for chunk in iter( lambda: f.read( 1024**2 ), b"" ):
+      digest.update( chunk )
+  return digest.hexdigest()
+
+
+def journal_file( save_file ):
+  """Path to the journal of changes recorded since the last snapshot written to ``save_file``"""
+  return os.path.splitext( save_file )[0] + ".journal"
+
+
+def load_save_file( save_file ):
+  """Rebuild the workflow cache from the ``save_file`` snapshot and any journal recorded since
+
+  Each journal line is a partial workflow cache ``dict`` applied in order on top
+  of the snapshot using :py:func:`~helpers.recursive_update`.
+  """
+  save_dict = {}
+  if os.path.isfile( save_file ):
+    with open( save_file, "r" ) as f:
+      save_dict = json.load( f, cls=JSONCDecoder )
+
+  journal = journal_file( save_file )
+  if os.path.isfile( journal ):
+    with open( journal, "r" ) as f:
+      for line in f:
+        try:
+          record = json.loads( line )
+        except ValueError:
+          # Partially written record from an interrupted run, everything before it is still valid
+          break
+        recursive_update( save_dict, record )
+  return save_dict
+
+
+class _Run:
+  # State of a single Orchestrator.run_actions() shared between the steps of the run
+  def __init__( self, host, traversal_list, continue_on_err ):
+    self.host            = host
+    self.traversal_list  = traversal_list
+    self.action_set      = list( traversal_list.keys() )
+    self.continue_on_err = continue_on_err
+    # Weights of the actions to dispatch by, None to keep the order they became ready
+    self.priority = None
+    # Nodes whose dependencies have all completed, and the order they first became ready in
+    self.ready = collections.deque()
+    self.order = {}
+    # Nodes with pending requirements, checked again once one of their dependencies changes
+    self.blocked_requirements = {}
+    # Nodes that could not acquire resources grouped by request, retried once resources are released
+    self.blocked_resources = collections.OrderedDict()
+    self.request_keys = {}
+    self.released = False
+    self.reserved = False
+    self.results   = {}
+    # Launched nodes are reported back here by their futures once done
+    self.completed = queue.Queue()
+    # Actions to record in the journal and submitted actions whose status the host will change later
+    self.changed   = []
+    self.submitted = set()
+    # Launched actions not yet recorded as running
+    self.launched  = set()
+    self.already_logged = set()
+    # Set once fail_fast stops the workflow, nothing is launched from then on
+    self.stopping = False
+    # Failed actions waiting to be retried, by the monotonic time they may launch again
+    self.delayed = {}
+    self.handoff    = None
+    self.host_saved = False
+    self.launcher = None
+    self.server   = None
+    self.executor = None
+    # Precomputed environments by name for direct_exec
+    self.direct_envs = {}
+    self.cache = None
+    # Cache keys of actions by id, only known once all of their dependencies are
+    self.cache_keys = {}
+    # Stats of declared files by path and input file hashes by action for skip_up_to_date
+    self.file_stats  = {}
+    self.file_hashes = None
+    # Actions that ran in this run, anything depending on them must run as well
+    self.rebuilt = set()
+
+  def waiting( self ):
+    # Anything that will wake us once it progresses
+    return (
+        len( self.traversal_list ) > 0 or len( self.results ) > 0 or len( self.delayed ) > 0
+        or len( self.blocked_requirements ) > 0 or len( self.blocked_resources ) > 0
+    )
+
+  def add_ready( self, nodes ):
+    for node in nodes:
+      self.order.setdefault( node, len( self.order ) )
+      self.ready.append( node )
+
+  def unblock( self, nodes ):
+    # Queue the nodes again that were waiting on their requirements
+    for node in nodes:
+      if node in self.blocked_requirements:
+        del self.blocked_requirements[node]
+        self.ready.append( node )
+
+
 class Orchestrator( opts.OptionLoader ):
   """Workflow controller containing all hosts and actions
 
@@ -91,6 +221,8 @@ class Orchestrator( opts.OptionLoader ):
     self.force_local = False
 
     self._dag    = dag.DAG()
+    # Dependencies of each action already in the DAG
+    self._dag_edges = {}
 
     self._current_host  = None
     self._save_location = "./"
@@ -110,6 +242,71 @@ class Orchestrator( opts.OptionLoader ):
 
     self.__timestamp__ = None
 
+    #: Seconds between compacting the journal into the :py:attr:`save_file` snapshot while running
+    self.snapshot_interval = 600
+    #: Size in bytes the :py:attr:`journal_file` may grow to before being compacted while running
+    self.journal_max_size  = 32 * 1024**2
+    self._journal_size  = 0
+    self._last_snapshot = None
+    #: Workflow cache storage, either ``"json"`` (snapshot plus journal) or ``"sqlite"``
+    #: (see :py:class:`~sane.state_db.StateDB`)
+    self.save_backend   = "json"
+    self._state_db      = None
+
+    #: Order to dispatch ready actions in, either ``"fifo"`` or ``"critical_path"`` (see :py:meth:`critical_path`),
+    #: equal priorities keep the order actions became ready in
+    self.schedule = "fifo"
+    #: Historical runtimes in seconds by :py:attr:`Action.id` from previous runs, filled by :py:meth:`load_runtimes`
+    self.runtimes = {}
+    #: Reserve resources for the first ready action that cannot acquire them, only letting others start
+    #: before it if they are estimated to finish in time
+    #: (see :py:meth:`~sane.resources.ResourceProvider.reserve_resources`), otherwise any action that fits may start
+    self.backfill = False
+    #: Most actions to run at once, overriding :py:attr:`Host.max_workers <sane.Host.max_workers>` if set
+    self.max_workers = None
+    #: How actions are launched, either ``"threads"`` (one worker thread per running action) or
+    #: ``"asyncio"`` (all running actions multiplexed on one event loop,
+    #: see :py:meth:`Action.launch_async() <sane.Action.launch_async>`) where only resources limit
+    #: how many actions run at once and :py:attr:`max_workers` is not used
+    self.engine = "threads"
+    #: Fork actions from a :py:class:`~sane.fork_server.ForkServer` with :py:mod:`sane` and the user modules
+    #: already imported instead of starting a new interpreter for each one (``"threads"`` :py:attr:`engine` only)
+    self.fork_server = False
+    #: Run actions that only execute ``config["command"]``
+    #: (see :py:meth:`Action.direct_exec_compatible() <sane.Action.direct_exec_compatible>`)
+    #: directly with their precomputed :py:class:`~sane.Environment`, skipping :ref:`action_launcher.py`
+    self.direct_exec = False
+    #: Most :py:attr:`Action.batch <sane.Action.batch>` actions to run in one :ref:`action_launcher.py` process
+    self.batch_size = 32
+    #: Hand off each action and the host to :ref:`action_launcher.py` through its stdin instead of writing
+    #: save files for every launch, files are then only written when a host launch wrapper needs them
+    self.pipe_handoff = False
+    #: Restore the results of actions whose :py:meth:`Action.cache_key() <sane.Action.cache_key>` matches a
+    #: previous successful run instead of launching them, see :py:attr:`result_cache_file`
+    self.result_cache = False
+    #: Do not restore anything from the :py:attr:`result_cache`, only record the new results
+    self.bypass_result_cache = False
+    #: Size in bytes the stored results of the :py:attr:`result_cache` may grow to before the least recently
+    #: used are evicted
+    self.result_cache_size = 64 * 1024**2
+    #: Skip actions whose :py:attr:`Action.output_files <sane.Action.output_files>` all exist and are newer than
+    #: their :py:attr:`Action.input_files <sane.Action.input_files>` and the output files of their dependencies,
+    #: as ``make`` would. Actions without output files always run, as does anything depending on an action that ran
+    self.skip_up_to_date = False
+    #: With :py:attr:`skip_up_to_date`, inputs newer than the outputs are still considered unchanged if their size
+    #: and content hash match those at the last successful run (see :py:attr:`file_hashes_file`), and actions
+    #: depending on an action that ran are only run if its output files actually changed
+    self.up_to_date_hash = False
+    #: Stop the workflow once an action fails. Nothing else is launched, running local launches are stopped
+    #: with :py:meth:`Action.cancel() <sane.Action.cancel>`, anything the host submitted is stopped with
+    #: :py:meth:`Host.cancel_actions() <sane.Host.cancel_actions>`, and all actions not launched are skipped
+    self.fail_fast = False
+    #: Python re pattern of the :py:attr:`Action.id <sane.Action.id>` whose failure triggers :py:attr:`fail_fast`,
+    #: any failure does if not set
+    self.fail_fast_pattern = None
+    #: Overrides the :py:attr:`Action.output_capture <sane.Action.output_capture>` of every launched action if set
+    self.output_capture = None
+
     super().__init__( logname="orchestrator" )
 
   @property
@@ -123,6 +320,20 @@ class Orchestrator( opts.OptionLoader ):
     self._working_directory = path
     os.chdir( self._working_directory )
 
+  @property
+  def compact_dag( self ) -> bool:
+    """Use the compact integer-indexed :py:class:`~sane.dag.CompactDAG` for very large workflows
+
+    Changing this discards the current internal DAG, which is rebuilt on next use.
+    """
+    return isinstance( self._dag, dag.CompactDAG )
+
+  @compact_dag.setter
+  def compact_dag( self, compact : bool ) -> None:
+    if compact != self.compact_dag:
+      self._dag = dag.CompactDAG() if compact else dag.DAG()
+      self._dag_edges.clear()
+
   @property
   def save_location( self ) -> str:
     """The directory used for saving any intermediary SaveState or workflow cache
@@ -152,8 +363,29 @@ class Orchestrator( opts.OptionLoader ):
 
   @property
   def save_file( self ) -> str:
-    """Absolute path to workflow cache save file, cannot be set"""
-    return os.path.abspath( f"{self.save_location}/{self._filename}" )
+    """Absolute path to workflow cache save file, cannot be set
+
+    When using the ``"sqlite"`` :py:attr:`save_backend` this is the database file instead.
+    """
+    save_file = os.path.abspath( f"{self.save_location}/{self._filename}" )
+    if self.save_backend == "sqlite":
+      save_file = os.path.splitext( save_file )[0] + ".db"
+    return save_file
+
+  @property
+  def journal_file( self ) -> str:
+    """Absolute path to workflow cache journal of changes since the last :py:attr:`save_file` snapshot, cannot be set"""
+    return journal_file( self.save_file )
+
+  @property
+  def result_cache_file( self ) -> str:
+    """Absolute path to the :py:class:`~sane.result_cache.ResultCache` of :py:attr:`result_cache`, cannot be set"""
+    return os.path.abspath( f"{self.save_location}/result_cache.json" )
+
+  @property
+  def file_hashes_file( self ) -> str:
+    """Absolute path to the input file hashes of actions recorded for :py:attr:`up_to_date_hash`, cannot be set"""
+    return os.path.abspath( f"{self.save_location}/file_hashes.json" )
 
   @property
   def results_file( self ) -> str:
@@ -165,6 +397,8 @@ class Orchestrator( opts.OptionLoader ):
     self.actions[action.id] = action
     action.log_location = self.log_location
     action.setup_logs()
+    self._dag.add_node( action.id )
+    self._add_dag_edges( action )
 
   def add_host( self, host : sane.host.Host ) -> None:
     """Adds a host to :py:attr:`hosts`, using the :py:attr:`host.name <Host.name>` as the key"""
@@ -198,23 +432,79 @@ class Orchestrator( opts.OptionLoader ):
     self.construct_dag()
     return self._dag.traversal_list( action_id_list )
 
+  def _add_dag_edges( self, action ):
+    # Dependencies are only ever added, so only new ones need to become edges
+    known = self._dag_edges.setdefault( action.id, set() )
+    if len( known ) != len( action._dependencies ):
+      for dependency in action._dependencies.keys():
+        if dependency not in known:
+          known.add( dependency )
+          self._dag.add_edge( dependency, action.id )
+
   def construct_dag( self ) -> None:
     """Constructs an internal DAG using :py:attr:`Action.id` from :py:attr:`actions`
     as nodes and graph edges from :py:attr:`Action.dependencies`
-    """
-    self._dag.clear()
 
+    The DAG is kept up to date as actions are added, so this only adds edges for
+    dependencies added since and checks that the topology is still valid. The
+    topological order is maintained as each edge is added rather than re-sorting.
+    """
     for id, action in self.actions.items():
       self._dag.add_node( id )
-      for dependency in action.dependencies.keys():
-        self._dag.add_edge( dependency, id )
+      self._add_dag_edges( action )
 
-    nodes, valid = self._dag.topological_sort()
-    if not valid:
+    if not self._dag.valid:
+      # Report the nodes involved
+      self._dag.topological_sort()
       msg = f"Error: In {Orchestrator.construct_dag.__name__}() DAG construction failed, invalid topology"
       self.log( msg, level=50 )
       raise Exception( msg )
 
+  def _direct_env( self, host, action, direct_envs ):
+    # The environment to run the action command directly with, or None if it must go through the launcher
+    if not action.direct_exec_compatible():
+      return None
+    environment = host.has_environment( action.environment )
+    if environment is None:
+      # Let the launcher report the missing environment
+      return None
+    if environment.name not in direct_envs:
+      try:
+        direct_envs[environment.name] = environment.precompute_env( os.environ )
+      except Exception as e:
+        self.log( f"Unable to precompute Environment '{environment.name}', using action launcher : {e}", level=30 )
+        direct_envs[environment.name] = None
+    return direct_envs[environment.name]
+
+  def critical_path( self, action_id_list : List[str] ) -> Dict[str, float]:
+    """Remaining critical path length of every action in the traversal to `action_id_list`
+
+    This is the weight of an action plus the longest weighted path through the actions
+    depending on it within the traversal. The weight is the :py:attr:`Action.priority`
+    if set, otherwise the historical runtime from :py:attr:`runtimes`, otherwise the
+    average of all known runtimes in the traversal (or ``1`` if none are known).
+    Dispatching ready actions with the longest remaining path first keeps long chains
+    of dependencies from waiting on resources held by short independent actions.
+
+    :param action_id_list: A list of :py:attr:`Action.id` to traverse to
+    :return:               A dict of { :py:attr:`Action.id` : ``critical path length`` }
+    """
+    self.construct_dag()
+    levels = self._dag.traversal_to( action_id_list )
+    known  = [ self.runtimes[node] for level in levels for node in level if node in self.runtimes ]
+    default_weight = sum( known ) / len( known ) if len( known ) > 0 else 1.0
+
+    critical_path = {}
+    # Any dependents within the traversal are always at a later level
+    for level in reversed( levels ):
+      for node in level:
+        weight = self.actions[node].priority
+        if weight is None:
+          weight = self.runtimes.get( node, default_weight )
+        children = [ critical_path[child] for child in self._dag.children( node ) if child in critical_path ]
+        critical_path[node] = weight + max( children, default=0.0 )
+    return critical_path
+
   def print_actions( self, action_id_list : List[str], visualize : bool = False ):
     """Print all listed actions neatly and optionally visualize the DAG connectivity
 
@@ -504,7 +794,59 @@ class Orchestrator( opts.OptionLoader ):
     :param as_host:         The preferred host name or alias to run as, if provided.
     :param continue_on_err: Continue workflow evaluation as best as possible even if an :py:class:`Action` encounters an error.
     :param visualize:       Print out a CLI-friendly rendition of the dependency graph of actions to be run.
+
+    While running, all logging is written by a single background thread, see ``sane.logger.start_listener()``.
     """
+    slogger.start_listener()
+    try:
+      return self._run_actions( action_id_list, as_host, continue_on_err, visualize )
+    finally:
+      self._close_state_db()
+      slogger.stop_listener()
+      slogger.log_file_pool.close_all()
+
+  def _run_actions( self, action_id_list, as_host, continue_on_err, visualize ):
+    run = self._prepare_run( action_id_list, as_host, continue_on_err, visualize )
+    self._start_run( run )
+
+    self.log( "Running actions..." )
+    start = datetime.datetime.now()
+    while len( run.ready ) > 0 or run.waiting():
+      self._dispatch( run )
+
+      if len( run.ready ) > 0:
+        # Nodes completed without launching and released their children, go again
+        continue
+
+      # We submitted everything we could so now wait for at least one action to wake us,
+      # unless the last actions completed without launching and nothing is left to wake us
+      if run.waiting():
+        # Retries wake us once due
+        timeout = None
+        if len( run.delayed ) > 0:
+          timeout = max( min( run.delayed.values() ) - time.monotonic(), 0.0 )
+        self.__wake__.wait( timeout )
+        self.__wake__.clear()
+
+      if not self._process_completed( run ):
+        # Woken by something other than our own launches, e.g. the host or extra requirements,
+        # so anything blocked may be able to go now
+        run.unblock( list( run.blocked_requirements ) )
+        run.released = True
+
+      # We are in a good spot to save, only record what changed unless a snapshot is due
+      self.journal( run.changed )
+      run.changed.clear()
+      if self._snapshot_due():
+        self.save( run.action_set )
+        if run.cache is not None:
+          run.cache.save()
+        if run.file_hashes is not None:
+          self._save_file_hashes( run.file_hashes )
+
+    return self._finish_run( run, start )
+
+  def _prepare_run( self, action_id_list, as_host, continue_on_err, visualize ):
     # Setup does not take that long so make sure it is always run
     self.setup()
     self.check_action_id_list( action_id_list )
@@ -531,12 +873,27 @@ class Orchestrator( opts.OptionLoader ):
 
     self.check_host( traversal_list )
 
+    run = _Run( host, traversal_list, continue_on_err )
+    # The reservation goes to the first action that cannot acquire resources
+    run.reserved = not self.backfill
+    if self.schedule == "critical_path":
+      run.priority = self.critical_path( action_id_list )
+
+    for node in traversal_list:
+      if self.actions[node].runtime_estimate is None:
+        self.actions[node].runtime_estimate = self.runtimes.get( node )
+
     # We have a valid host for all actions slated to run
     host.save_location = self.save_location
     host.dry_run = self.dry_run
 
-    self.log( "Saving host information..." )
-    host.save()
+    if self.pipe_handoff:
+      # Save files are only written once a launch wrapper needs them
+      run.handoff = host.dumps()
+    else:
+      self.log( "Saving host information..." )
+      host.save()
+      run.host_saved = True
 
     self.log( "Setting state of all inactive actions to pending" )
     # Mark all actions to be run as pending if not already run
@@ -545,173 +902,527 @@ class Orchestrator( opts.OptionLoader ):
       if self.actions[node].state == sane.action.ActionState.INACTIVE:
         self.actions[node].set_state_pending()
 
+    self.__timestamp__ = datetime.datetime.now().replace( microsecond=0 ).isoformat()
     self.save( action_set )
-    next_nodes = []
-    processed_nodes = []
-    executor = ThreadPoolExecutor( max_workers=64, thread_name_prefix="thread" )
-    results = {}
-    already_logged = []
+    run.add_ready( self._dag.get_next_nodes( traversal_list ) )
+    return run
+
+  def _start_run( self, run ):
+    # Bring up everything needed to launch and check what may not need to
+    host = run.host
+    max_workers = self.max_workers if self.max_workers is not None else host.max_workers
+    if self.engine == "asyncio":
+      self.log( "Launching actions on asyncio event loop" )
+      run.launcher = workers.EventLoopThread( thread_name="async" )
+    else:
+      self.log( f"Running at most {max_workers} actions at once" )
+    if self.fork_server and run.launcher is None and not self.dry_run:
+      self.log( "Starting fork server..." )
+      run.server = fork_server.ForkServer(
+                                          list( uspace.user_modules.keys() ),
+                                          uspace.user_paths,
+                                          preload=[ host.save_file ] if run.host_saved else []
+                                          )
+    # The watchdog keeps one worker for the whole run
+    run.executor = workers.WorkerPool(
+                                      max_workers=max_workers + int( host.watchdog_func is not None ),
+                                      thread_name_prefix="thread"
+                                      )
+    if self.result_cache and not self.dry_run:
+      run.cache = result_cache.ResultCache( self.result_cache_file, self.result_cache_size )
+      self.log( f"Using result cache {self.result_cache_file} with {len( run.cache )} entries" )
+    if self.skip_up_to_date and not self.dry_run:
+      self.log( "Checking declared files of actions..." )
+      declared = []
+      for node in run.action_set:
+        for f in self.actions[node].input_files + self.actions[node].output_files:
+          # References can only be resolved once dependencies have run
+          if not self.actions[node].ref_string( str( f ) ):
+            declared.append( self.actions[node].resolve_files( [ f ], self.working_directory )[0] )
+      stat_files( declared, run.file_stats )
+      if self.up_to_date_hash:
+        run.file_hashes = {}
+        if os.path.isfile( self.file_hashes_file ):
+          with open( self.file_hashes_file, "r" ) as f:
+            run.file_hashes = json.load( f )
     self.log( f"Using working directory : '{self.working_directory}'" )
 
     host.__wake__ = self.__wake__
-    host_watchdog   = host.watchdog_func
-    host_wd_results = None
+    host_watchdog = host.watchdog_func
     if host_watchdog is not None:
       self.log( f"Launching Host '{self.current_host}' watchdog function" )
-      host_wd_results = executor.submit( host_watchdog, { node : self.actions[node] for node in action_set } )
+      run.executor.submit( host_watchdog, { node : self.actions[node] for node in run.action_set } )
 
-    host.pre_run_actions( { node : self.actions[node] for node in action_set } )
+    host.pre_run_actions( { node : self.actions[node] for node in run.action_set } )
 
-    self.log( "Running actions..." )
-    start = datetime.datetime.now()
-    self.__timestamp__ = start.replace( microsecond=0 ).isoformat()
-    while len( traversal_list ) > 0 or len( next_nodes ) > 0 or len( processed_nodes ) > 0:
-      try:
-        next_nodes.extend( self._dag.get_next_nodes( traversal_list ) )
-        for node in next_nodes.copy():
-          if self.actions[node].state == sane.action.ActionState.PENDING:
-            # Gather all dependency nodes
-            dependencies = { action_id : self.actions[action_id] for action_id in self.actions[node].dependencies.keys() }
-            # Check requirements met
-            requirements_met = sane.action.RequirementsState.UNMET
-            with self.__run_lock__:  # protect logs
-              requirements_met = self.actions[node].requirements_met(
-                                                                      dependencies,
-                                                                      not isinstance(
-                                                                        host,
-                                                                        sane.resources.NonLocalProvider
-                                                                        ) or host.launch_local( self.actions[node] )
-                                                                      )
-
-            if requirements_met == sane.action.RequirementsState.MET:
-              resources_available = False
-              with self.__run_lock__:  # protect logs
-                resources_available = host.acquire_resources(
-                                                              self.actions[node].resources( self.current_host ),
-                                                              requestor=self.actions[node]
-                                                              )
-              if resources_available:
-                # Set info first
-                self.actions[node].__host_info__ = host.info
-                recursive_update( self.actions[node]._dependencies, { id : dep_action.info for id, dep_action in dependencies.items() } )
-                # if these are not set then default to action settings
-
-                if self.force_local:
-                  self.actions[node].local = self.force_local
-
-                self.actions[node].dry_run = self.dry_run
-                self.actions[node].save_location = self.save_location
-                # self.actions[node].log_location = self.log_location
-
-                launch_wrapper = None
-                with self.__run_lock__:  # protect logs
-                  launch_wrapper = host.launch_wrapper( self.actions[node], dependencies )
-
-                self.log( f"Running '{node}' on '{self.current_host}'" )
-                with self.__run_lock__:
-                  host.pre_launch( self.actions[node] )
-                self.log_flush()
-                results[node] = executor.submit(
-                                                self.actions[node].launch,
-                                                self.working_directory,
-                                                launch_wrapper=launch_wrapper
-                                                )
-                next_nodes.remove( node )
-                processed_nodes.append( node )
-              else:
-                self.log( "Not enough resources in host right now, continuing and retrying later", level=10 )
-                continue
-            elif requirements_met == sane.action.RequirementsState.PENDING:
-              # We don't want this suppressed but also not constantly repeating
-              if node not in already_logged:
-                self.log( f"Waiting on Action '{node}' requirements to be met..." )
-                already_logged.append( node )
-              continue
-            else:
-              self.log(
-                        f"Unable to run Action '{node}', requirements not met",
-                        level=40 - int(continue_on_err) * 10
-                        )
-              next_nodes.remove( node )
-              processed_nodes.append( node )
-              # Force evaluation and set to no longer run
-              self.actions[node].set_state_skipped()
-              self.__wake__.set()
-          elif self.actions[node].state != sane.action.ActionState.RUNNING:
-            msg  = "Action {0:<24} already has {{state, status}} ".format( f"'{node}'" )
-            msg += f"{{{self.actions[node].state.value}, {self.actions[node].status.value}}}"
-            self.log( msg )
-            next_nodes.remove( node )
-            processed_nodes.append( node )
-            # Force evaluation even though nothing was done we may get new actions to run
-            self.__wake__.set()
+  def _dispatch( self, run ):
+    # Launch everything ready that can launch right now
+    try:
+      now = time.monotonic()
+      for node, due in list( run.delayed.items() ):
+        if due <= now:
+          del run.delayed[node]
+          run.ready.append( node )
+      candidates = list( run.ready )
+      run.ready.clear()
+      if run.released:
+        # Only a release can make room, until then the same requests would fail again
+        run.released = False
+        for nodes in run.blocked_resources.values():
+          candidates.extend( nodes )
+        run.blocked_resources.clear()
+        if self.backfill:
+          run.host.clear_reservation()
+          run.reserved = False
+      if run.priority is not None:
+        candidates.sort( key=lambda node: ( -run.priority[node], run.order[node] ) )
+      else:
+        candidates.sort( key=run.order.__getitem__ )
+      # Batched actions to launch together by environment
+      batches = {}
+      for node in candidates:
+        self._dispatch_node( run, node, batches )
+
+      for nodes in batches.values():
+        for i in range( 0, len( nodes ), self.batch_size ):
+          if len( nodes[i:i + self.batch_size] ) == 1:
+            self._launch( run, nodes[i], None )
+          else:
+            self._launch_batch( run, nodes[i:i + self.batch_size] )
+
+    except Exception as e:
+      # Bad things happened :(
+      if self.__run_lock__.locked():
+        self.__run_lock__.release()
+      self.__wake__.set()
+      run.host.kill_watchdog = True
+      if run.launcher is not None:
+        run.launcher.shutdown( wait=False )
+      if run.server is not None:
+        run.server.close()
+      raise e
 
+  def _dispatch_node( self, run, node, batches ):
+    action = self.actions[node]
+    request = run.request_keys.get( node )
+    if request in run.blocked_resources:
+      # Nothing was released since an identical request failed
+      run.blocked_resources[request].append( node )
+    elif action.state == sane.action.ActionState.PENDING:
+      # Gather all dependency nodes
+      dependencies = { action_id : self.actions[action_id] for action_id in action.dependencies.keys() }
+      # Check requirements met
+      local = not isinstance( run.host, sane.resources.NonLocalProvider ) or run.host.launch_local( action )
+      requirements_met = action.requirements_met( dependencies, local )
+
+      if requirements_met == sane.action.RequirementsState.MET and self._skip_launch( run, node, dependencies ):
+        self._node_finished( run, node )
+      elif requirements_met == sane.action.RequirementsState.MET:
+        self._acquire_and_launch( run, node, dependencies, batches )
+      elif requirements_met == sane.action.RequirementsState.PENDING:
+        # We don't want this suppressed but also not constantly repeating
+        if node not in run.already_logged:
+          self.log( f"Waiting on Action '{node}' requirements to be met..." )
+          run.already_logged.add( node )
+        run.blocked_requirements[node] = None
+      else:
+        self.log(
+                  f"Unable to run Action '{node}', requirements not met",
+                  level=40 - int(run.continue_on_err) * 10
+                  )
+        # Force evaluation and set to no longer run
+        action.set_state_skipped()
+        self._node_finished( run, node )
+    elif action.state != sane.action.ActionState.RUNNING:
+      msg  = "Action {0:<24} already has {{state, status}} ".format( f"'{node}'" )
+      msg += f"{{{action.state.value}, {action.status.value}}}"
+      self.log( msg )
+      # Evaluate now even though nothing was done, we may get new actions to run
+      self._node_finished( run, node )
+      # Nothing changed so there is nothing to record
+      run.changed.remove( node )
+
+  def _acquire_and_launch( self, run, node, dependencies, batches ):
+    action = self.actions[node]
+    host = run.host
+    request = run.request_keys.get( node )
+    if request is None:
+      request = run.request_keys[node] = self._resource_request_key( host, action )
+    if request in run.blocked_resources:
+      # Nothing was released since an identical request failed
+      run.blocked_resources[request].append( node )
+      return
+    if not host.acquire_resources( action.resources( self.current_host ), requestor=action ):
+      self.log( "Not enough resources in host right now, continuing and retrying later", level=10 )
+      if not run.reserved:
+        host.reserve_resources( action.resources( self.current_host ), requestor=action )
+        run.reserved = True
+      run.blocked_resources[request] = [ node ]
+      return
+
+    # Set info first
+    action.__host_info__ = host.info
+    recursive_update( action._dependencies, { id : dep_action.info for id, dep_action in dependencies.items() } )
+    # if these are not set then default to action settings
+
+    if self.force_local:
+      action.local = self.force_local
+    if self.output_capture is not None:
+      action.output_capture = self.output_capture
+
+    action.dry_run = self.dry_run
+    action.save_location = self.save_location
+
+    launch_wrapper = host.launch_wrapper( action, dependencies )
+
+    self.log( f"Running '{node}' on '{self.current_host}'" )
+    with self.__run_lock__:
+      host.pre_launch( action )
+    self.log_flush()
+    environment = host.has_environment( action.environment )
+    if (
+        action.batch and launch_wrapper is None and not self.dry_run and action.local_timeout is None
+        and environment is not None and action._launch_cmd == sane.action.action_launcher.__file__
+    ):
+      batches.setdefault( environment.name, [] ).append( node )
+    else:
+      self._launch( run, node, launch_wrapper )
+
+  def _process_completed( self, run ):
+    # Handle everything that started or completed since the last wake, returning True if anything did
+    progressed = False
+    host = run.host
+    for node in list( run.launched ):
+      if self.actions[node].state != sane.action.ActionState.PENDING:
+        # Record that it started, for anyone viewing the run and in case we never hear back
+        progressed = True
+        run.launched.remove( node )
+        run.changed.append( node )
+
+    while not run.completed.empty():
+      progressed = True
+      node = run.completed.get()
+      try:
+        retval, content = run.results[node].result()
+        if self._retry( run, node, retval, content ):
+          # The host only sees the final attempt
+          host.release_resources( self.actions[node].resources( self.current_host ), requestor=self.actions[node] )
+          run.released = True
+          del run.results[node]
+          continue
+        host.post_launch( self.actions[node], retval, content )
+        # Regardless, return resources
+        host.release_resources( self.actions[node].resources( self.current_host ), requestor=self.actions[node] )
+        run.released = True
+        del run.results[node]
+        if node in run.cache_keys and self.actions[node].status == sane.action.ActionStatus.SUCCESS:
+          run.cache.put( run.cache_keys[node], self.actions[node].results )
+        if self.skip_up_to_date and not self.dry_run:
+          self._record_declared_files( node, run.file_stats, run.file_hashes, run.rebuilt )
       except Exception as e:
-        # Bad things happened :(
-        if self.__run_lock__.locked():
-          self.__run_lock__.release()
-        self.__wake__.set()
         host.kill_watchdog = True
+        for k, v in run.results.items():
+          v.cancel()
+        if run.launcher is not None:
+          run.launcher.shutdown( wait=True )
+        run.executor.shutdown( wait=True )
+        if run.server is not None:
+          run.server.close()
         raise e
 
-      # We submitted everything we could so now wait for at least one action to wake us
-      self.__wake__.wait()
-      self.__wake__.clear()
-      for node in processed_nodes.copy():
-        if node in results and results[node].done():
-          try:
-            retval, content = results[node].result()
-            host.post_launch( self.actions[node], retval, content )
-            # Regardless, return resources
-            host.release_resources( self.actions[node].resources( self.current_host ), requestor=self.actions[node] )
-            del results[node]
-          except Exception as e:
-            host.kill_watchdog = True
-            for k, v in results.items():
-              v.cancel()
-            executor.shutdown( wait=True )
-            raise e
-
-        run_state = sane.action.ActionState.valid_run_state( self.actions[node].state )
-        if ( self.actions[node].state == sane.action.ActionState.FINISHED
-           or ( continue_on_err and not run_state ) ):
-          msg  = "[{{state:<8}}] ** Action {0:<24} completed with '{{status}}'".format( f"'{node}'" )
-          msg  = msg.format( state=self.actions[node].state.value.upper(), status=self.actions[node].status.value )
-          self.log( msg )
-          self._dag.node_complete( node, traversal_list )
-          processed_nodes.remove( node )
-        elif not run_state:
-          # If we get here, we DO want to error
-          msg = f"Action '{node}' did not return finished state : {self.actions[node].state.value}"
-          self.log( msg, level=50 )
-          raise Exception( msg )
-
-        # We are in a good spot to save
-        self.save( action_set )
+      self._node_finished( run, node )
+      if run.stopping and self.actions[node].status == sane.action.ActionStatus.SUBMITTED:
+        # Submitted just as the workflow was stopping
+        host.cancel_actions( { node : self.actions[node] } )
+      self._check_fail_fast( run, node )
+
+    for node in list( run.submitted ):
+      if self.actions[node].status != sane.action.ActionStatus.SUBMITTED:
+        progressed = True
+        run.submitted.remove( node )
+        run.changed.append( node )
+        # Children that were waiting on this to leave the submitted status
+        run.unblock( self._dag.children( node ) )
+        self._check_fail_fast( run, node )
+    return progressed
+
+  def _node_finished( self, run, node ):
+    action = self.actions[node]
+    run_state = sane.action.ActionState.valid_run_state( action.state )
+    if action.state == sane.action.ActionState.FINISHED or ( run.continue_on_err and not run_state ):
+      msg  = "[{{state:<8}}] ** Action {0:<24} completed with '{{status}}'".format( f"'{node}'" )
+      msg  = msg.format( state=action.state.value.upper(), status=action.status.value )
+      self.log( msg )
+      run.changed.append( node )
+      if action.status == sane.action.ActionStatus.SUBMITTED:
+        run.submitted.add( node )
+      # Only the direct children of this node need to be considered
+      self._dag.node_complete( node, run.traversal_list )
+      run.add_ready( self._dag.get_next_nodes( run.traversal_list ) )
+      run.unblock( self._dag.children( node ) )
+    elif not run_state:
+      # If we get here, we DO want to error
+      msg = f"Action '{node}' did not return finished state : {action.state.value}"
+      self.log( msg, level=50 )
+      raise Exception( msg )
+
+  def _check_fail_fast( self, run, node ):
+    failed = (
+        self.actions[node].state == sane.action.ActionState.ERROR
+        or self.actions[node].status == sane.action.ActionStatus.FAILURE
+    )
+    matched = self.fail_fast_pattern is None or re.search( self.fail_fast_pattern, node ) is not None
+    if run.stopping or not self.fail_fast or not failed or not matched:
+      return
+    run.stopping = True
+    self.log( f"Action '{node}' failed, stopping workflow", level=40 )
+    # Anything not launched yet will not be
+    for other in run.action_set:
+      if other not in run.results and self.actions[other].state == sane.action.ActionState.PENDING:
+        self.actions[other].set_state_skipped()
+        self.actions[other].cancel()
+        run.changed.append( other )
+    for other in list( run.traversal_list ):
+      del run.traversal_list[other]
+    run.delayed.clear()
+    run.ready.clear()
+    run.blocked_requirements.clear()
+    run.blocked_resources.clear()
+    # Then stop what is still running
+    for other in run.results:
+      self.log( f"Cancelling Action '{other}'" )
+      self.actions[other].cancel()
+    if len( run.submitted ) > 0:
+      run.host.cancel_actions( { other : self.actions[other] for other in run.submitted } )
+
+  def _retry( self, run, node, retval, content ):
+    # Queue a failed launch again if its action allows, returning True if so
+    action = self.actions[node]
+    attempts = len( action.__retries__ ) + 1
+    failed = action.state == sane.action.ActionState.FINISHED and action.status == sane.action.ActionStatus.FAILURE
+    if run.stopping or attempts >= action.max_attempts or not failed:
+      return False
+    if not action.should_retry( retval, content ):
+      return False
+    action._prepare_retry( retval )
+    delay = action.retry_backoff * 2 ** ( attempts - 1 )
+    self.log(
+              f"Action '{node}' failed attempt {attempts}/{action.max_attempts} with {retval}, "
+              f"retrying in {delay:g} seconds",
+              level=30
+              )
+    run.delayed[node] = time.monotonic() + delay
+    run.changed.append( node )
+    return True
+
+  def _skip_launch( self, run, node, dependencies ):
+    # Actions that are complete without launching, retries must always launch again
+    if len( self.actions[node].__retries__ ) > 0:
+      return False
+    if self.skip_up_to_date and not self.dry_run:
+      if self._check_up_to_date( run.host, node, dependencies, run.file_stats, run.file_hashes, run.rebuilt ):
+        return True
+    return run.cache is not None and self._check_result_cache( run.host, node, dependencies, run.cache, run.cache_keys )
+
+  def _launch( self, run, node, launch_wrapper ):
+    action = self.actions[node]
+    action.__handoff__ = run.handoff
+    run.launched.add( node )
+    if launch_wrapper is not None and not run.host_saved:
+      self.log( "Saving host information for launch wrapper..." )
+      run.host.save()
+      run.host_saved = True
+    action.__fork_server__ = run.server.address if run.server is not None else None
+    action.__cancellable__ = self.fail_fast and launch_wrapper is None
+    action.__direct_env__ = None
+    if self.direct_exec and not self.dry_run and launch_wrapper is None:
+      action.__direct_env__ = self._direct_env( run.host, action, run.direct_envs )
+    if run.launcher is None:
+      run.results[node] = run.executor.submit(
+                                              action.launch,
+                                              self.working_directory,
+                                              launch_wrapper=launch_wrapper
+                                              )
+    else:
+      run.results[node] = run.launcher.submit(
+                                              action.launch_async,
+                                              self.working_directory,
+                                              launch_wrapper=launch_wrapper
+                                              )
+    run.results[node].add_done_callback( functools.partial( self._notify_complete, run.completed, node ) )
+
+  def _launch_batch( self, run, nodes ):
+    futures = [ concurrent.futures.Future() for node in nodes ]
+    for node, future in zip( nodes, futures ):
+      self.actions[node].__handoff__ = run.handoff
+      self.actions[node].__cancellable__ = self.fail_fast
+      run.launched.add( node )
+      run.results[node] = future
+      future.add_done_callback( functools.partial( self._notify_complete, run.completed, node ) )
+    run.executor.submit(
+                        sane.action.launch_batch,
+                        [ self.actions[node] for node in nodes ],
+                        self.working_directory,
+                        futures
+                        )
 
+  def _finish_run( self, run, start ):
     # Shutdown workflow
+    host = run.host
     host.kill_watchdog = True
-    executor.shutdown( wait=True )
-
-    host.post_run_actions( { node : self.actions[node] for node in action_set } )
-
+    if run.launcher is not None:
+      run.launcher.shutdown( wait=True )
+    run.executor.shutdown( wait=True )
+    if run.server is not None:
+      run.server.close()
+
+    host.post_run_actions( { node : self.actions[node] for node in run.action_set } )
+
+    if run.launcher is None:
+      stats = run.executor.statistics()
+      self.log(
+                f"Workers used {stats['peak_workers']}/{run.executor.max_workers} at peak "
+                f"({stats['threads_started']} started), {stats['utilization']:.1%} utilization, "
+                f"peak queue depth {stats['peak_queue_depth']}, mean queue wait {stats['mean_queue_wait']:.3f}s"
+                )
+    else:
+      stats = run.launcher.statistics()
+      self.log( f"Event loop ran {stats['submitted']} actions, {stats['peak_running']} at once at peak" )
     self.log( "Finished running queued actions" )
     # Report final statuses
-    statuses = [ f"{node:<{longest_action}}: " + self.actions[node].status.value for node in action_set ]
+    longest_action = len( max( run.action_set, key=len ) )
+    statuses = [ f"{node:<{longest_action}}: " + self.actions[node].status.value for node in run.action_set ]
     print_actions( statuses, print=self.log )
-    status = all( [ self.actions[node].status == sane.action.ActionStatus.SUCCESS for node in action_set ] )
+    status = all( [ self.actions[node].status == sane.action.ActionStatus.SUCCESS for node in run.action_set ] )
     if status:
       self.log( "All actions finished with success" )
     else:
       self.log( "Not all actions finished with success" )
+    if run.stopping:
+      self.log( "Workflow was stopped early after a failure, remaining actions were skipped" )
     self.log( f"Finished in {datetime.datetime.now() - start}" )
     self.log( f"Logfiles at {self.log_location}")
     self.log( f"Save file at {self.save_file}" )
-    self.save( action_set )
+    self.save( run.action_set )
+    if run.cache is not None:
+      run.cache.save()
+    if run.file_hashes is not None:
+      self._save_file_hashes( run.file_hashes )
     self.log( f"JUnit file at {self.results_file}" )
     self.save_junit()
     return status
 
+  def _declared_inputs( self, action, dependencies ):
+    # Inputs of an action include the outputs of its dependencies
+    inputs = action.resolve_files( action.input_files, self.working_directory )
+    for dep_action in dependencies.values():
+      inputs.extend( dep_action.resolve_files( dep_action.output_files, self.working_directory ) )
+    return inputs
+
+  def _check_up_to_date( self, host, node, dependencies, file_stats, file_hashes, rebuilt ):
+    # Make-style check of the declared files of this ready action, marking it successful if up to date
+    action = self.actions[node]
+    if len( action.output_files ) == 0:
+      return False
+    if file_hashes is None and any( dep_id in rebuilt for dep_id in dependencies ):
+      return False
+
+    action.__host_info__ = host.info
+    recursive_update( action._dependencies, { id : dep_action.info for id, dep_action in dependencies.items() } )
+    try:
+      outputs = action.resolve_files( action.output_files, self.working_directory )
+      inputs  = self._declared_inputs( action, dependencies )
+    except Exception as e:
+      self.log( f"Could not resolve declared files of Action '{node}', it will run : {e}", level=30 )
+      return False
+    stat_files( outputs + inputs, file_stats )
+
+    if any( file_stats[f] is None for f in outputs ):
+      return False
+    oldest_output = min( file_stats[f][0] for f in outputs )
+    changed = [ f for f in inputs if file_stats[f] is None or file_stats[f][0] > oldest_output ]
+    if file_hashes is not None:
+      recorded = file_hashes.get( node, {} )
+
+      def modified( f ):
+        return (
+            file_stats[f] is None or f not in recorded
+            or recorded[f][0] != file_stats[f][1] or recorded[f][1] != hash_file( f )
+        )
+      changed = [ f for f in changed if modified( f ) ]
+    if len( changed ) > 0:
+      self.log( f"Action '{node}' is out of date with respect to {changed[0]}", level=10 )
+      return False
+
+    action.set_status_success()
+    action.__timestamp__ = datetime.datetime.now().replace( microsecond=0 ).isoformat()
+    action.__time__      = "{:.6f}".format( 0.0 )
+    self.log( f"Action '{node}' is up to date" )
+    return True
+
+  def _record_declared_files( self, node, file_stats, file_hashes, rebuilt ):
+    # After a launch the outputs may have changed, and with hashes the inputs of a success are recorded
+    action = self.actions[node]
+    rebuilt.add( node )
+    dependencies = { dep_id : self.actions[dep_id] for dep_id in action.dependencies }
+    try:
+      outputs = action.resolve_files( action.output_files, self.working_directory )
+      inputs  = self._declared_inputs( action, dependencies )
+    except Exception as e:
+      self.log( f"Could not resolve declared files of Action '{node}' : {e}", level=30 )
+      return
+    for f in outputs:
+      file_stats.pop( f, None )
+
+    if file_hashes is not None and action.status == sane.action.ActionStatus.SUCCESS:
+      stat_files( inputs, file_stats )
+      file_hashes[node] = {
+                            f : [ file_stats[f][1], hash_file( f ) ]
+                            for f in inputs if file_stats[f] is not None
+                            }
+
+  def _save_file_hashes( self, file_hashes ):
+    tmp_file = self.file_hashes_file + ".tmp"
+    with open( tmp_file, "w" ) as f:
+      json.dump( file_hashes, f, indent=2 )
+    os.replace( tmp_file, self.file_hashes_file )
+
+  def _check_result_cache( self, host, node, dependencies, cache, cache_keys ):
+    # Record the cache key of this ready action and restore its results if a previous run matches
+    action = self.actions[node]
+    if not all( dep_id in cache_keys for dep_id in dependencies ):
+      # Some dependency did not run this time around, so this cannot be identical work
+      return False
+
+    action.__host_info__ = host.info
+    recursive_update( action._dependencies, { id : dep_action.info for id, dep_action in dependencies.items() } )
+    dependency_keys = { id : [ cache_keys[id], dep_action.status.value ] for id, dep_action in dependencies.items() }
+    try:
+      key = action.cache_key( self.current_host, host.has_environment( action.environment ), dependency_keys )
+    except Exception as e:
+      self.log( f"Could not compute cache key of Action '{node}', it will not be cached : {e}", level=30 )
+      return False
+    cache_keys[node] = key
+
+    if self.bypass_result_cache:
+      return False
+    results = cache.get( key )
+    if results is None:
+      return False
+    action.results = results
+    self.log( f"Restored results of Action '{node}' from result cache" )
+    return True
+
+  def _notify_complete( self, completed, node, future ):
+    # Called from the worker thread, queue first so that the wake can never be
+    # consumed before this node is available to process
+    completed.put( node )
+    self.__wake__.set()
+
+  def _resource_request_key( self, host, action ):
+    local = not isinstance( host, sane.resources.NonLocalProvider ) or host.launch_local( action )
+    return ( local, str( sorted( action.resources( self.current_host ).items() ) ), action.runtime_estimate )
+
   def load_py_files( self, files : List[str] ):
     """Load the provided list of python files as modules dynamically
 
@@ -918,23 +1629,76 @@ class Orchestrator( opts.OptionLoader ):
 
   def _load_save_dict( self ):
     save_dict = {}
-    if not os.path.isfile( self.save_file ):
+    if not os.path.isfile( self.save_file ) and not os.path.isfile( self.journal_file ):
       self.log( "No previous save file to load" )
       return {}
 
     try:
-      with open( self.save_file, "r" ) as f:
-        save_dict = json.load( f, cls=JSONCDecoder )
+      if self.save_backend == "sqlite":
+        save_dict = self._get_state_db().load_save_dict()
+      else:
+        save_dict = load_save_file( self.save_file )
     except Exception as e:
       self.log( f"Could not open {self.save_file}", level=50 )
       raise e
     return save_dict
 
+  def _get_state_db( self ):
+    # A connection to a removed or replaced database would keep writing to the old file
+    if self._state_db is not None and ( self._state_db.filename != self.save_file or self._state_db.replaced() ):
+      self._close_state_db()
+    if self._state_db is None:
+      self._state_db = state_db.StateDB( self.save_file )
+    return self._state_db
+
+  def _close_state_db( self ):
+    if self._state_db is not None:
+      self._state_db.close()
+      self._state_db = None
+
+  def _save_state_db( self, action_id_list ):
+    host = self.hosts[self.current_host]
+    job_ids = None
+    if isinstance( host, sane.hpc_host.HPCHost ):
+      job_ids = host.job_ids
+    run_info = {
+                "dry_run" : self.dry_run,
+                "host" : self.current_host,
+                "save_location" : self.save_location,
+                "log_location" : self.log_location,
+                "working_directory" : self.working_directory
+                }
+    self._get_state_db().save(
+                              self.__timestamp__,
+                              run_info,
+                              { action : self.actions[action].results for action in action_id_list },
+                              resource_log=host.resource_log,
+                              job_ids=job_ids
+                              )
+
+  def _snapshot_due( self ):
+    if self._journal_size > self.journal_max_size:
+      return True
+    return self._last_snapshot is None or time.monotonic() - self._last_snapshot > self.snapshot_interval
+
   def save( self, action_id_list ):
+    """Write a full snapshot of the workflow cache to :py:attr:`save_file`
+
+    The previous snapshot and any :py:attr:`journal_file` are compacted together
+    with the current results of all actions in ``action_id_list``, after which
+    the journal is cleared. With the ``"sqlite"`` :py:attr:`save_backend` the
+    results are instead written to the database directly.
+    """
     # Only save current session changes
     if "virtual_relaunch" in action_id_list:
       action_id_list = action_id_list.copy()
       action_id_list.remove( "virtual_relaunch" )
+
+    if self.save_backend == "sqlite":
+      self._save_state_db( action_id_list )
+      self._last_snapshot = time.monotonic()
+      return
+
     save_dict = self._load_save_dict()
     save_dict_update = {
                         "actions" :
@@ -949,32 +1713,86 @@ class Orchestrator( opts.OptionLoader ):
                         "resource_usage" : { self.__timestamp__ : { self.current_host : self.hosts[self.current_host].resource_log } }
                       }
     save_dict = recursive_update( save_dict, save_dict_update )
-    with open( self.save_file, "w" ) as f:
+    # Never leave a partially written snapshot behind
+    tmp_file = self.save_file + ".tmp"
+    with open( tmp_file, "w" ) as f:
       json.dump( save_dict, f, indent=2 )
+    os.replace( tmp_file, self.save_file )
+
+    if os.path.isfile( self.journal_file ):
+      os.remove( self.journal_file )
+    self._journal_size  = 0
+    self._last_snapshot = time.monotonic()
+
+  def journal( self, action_id_list ):
+    """Append the current results of only the actions in ``action_id_list`` to :py:attr:`journal_file`
+
+    With the ``"sqlite"`` :py:attr:`save_backend` only these actions are updated in the database.
+    """
+    action_id_list = [ action for action in action_id_list if action != "virtual_relaunch" ]
+    if len( action_id_list ) == 0:
+      return
+
+    if self.save_backend == "sqlite":
+      self._save_state_db( action_id_list )
+      return
+
+    record = { "actions" : { action : self.actions[action].results for action in action_id_list } }
+    with open( self.journal_file, "a" ) as f:
+      f.write( json.dumps( record ) + "\n" )
+      self._journal_size = f.tell()
+
+  def _load_runtimes( self, save_dict ):
+    for action, action_dict in save_dict.get( "actions", {} ).items():
+      if action_dict.get( "time" ) is not None:
+        self.runtimes[action] = float( action_dict["time"] )
+
+  def load_runtimes( self ):
+    """Load only the historical runtimes of actions from the workflow cache into :py:attr:`runtimes`
+
+    This is also done as part of :py:meth:`load`, use this to keep the runtimes
+    when starting a new workflow run without loading the previous state.
+    """
+    if self.save_backend == "sqlite":
+      # Read through a connection of its own, the workflow cache is usually removed right after
+      save_dict = {}
+      if os.path.isfile( self.save_file ):
+        with state_db.StateDB( self.save_file, readonly=True ) as db:
+          save_dict = db.load_save_dict()
+      self._load_runtimes( save_dict )
+    else:
+      self._load_runtimes( self._load_save_dict() )
 
   def load( self, clear_errors=True, clear_failures=True ):
     save_dict = self._load_save_dict()
     if not save_dict:
       return
     self.log( f"Loading save file {self.save_file}" )
+    self._load_runtimes( save_dict )
 
-    self.dry_run = save_dict["dry_run"]
+    # Without a snapshot only the journaled actions are known, keep the current settings
+    self.dry_run = save_dict.get( "dry_run", self.dry_run )
 
-    self._current_host = save_dict["host"]
+    self._current_host = save_dict.get( "host", self._current_host )
 
-    self.save_location = save_dict["save_location"]
-    self.log_location = save_dict["log_location"]
-    self.working_directory = save_dict["working_directory"]
+    self.save_location = save_dict.get( "save_location", self.save_location )
+    self.log_location = save_dict.get( "log_location", self.log_location )
+    self.working_directory = save_dict.get( "working_directory", self.working_directory )
 
-    for action, action_dict in save_dict["actions"].items():
+    backed_up = False
+    for action, action_dict in save_dict.get( "actions", {} ).items():
       if action == "virtual_relaunch":
         continue
 
       if action not in self.actions:
-        tmp = self.save_file + ".backup"
         self.log( f"Loaded action info '{action}' missing from loaded workflow, state will be lost", level=30 )
-        self.log( f"Making a copy of previous save file at '{tmp}'", level=30 )
-        shutil.copy2( self.save_file, tmp )
+        if not backed_up:
+          for save_file in ( self.save_file, self.journal_file ):
+            if os.path.isfile( save_file ):
+              tmp = save_file + ".backup"
+              self.log( f"Making a copy of previous save file at '{tmp}'", level=30 )
+              shutil.copy2( save_file, tmp )
+          backed_up = True
         continue
 
       self.actions[action].results = action_dict
@@ -1026,9 +1844,15 @@ class Orchestrator( opts.OptionLoader ):
         errors += 1
       elif sane.action.ActionStatus( results["status"] ) == sane.action.ActionStatus.FAILURE:
         fail = xmltree.SubElement( node, "failure" )
+        if results.get( "timed_out", False ):
+          fail.set( "message", "Timed out" )
+        elif results.get( "cancelled", False ):
+          fail.set( "message", "Cancelled after a failure" )
         failures += 1
       elif state == sane.action.ActionState.SKIPPED:
         skip = xmltree.SubElement( node, "skipped" )
+        if reason is None and results.get( "cancelled", False ):
+          reason = "Cancelled after a failure"
         if reason is None:
           reason = "Requirements not met"
         skip.set( "message", reason )
@@ -4,6 +4,7 @@ import datetime
 import math
 import operator
 import copy
+import time
 from typing import Dict, List
 
 import sane.logger as logger
@@ -373,11 +374,11 @@ def timelimit_to_timedelta( timelimit ) :
   time_match = _timelimit_regex.match( timelimit )
   if time_match is not None :
     groups = time_match.groupdict()
-    return timedelta(
-                      hours=int( groups["hh"] ),
-                      minutes=int( groups["mm"] ),
-                      seconds=int( groups["ss"] )
-                    )
+    return datetime.timedelta(
+                               hours=int( groups["hh"] ),
+                               minutes=int( groups["mm"] ),
+                               seconds=int( groups["ss"] )
+                             )
   else :
     return None
 
@@ -442,6 +443,11 @@ class ResourceRequestor( opts.OptionLoader ):
     #: this option has no effect.
     self.local = None
 
+    #: Estimated runtime in seconds used by a :py:class:`ResourceProvider` to plan
+    #: :py:meth:`reservations <ResourceProvider.reserve_resources>`. If ``None``,
+    #: a ``"timelimit"`` resource is used instead if requested
+    self.runtime_estimate = None
+
   def resources( self, override : str = None ) -> dict:
     """Return a copy of the current resources requested
 
@@ -563,6 +569,9 @@ class ResourceProvider( opts.OptionLoader ):
     else:
       self._mapper = mapper
     self._resource_log = {}
+    # Amounts acquired and estimated end time of each current requestor
+    self._running      = {}
+    self._reservation  = None
 
   @property
   def resources( self ) -> Dict[str, AcquirableResource]:
@@ -653,6 +662,13 @@ class ResourceProvider( opts.OptionLoader ):
         self.log( f"Resource '{resource}' : {res.total_str} not acquirable right now ({self._resources[resource]})...", level=10 )
       can_aquire = can_aquire and acquirable
 
+    if can_aquire and self._reservation is not None and self._reservation["requestor"] != requestor.logname:
+      amounts = self._request_amounts( mapped_resource_dict )
+      if not self._fits_reservation( amounts, self._estimated_end( mapped_resource_dict, requestor ) ):
+        if log:
+          self.log( f"Resources reserved for '{self._reservation['requestor']}'...", level=10 )
+        can_aquire = False
+
     if log:
       if can_aquire:
         self.log( f"All resources{origin_msg} available", level=10 )
@@ -681,6 +697,18 @@ class ResourceProvider( opts.OptionLoader ):
         self._resources[resource] -= res
         now = datetime.datetime.now().isoformat()
         self._resource_log[resource]["acquire"].append( [ requestor.logname, res.total, now, self._resources[resource].used ] )
+
+      amounts = self._request_amounts( mapped_resource_dict )
+      end = self._estimated_end( mapped_resource_dict, requestor )
+      self._running[requestor.logname] = ( amounts, end )
+      if self._reservation is not None:
+        if self._reservation["requestor"] == requestor.logname:
+          self._reservation = None
+        elif end > self._reservation["start"]:
+          # Backfilled past the reservation start, so this is no longer spare
+          for resource, amount in amounts.items():
+            if resource in self._reservation["spare"]:
+              self._reservation["spare"][resource] -= amount
     else:
       self.log( f"Could not acquire resources{origin_msg}", level=10 )
       self.log_pop()
@@ -717,8 +745,71 @@ class ResourceProvider( opts.OptionLoader ):
         self._resources[resource] += res
         now = datetime.datetime.now().isoformat()
         self._resource_log[resource]["release"].append( [ requestor.logname, res.total, now, self._resources[resource].used ] )
+    self._running.pop( requestor.logname, None )
     self.log_pop()
 
+  def _request_amounts( self, mapped_resource_dict ):
+    amounts = {}
+    for resource, info in mapped_resource_dict.items():
+      if isinstance( info, Resource ):
+        amounts[resource] = info.total
+      elif Resource.is_resource( info ) and resource in self._resources:
+        amounts[resource] = Resource( resource, info, unit=self._resources[resource].unit ).total
+    return amounts
+
+  def _estimated_end( self, mapped_resource_dict, requestor ):
+    estimate = requestor.runtime_estimate
+    if estimate is None and "timelimit" in mapped_resource_dict:
+      timelimit = timelimit_to_timedelta( mapped_resource_dict["timelimit"] )
+      if timelimit is not None:
+        estimate = timelimit.total_seconds()
+    return math.inf if estimate is None else time.monotonic() + estimate
+
+  def _fits_reservation( self, amounts, end ):
+    # EASY backfill : anything may start if it is estimated to finish before the
+    # reservation starts, otherwise it may only use what the reservation leaves spare
+    if end <= self._reservation["start"]:
+      return True
+    spare = self._reservation["spare"]
+    return all( amount <= spare[resource] for resource, amount in amounts.items() if resource in spare )
+
+  def reserve_resources( self, resource_dict : dict, requestor : ResourceRequestor ):
+    """Reserve the resources in the ``resource_dict`` for ``requestor`` at the earliest time they are estimated free
+
+    The start of the reservation is estimated from the
+    :py:attr:`~sane.resources.ResourceRequestor.runtime_estimate` of the current
+    requestors holding resources. Until ``requestor`` acquires the resources or
+    the reservation is cleared, any other request is only available if it is
+    estimated to finish before the reservation starts or only uses resources the
+    reservation leaves spare. Only one reservation is held at a time.
+    """
+    mapped_resource_dict = self.map_resource_dict( resource_dict )
+    amounts = self._request_amounts( mapped_resource_dict )
+    free    = { resource : self._resources[resource].current for resource in amounts }
+    now     = time.monotonic()
+    start   = now
+    running = sorted( self._running.values(), key=lambda entry: entry[1] )
+    while len( running ) > 0 and any( free[resource] < amount for resource, amount in amounts.items() ):
+      released, start = running.pop( 0 )
+      for resource, amount in released.items():
+        if resource in free:
+          free[resource] += amount
+
+    spare = { resource : max( free[resource] - amount, 0 ) for resource, amount in amounts.items() }
+    self._reservation = {
+                          "requestor" : requestor.logname,
+                          "start"     : start,
+                          "spare"     : spare
+                        }
+    if math.isinf( start ):
+      self.log( f"Reserving resources for '{requestor.logname}' until they are available", level=10 )
+    else:
+      self.log( f"Reserving resources for '{requestor.logname}', estimated available in {start - now:.1f}s", level=10 )
+
+  def clear_reservation( self ):
+    """Clear any reservation made with :py:meth:`reserve_resources`"""
+    self._reservation = None
+
   @copydoc( opts.OptionLoader.load_core_options, append=False, module="sane.options" )
   def load_core_options( self, options, origin ):
     """Load the available resources for this :py:class:`~sane.resources.ResourceProvider`
@@ -912,6 +1003,18 @@ class NonLocalProvider( ResourceProvider ):
     else:
       return self.nonlocal_release_resources( resource_dict, requestor )
 
+  def reserve_resources( self, resource_dict : dict, requestor : ResourceRequestor ):
+    """Override base class implementation to reserve local requests in :py:attr:`local_resources`
+
+    Nonlocal requests are left to the scheduling of the nonlocal resources.
+    """
+    if self.launch_local( requestor ):
+      self.local_resources.reserve_resources( resource_dict, requestor )
+
+  def clear_reservation( self ):
+    """Override base class implementation to clear the reservation in :py:attr:`local_resources`"""
+    self.local_resources.clear_reservation()
+
   @abstractmethod
   def nonlocal_resources_available( self, resource_dict, requestor : ResourceRequestor, log=True ):
     """Tell us how to determine if nonlocal resources are available"""
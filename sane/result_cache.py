@@ -0,0 +1,64 @@
+import collections
+import json
+import os
+import time
+
+
+class ResultCache:
+  """Results of successful :py:class:`~sane.Action` runs by :py:meth:`Action.cache_key() <sane.Action.cache_key>`
+
+  Entries are kept in a single JSON file, loaded when created and written back
+  by :py:meth:`save`. Once the stored results grow past :py:attr:`max_size` bytes
+  the least recently used entries are evicted.
+  """
+  def __init__( self, filename : str, max_size : int ):
+    #: JSON file the cache is stored in
+    self.filename = filename
+    #: Size in bytes of the stored results to evict down to
+    self.max_size = max_size
+    # Least recently used first
+    self._entries = collections.OrderedDict()
+    self._size    = 0
+
+    if os.path.isfile( filename ):
+      with open( filename, "r" ) as f:
+        entries = json.load( f )
+      for key, entry in sorted( entries.items(), key=lambda item: item[1]["last_used"] ):
+        self._entries[key] = entry
+        self._size += entry["size"]
+
+  def __len__( self ) -> int:
+    return len( self._entries )
+
+  @property
+  def size( self ) -> int:
+    """Size in bytes of all stored results"""
+    return self._size
+
+  def get( self, key : str ) -> dict:
+    """Return the results stored for ``key`` and mark them as most recently used, or ``None``"""
+    entry = self._entries.get( key )
+    if entry is None:
+      return None
+    entry["last_used"] = time.time()
+    self._entries.move_to_end( key )
+    return entry["results"]
+
+  def put( self, key : str, results : dict ) -> None:
+    """Store ``results`` under ``key``, evicting the least recently used entries if needed"""
+    if key in self._entries:
+      self._size -= self._entries.pop( key )["size"]
+    size = len( json.dumps( results ) )
+    self._entries[key] = { "results" : results, "last_used" : time.time(), "size" : size }
+    self._size += size
+
+    while self._size > self.max_size and len( self._entries ) > 0:
+      self._size -= self._entries.popitem( last=False )[1]["size"]
+
+  def save( self ) -> None:
+    """Write the cache to :py:attr:`filename`"""
+    # Never leave a partially written cache behind
+    tmp_file = self.filename + ".tmp"
+    with open( tmp_file, "w" ) as f:
+      json.dump( self._entries, f )
+    os.replace( tmp_file, self.filename )
@@ -21,6 +21,16 @@ def load( filename ):
   return obj
 
 
+def load_stream( stream ):
+  # Read back one SaveState.dumps() from a binary stream, leaving anything after it
+  state = json.loads( stream.readline() )
+
+  sys.path[:0] = state["import_paths"]
+  importlib.import_module( state["module"] )
+
+  return pickle.load( stream )
+
+
 class SaveState:
   def __init__( self, filename, base, path="./", **kwargs ):
     self._filename      = filename
@@ -49,9 +59,17 @@ class SaveState:
   def save_location( self, path ):
     self._save_location = os.path.abspath( path )
 
+  def _pickle( self ) -> bytes:
+    return pickle.dumps( self )
+
+  def dumps( self ) -> bytes:
+    # Same as save() but in memory, see load_stream()
+    state = { "module" : self.__module__, "import_paths" : self.import_paths }
+    return json.dumps( state ).encode() + b"\n" + self._pickle()
+
   def save( self ):
     with open( self.pickle_file, "wb" ) as f:
-      pickle.dump( self, f )
+      f.write( self._pickle() )
 
     state = { "pickle_file" : self.pickle_file, "module" : self.__module__, "import_paths" : self.import_paths }
     with open( self.save_file, "w" ) as f:
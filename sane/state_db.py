@@ -0,0 +1,236 @@
+import json
+import os
+import sqlite3
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS runs (
+  id                INTEGER PRIMARY KEY AUTOINCREMENT,
+  timestamp         TEXT UNIQUE NOT NULL,
+  host              TEXT,
+  dry_run           INTEGER,
+  save_location     TEXT,
+  log_location      TEXT,
+  working_directory TEXT
+);
+CREATE TABLE IF NOT EXISTS actions (
+  id        TEXT NOT NULL,
+  run       INTEGER REFERENCES runs( id ),
+  state     TEXT,
+  status    TEXT,
+  timestamp TEXT,
+  time      TEXT,
+  results   TEXT,
+  PRIMARY KEY ( id, run )
+);
+CREATE INDEX IF NOT EXISTS actions_state     ON actions( state );
+CREATE INDEX IF NOT EXISTS actions_status    ON actions( status );
+CREATE INDEX IF NOT EXISTS actions_run       ON actions( run );
+CREATE INDEX IF NOT EXISTS actions_timestamp ON actions( timestamp );
+CREATE TABLE IF NOT EXISTS resource_events (
+  run       INTEGER REFERENCES runs( id ),
+  host      TEXT,
+  provider  TEXT,
+  resource  TEXT,
+  unit      TEXT,
+  event     TEXT,
+  requestor TEXT,
+  amount    INTEGER,
+  timestamp TEXT,
+  used      INTEGER
+);
+CREATE INDEX IF NOT EXISTS resource_events_run       ON resource_events( run );
+CREATE INDEX IF NOT EXISTS resource_events_timestamp ON resource_events( timestamp );
+CREATE TABLE IF NOT EXISTS jobs (
+  run    INTEGER REFERENCES runs( id ),
+  action TEXT,
+  host   TEXT,
+  job_id TEXT,
+  PRIMARY KEY ( run, action )
+);
+"""
+
+_run_fields = [ "host", "dry_run", "save_location", "log_location", "working_directory" ]
+
+
+def is_state_db( filename ):
+  """Check if ``filename`` names a :py:class:`StateDB` rather than a JSON workflow cache"""
+  return os.path.splitext( filename )[1] == ".db"
+
+
+def _flatten_resource_log( resource_log, provider="" ):
+  # Providers may nest other providers, the leaves are the per-resource event lists
+  for name, entry in resource_log.items():
+    if "acquire" in entry and "release" in entry:
+      yield provider, name, entry
+    else:
+      yield from _flatten_resource_log( entry, name if provider == "" else f"{provider}/{name}" )
+
+
+class StateDB:
+  """SQLite-backed workflow cache
+
+  Stores the same information as the JSON workflow cache of the :py:class:`~sane.Orchestrator`
+  in indexed tables so that individual actions, runs, resource events, and HPC
+  job ids can be queried without loading the whole history. The results of an
+  action are kept for every run it was part of. The database is used in WAL mode
+  so that readers may watch a running workflow.
+  """
+  def __init__( self, filename, readonly=False ):
+    self.filename = os.path.abspath( filename )
+    if readonly:
+      self._db = sqlite3.connect( f"file:{self.filename}?mode=ro", uri=True )
+    else:
+      self._db = sqlite3.connect( self.filename )
+      self._db.execute( "PRAGMA journal_mode=WAL" )
+      self._db.executescript( _schema )
+    self._inode = os.stat( self.filename ).st_ino
+    self._runs = {}
+    # Number of resource events already stored, keyed by their location in the resource log
+    self._stored_events = {}
+
+  def close( self ):
+    self._db.close()
+
+  def replaced( self ) -> bool:
+    """Check if :py:attr:`filename` was removed or replaced by another file since it was opened"""
+    try:
+      return os.stat( self.filename ).st_ino != self._inode
+    except FileNotFoundError:
+      return True
+
+  def __enter__( self ):
+    return self
+
+  def __exit__( self, *args ):
+    self.close()
+
+  def _run_id( self, timestamp ):
+    if timestamp not in self._runs:
+      row = self._db.execute( "SELECT id FROM runs WHERE timestamp = ?", ( timestamp, ) ).fetchone()
+      if row is None:
+        row = ( self._db.execute( "INSERT INTO runs ( timestamp ) VALUES ( ? )", ( timestamp, ) ).lastrowid, )
+      self._runs[timestamp] = row[0]
+    return self._runs[timestamp]
+
+  def save( self, timestamp, run_info : dict, actions : dict, resource_log : dict = None, job_ids : dict = None ):
+    """Record the results of ``actions`` and any new resource events and job ids for the run at ``timestamp``
+
+    :param run_info:     workflow-level fields of the run (host, locations, dry run)
+    :param actions:      ``dict`` of :py:attr:`Action.results` by :py:attr:`Action.id`
+    :param resource_log: the current host :py:attr:`~sane.resources.ResourceProvider.resource_log`,
+                         only events not yet stored are inserted
+    :param job_ids:      ``dict`` of HPC job ids by :py:attr:`Action.id`
+    """
+    with self._db:
+      run = self._run_id( timestamp )
+      self._db.execute(
+                        "UPDATE runs SET " + ", ".join( f"{field} = ?" for field in _run_fields ) + " WHERE id = ?",
+                        [ run_info.get( field ) for field in _run_fields ] + [ run ]
+                        )
+      rows = [
+              ( id, run, results["state"], results["status"],
+                results.get( "timestamp" ), results.get( "time" ), json.dumps( results ) )
+              for id, results in actions.items()
+              ]
+      self._db.executemany( "INSERT OR REPLACE INTO actions VALUES ( ?, ?, ?, ?, ?, ?, ? )", rows )
+
+      if resource_log is not None:
+        events = []
+        for provider, resource, entry in _flatten_resource_log( resource_log ):
+          for event in ( "acquire", "release" ):
+            key = ( run, run_info.get( "host" ), provider, resource, event )
+            stored = self._stored_events.get( key, 0 )
+            for requestor, amount, event_time, used in entry[event][stored:]:
+              events.append( key + ( entry["unit"], requestor, amount, event_time, used ) )
+            self._stored_events[key] = len( entry[event] )
+        self._db.executemany(
+                              "INSERT INTO resource_events "
+                              "( run, host, provider, resource, event, unit, requestor, amount, timestamp, used ) "
+                              "VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )",
+                              events
+                            )
+
+      if job_ids is not None:
+        jobs = [ ( run, action, run_info.get( "host" ), str( job_id ) ) for action, job_id in job_ids.items() ]
+        self._db.executemany( "INSERT OR REPLACE INTO jobs VALUES ( ?, ?, ?, ? )", jobs )
+
+  def runs( self ) -> list:
+    """Timestamps of all recorded runs, oldest first"""
+    return [ row[0] for row in self._db.execute( "SELECT timestamp FROM runs ORDER BY id" ) ]
+
+  def actions( self, last_run=False, state=None, status=None ) -> dict:
+    """Query the latest results of actions, optionally only those in the last run or with a given ``state``/``status``
+
+    :param last_run: only actions that were part of the last run, with their results from it
+    :return: ``dict`` of :py:attr:`Action.results` by :py:attr:`Action.id`
+    """
+    query = "SELECT id, results FROM actions AS latest"
+    conditions = [ "run = ( SELECT MAX( run ) FROM actions WHERE id = latest.id )" ]
+    values = []
+    if last_run:
+      conditions.append( "run = ( SELECT MAX( id ) FROM runs )" )
+    if state is not None:
+      conditions.append( "state = ?" )
+      values.append( state )
+    if status is not None:
+      conditions.append( "status = ?" )
+      values.append( status )
+    query += " WHERE " + " AND ".join( conditions )
+    return { id : json.loads( results ) for id, results in self._db.execute( query + " ORDER BY rowid", values ) }
+
+  def history( self, action_id ) -> dict:
+    """Results of the action ``action_id`` in every run it was part of
+
+    :return: ``dict`` of :py:attr:`Action.results` by run timestamp, oldest first
+    """
+    rows = self._db.execute(
+                            "SELECT runs.timestamp, results FROM actions JOIN runs ON actions.run = runs.id "
+                            "WHERE actions.id = ? ORDER BY runs.id",
+                            ( action_id, )
+                            )
+    return { timestamp : json.loads( results ) for timestamp, results in rows }
+
+  def job_ids( self, run_timestamp ) -> dict:
+    """HPC job ids of the run at ``run_timestamp`` by :py:attr:`Action.id`"""
+    rows = self._db.execute(
+                            "SELECT action, job_id FROM jobs JOIN runs ON jobs.run = runs.id WHERE runs.timestamp = ?",
+                            ( run_timestamp, )
+                            )
+    return { action : job_id for action, job_id in rows }
+
+  def resource_usage( self, run_timestamp ) -> dict:
+    """Resource log of the run at ``run_timestamp``, laid out as the JSON workflow cache ``"resource_usage"``"""
+    usage = {}
+    rows = self._db.execute(
+                            "SELECT host, provider, resource, unit, event, requestor, amount, "
+                            "resource_events.timestamp, used "
+                            "FROM resource_events JOIN runs ON resource_events.run = runs.id "
+                            "WHERE runs.timestamp = ? ORDER BY resource_events.rowid",
+                            ( run_timestamp, )
+                            )
+    for host, provider, resource, unit, event, requestor, amount, timestamp, used in rows:
+      entry = usage.setdefault( host, {} )
+      if provider != "":
+        for name in provider.split( "/" ):
+          entry = entry.setdefault( name, {} )
+      entry = entry.setdefault( resource, { "acquire" : [], "release" : [], "unit" : unit } )
+      entry[event].append( [ requestor, amount, timestamp, used ] )
+    return usage
+
+  def load_save_dict( self, resource_usage=False ) -> dict:
+    """Rebuild the workflow cache ``dict`` as it would appear in the JSON workflow cache
+
+    :param resource_usage: also load the resource usage of every run, which
+                           may be large and is not needed to resume a workflow
+    """
+    row = self._db.execute( "SELECT " + ", ".join( _run_fields ) + " FROM runs ORDER BY id DESC LIMIT 1" ).fetchone()
+    if row is None:
+      return {}
+
+    save_dict = dict( zip( _run_fields, row ) )
+    save_dict["dry_run"] = bool( save_dict["dry_run"] )
+    save_dict["actions"] = self.actions()
+    if resource_usage:
+      save_dict["resource_usage"] = { timestamp : self.resource_usage( timestamp ) for timestamp in self.runs() }
+    return save_dict
@@ -0,0 +1,233 @@
+import asyncio
+import collections
+import concurrent.futures
+import sys
+import threading
+import time
+
+
+class WorkerPool:
+  """Thread pool that only creates workers on demand and reaps them once idle
+
+  Provides the :py:meth:`submit` and :py:meth:`shutdown` interface of a
+  :external:py:class:`concurrent.futures.ThreadPoolExecutor`. A new worker is
+  started only when work is queued and no idle worker is available, up to
+  :py:attr:`max_workers`. Workers with nothing to do for :py:attr:`idle_timeout`
+  seconds exit. Workers are named ``"<thread_name_prefix>_<n>"`` where ``n`` is
+  the lowest number not in use by another live worker.
+
+  Queue depth and busy time are tracked for :py:meth:`statistics`.
+  """
+  def __init__( self, max_workers : int, idle_timeout : float = 5.0, thread_name_prefix : str = "thread" ):
+    if max_workers <= 0:
+      raise ValueError( "max_workers must be greater than 0" )
+    #: Maximum number of concurrently live worker threads
+    self.max_workers  = max_workers
+    #: Seconds a worker may wait for work before exiting
+    self.idle_timeout = idle_timeout
+    self._prefix      = thread_name_prefix
+
+    self._queue    = collections.deque()
+    self._cond     = threading.Condition()
+    self._workers  = {}
+    self._idle     = 0
+    self._shutdown = False
+
+    self._start        = time.monotonic()
+    self._submitted    = 0
+    self._started      = 0
+    self._peak_workers = 0
+    self._peak_queue   = 0
+    self._busy_time    = 0.0
+    self._wait_time    = 0.0
+
+  @property
+  def num_workers( self ) -> int:
+    """Number of currently live worker threads"""
+    with self._cond:
+      return len( self._workers )
+
+  def submit( self, fn, *args, **kwargs ) -> concurrent.futures.Future:
+    """Schedule ``fn( *args, **kwargs )`` to run on a worker
+
+    :return: a :external:py:class:`concurrent.futures.Future` of the call
+    """
+    future = concurrent.futures.Future()
+    with self._cond:
+      if self._shutdown:
+        raise RuntimeError( "cannot schedule new futures after shutdown" )
+      self._queue.append( ( future, fn, args, kwargs, time.monotonic() ) )
+      self._submitted += 1
+      self._peak_queue = max( self._peak_queue, len( self._queue ) )
+      if self._idle < len( self._queue ) and len( self._workers ) < self.max_workers:
+        self._spawn()
+      else:
+        self._cond.notify()
+    return future
+
+  def shutdown( self, wait=True ):
+    """Stop accepting work, letting workers exit once the queue is drained
+
+    :param wait: block until all workers have exited
+    """
+    with self._cond:
+      self._shutdown = True
+      self._cond.notify_all()
+      workers = list( self._workers.values() )
+    if wait:
+      for worker in workers:
+        worker.join()
+
+  def statistics( self ) -> dict:
+    """Usage of this pool since it was created
+
+    * ``"submitted"`` - number of calls submitted
+    * ``"threads_started"`` - number of worker threads created, including replacements of reaped workers
+    * ``"peak_workers"`` - most worker threads alive at once
+    * ``"peak_queue_depth"`` - most calls waiting for a worker at once
+    * ``"mean_queue_wait"`` - average seconds a call waited for a worker
+    * ``"utilization"`` - fraction of :py:attr:`max_workers` worker time spent running calls
+    """
+    with self._cond:
+      elapsed = max( time.monotonic() - self._start, 1e-9 )
+      return {
+              "submitted"        : self._submitted,
+              "threads_started"  : self._started,
+              "peak_workers"     : self._peak_workers,
+              "peak_queue_depth" : self._peak_queue,
+              "mean_queue_wait"  : self._wait_time / max( self._submitted, 1 ),
+              "utilization"      : self._busy_time / ( elapsed * self.max_workers )
+              }
+
+  def _spawn( self ):
+    # Called with the condition held
+    number = next( n for n in range( self.max_workers ) if n not in self._workers )
+    worker = threading.Thread( target=self._work, args=( number, ), name=f"{self._prefix}_{number}" )
+    self._workers[number] = worker
+    self._started += 1
+    self._peak_workers = max( self._peak_workers, len( self._workers ) )
+    worker.start()
+
+  def _work( self, number ):
+    while True:
+      with self._cond:
+        self._idle += 1
+        deadline = time.monotonic() + self.idle_timeout
+        while len( self._queue ) == 0 and not self._shutdown:
+          remaining = deadline - time.monotonic()
+          if remaining <= 0:
+            break
+          self._cond.wait( remaining )
+        self._idle -= 1
+
+        if len( self._queue ) == 0:
+          # Idle for too long or shutting down with nothing left to do
+          del self._workers[number]
+          return
+
+        future, fn, args, kwargs, queued = self._queue.popleft()
+        self._wait_time += time.monotonic() - queued
+
+      if not future.set_running_or_notify_cancel():
+        continue
+
+      start = time.monotonic()
+      try:
+        result = fn( *args, **kwargs )
+      except BaseException as e:
+        exception = e
+      else:
+        exception = None
+      with self._cond:
+        self._busy_time += time.monotonic() - start
+
+      # Account for the time first as done callbacks may immediately read the statistics
+      if exception is None:
+        future.set_result( result )
+      else:
+        future.set_exception( exception )
+        del exception
+
+
+class EventLoopThread:
+  """Run coroutines on an :external:py:mod:`asyncio` event loop owned by a single dedicated thread
+
+  Provides the same :py:meth:`submit` and :py:meth:`shutdown` interface as
+  :py:class:`WorkerPool`, except that :py:meth:`submit` takes a coroutine function.
+  Any number of coroutines may be in flight at once without each holding a thread.
+  """
+  def __init__( self, thread_name : str = "async" ):
+    self._loop = asyncio.new_event_loop()
+    if sys.version_info < ( 3, 8 ) and threading.current_thread() is threading.main_thread():
+      # Older child watchers only reap subprocesses for the loop they are attached to
+      asyncio.get_child_watcher().attach_loop( self._loop )
+
+    self._lock     = threading.Lock()
+    self._pending  = set()
+    self._shutdown = False
+
+    self._submitted    = 0
+    self._running      = 0
+    self._peak_running = 0
+
+    self._thread = threading.Thread( target=self._run, name=thread_name )
+    self._thread.start()
+
+  def _run( self ):
+    asyncio.set_event_loop( self._loop )
+    try:
+      self._loop.run_forever()
+    finally:
+      self._loop.close()
+
+  async def _track( self, coroutine ):
+    with self._lock:
+      self._running += 1
+      self._peak_running = max( self._peak_running, self._running )
+    try:
+      return await coroutine
+    finally:
+      with self._lock:
+        self._running -= 1
+
+  def submit( self, fn, *args, **kwargs ) -> concurrent.futures.Future:
+    """Schedule the coroutine ``fn( *args, **kwargs )`` on the event loop
+
+    :return: a :external:py:class:`concurrent.futures.Future` of the coroutine result
+    """
+    with self._lock:
+      if self._shutdown:
+        raise RuntimeError( "cannot schedule new futures after shutdown" )
+      self._submitted += 1
+      future = asyncio.run_coroutine_threadsafe( self._track( fn( *args, **kwargs ) ), self._loop )
+      self._pending.add( future )
+    future.add_done_callback( self._done )
+    return future
+
+  def _done( self, future ):
+    with self._lock:
+      self._pending.discard( future )
+      if self._shutdown and len( self._pending ) == 0:
+        self._loop.call_soon_threadsafe( self._loop.stop )
+
+  def shutdown( self, wait=True ):
+    """Stop accepting work, stopping the event loop once all submitted coroutines finish
+
+    :param wait: block until the event loop thread has exited
+    """
+    with self._lock:
+      if not self._shutdown:
+        self._shutdown = True
+        if len( self._pending ) == 0:
+          self._loop.call_soon_threadsafe( self._loop.stop )
+    if wait:
+      self._thread.join()
+
+  def statistics( self ) -> dict:
+    """Usage of this event loop since it was created
+
+    * ``"submitted"`` - number of coroutines submitted
+    * ``"peak_running"`` - most coroutines in flight at once
+    """
+    with self._lock:
+      return { "submitted" : self._submitted, "peak_running" : self._peak_running }
@@ -1,6 +1,9 @@
 import unittest
+import concurrent.futures
 import os
+import shutil
 import sys
+import tempfile
 
 import sane
 
@@ -15,6 +18,11 @@ class MyAction( sane.Action ):
     return 0
 
 
+class NoLaunchAction( sane.Action ):
+  def pre_launch( self ):
+    return False
+
+
 class ActionTests( unittest.TestCase ):
   def setUp( self ):
     self.action = sane.Action( "test" )
@@ -103,6 +111,84 @@ class ActionTests( unittest.TestCase ):
 
     self.remove_save_files( host )
 
+  def test_action_execute_subprocess_output( self ):
+    """Test that chunked command output is kept intact while only the latest lines of chatty commands are logged"""
+    tmpdir = tempfile.mkdtemp()
+    action = sane.Action( "chatty" )
+    action.log_location = tmpdir
+    action.setup_logs()
+    script = "import sys; sys.stdout.write( ''.join( f'line {i}\\n' for i in range( 20000 ) ) + 'no newline' )"
+    expected = "".join( f"line {i}\n" for i in range( 20000 ) ) + "no newline"
+    try:
+      retval, content = action.execute_subprocess(
+                                                  sys.executable,
+                                                  [ "-c", script ],
+                                                  logfile=action.runlog,
+                                                  capture=True,
+                                                  verbose=True
+                                                  )
+      self.assertEqual( retval, 0 )
+      self.assertEqual( content, expected )
+      with open( action.runlog, "r" ) as f:
+        self.assertEqual( f.read(), expected )
+      with open( action.logfile, "r" ) as f:
+        log = f.read()
+      self.assertIn( "lines not shown, see " + action.runlog, log )
+      self.assertIn( "line 19999\n", log )
+      self.assertIn( "no newline", log )
+      self.assertLess( log.count( "\n" ), 20000 )
+    finally:
+      for handler in action.logger.handlers:
+        handler.close()
+      action.logger.handlers.clear()
+      shutil.rmtree( tmpdir )
+
+  def test_action_output_capture( self ):
+    """Test that only the tail of the output is kept in memory or that it is referenced in the runlog"""
+    tmpdir = tempfile.mkdtemp()
+    action = sane.Action( "capture" )
+    action.log_location = tmpdir
+    action.setup_logs()
+    script = "import sys; sys.stdout.write( ''.join( f'line {i}\\n' for i in range( 20000 ) ) )"
+    expected = "".join( f"line {i}\n" for i in range( 20000 ) )
+    try:
+      action.output_capture = "tail"
+      action.output_capture_size = 1024
+      retval, content = action.execute_subprocess(
+                                                  sys.executable,
+                                                  [ "-c", script ],
+                                                  logfile=action.runlog,
+                                                  capture=action._launch_capture()
+                                                  )
+      self.assertEqual( retval, 0 )
+      self.assertLessEqual( len( content ), 1024 )
+      self.assertTrue( expected.endswith( content ) )
+      self.assertTrue( content.startswith( "line " ) )
+      self.assertEqual( action._launch_content( content, None ), content )
+
+      action.output_capture = "file"
+      retval, content = action.execute_subprocess(
+                                                  sys.executable,
+                                                  [ "-c", script ],
+                                                  logfile=action.runlog,
+                                                  capture=action._launch_capture()
+                                                  )
+      self.assertEqual( retval, 0 )
+      self.assertIsNone( content )
+      content = action._launch_content( content, None )
+      self.assertIsInstance( content, sane.action.OutputReference )
+      self.assertEqual( str( content ), expected )
+      self.assertEqual( content.tail( 10 ), "line 19999\n"[-10:] )
+
+      action.output_capture = "bogus"
+      with self.assertRaises( ValueError ):
+        action._launch_capture()
+    finally:
+      for handler in action.logger.handlers:
+        handler.close()
+      action.logger.handlers.clear()
+      shutil.rmtree( tmpdir )
+
   def test_action_external_definition( self ):
     """Test the ability to pickle an derived type action and relaunch it"""
     test_str = "MyAction will do as it pleases"
@@ -205,3 +291,46 @@ class ActionTests( unittest.TestCase ):
     exp_str = "1"
     out_str = self.action.dereference_str( ref_str )
     self.assertEqual( exp_str, out_str )
+
+  def test_action_launch_batch_skipped( self ):
+    """Test that batched actions keep their own output and return value when an earlier one does not launch"""
+    for skip in ( "cancelled", "pre_launch" ):
+      with self.subTest( skip=skip ):
+        tmpdir = tempfile.mkdtemp()
+        host = sane.Host( "basic" )
+        host.add_environment( sane.Environment( "also_basic" ) )
+        host.default_env = "also_basic"
+        host.save_location = tmpdir
+        host.save()
+
+        actions = []
+        for i in range( 3 ):
+          action_type = NoLaunchAction if i == 0 and skip == "pre_launch" else sane.Action
+          action = action_type( f"batched_{i}" )
+          action.save_location = tmpdir
+          action.log_location  = tmpdir
+          action.setup_logs()
+          action.__host_info__["file"] = host.save_file
+          action.config["command"] = "sh"
+          action.config["arguments"] = [ "-c", f"echo output of {i}; exit {i}" ]
+          actions.append( action )
+        futures = [ concurrent.futures.Future() for action in actions ]
+        if skip == "cancelled":
+          futures[0].cancel()
+
+        try:
+          sane.action.launch_batch( actions, tmpdir, futures )
+          if skip == "pre_launch":
+            self.assertIsInstance( futures[0].exception(), AssertionError )
+          for i in ( 1, 2 ):
+            self.assertEqual( futures[i].result()[0], i )
+            with open( actions[i].runlog, "r" ) as f:
+              runlog = f.read()
+            self.assertIn( f"output of {i}", runlog )
+            self.assertNotIn( f"output of {3 - i}", runlog )
+        finally:
+          for action in actions:
+            for handler in action.logger.handlers:
+              handler.close()
+            action.logger.handlers.clear()
+          shutil.rmtree( tmpdir )
@@ -1,6 +1,7 @@
+import random
 import unittest
 
-from sane.dag import DAG
+from sane.dag import DAG, CompactDAG
 from sane.dagvis import visualize as dagvis
 
 
@@ -12,13 +13,13 @@ class DagTests( unittest.TestCase ):
   def dag_valid( self, nodes, valid ):
     self.assertTrue( valid )
     for node in nodes:
-      self.assertIn( node, self.dag._nodes )
-    self.assertEqual( len( nodes ), len( self.dag._nodes ) )
+      self.assertIn( node, self.dag )
+    self.assertEqual( len( nodes ), len( self.dag ) )
 
   def dag_invalid( self, nodes, valid ):
     self.assertFalse( valid )
     # This cannot be tested like so since all nodes may be problematic
-    # self.assertNotEqual( len( nodes ), len( self.dag._nodes ) )
+    # self.assertNotEqual( len( nodes ), len( self.dag ) )
 
   def validate_traversal( self, traversal_list, expected ):
     step     = 0
@@ -156,7 +157,7 @@ class DagTests( unittest.TestCase ):
     # the total nodes
     print( traversal_list )
     self.assertEqual( len( traversal_list ), 4 )
-    self.assertEqual( len( [ node for node_list in traversal_list for node in node_list ] ), len( self.dag._nodes ) )
+    self.assertEqual( len( [ node for node_list in traversal_list for node in node_list ] ), len( self.dag ) )
 
   def test_dag_5node_acyclic_traversal_list( self ):
     """A valid DAG consisting of 5 nodes and walking the traversal one node at a time
@@ -182,7 +183,7 @@ class DagTests( unittest.TestCase ):
     self.test_dag_5node_acyclic_traversal_to_end()
     # Get traversal_list
     traversal_list = self.dag.traversal_list( [ "e" ] )
-    self.assertEqual( len( traversal_list ), len( self.dag._nodes ) )
+    self.assertEqual( len( traversal_list ), len( self.dag ) )
 
     expected = self.dag.traversal_to( [ "e" ] )
     self.validate_traversal( traversal_list, expected )
@@ -224,19 +225,19 @@ class DagTests( unittest.TestCase ):
     self.dag.add_edge( "i", "j" )
 
     traversal_list = self.dag.traversal_list( [ "l" ] )
-    self.assertNotEqual( len( traversal_list ), len( self.dag._nodes ) )
+    self.assertNotEqual( len( traversal_list ), len( self.dag ) )
 
     expected = [ [ "a", "f", "i" ], [ "b", "c", "g" ], [ "d", "e" ], [ "l" ] ]
     self.validate_traversal( traversal_list, expected )
 
     traversal_list = self.dag.traversal_list( [ "m" ] )
-    self.assertNotEqual( len( traversal_list ), len( self.dag._nodes ) )
+    self.assertNotEqual( len( traversal_list ), len( self.dag ) )
 
     expected = [ [ "a", "f", "i" ], [ "c", "g", "j" ], [ "e", "h" ], [ "m" ] ]
     self.validate_traversal( traversal_list, expected )
 
     traversal_list = self.dag.traversal_list( [ "n" ] )
-    self.assertNotEqual( len( traversal_list ), len( self.dag._nodes ) )
+    self.assertNotEqual( len( traversal_list ), len( self.dag ) )
 
     expected = [ [ "f", "i" ], [ "g", "j" ], [ "h", "k" ], [ "n" ] ]
     self.validate_traversal( traversal_list, expected )
@@ -253,3 +254,103 @@ class DagTests( unittest.TestCase ):
     self.dag.add_edge( 2, 3 )
     self.dag.add_edge( 2, 4 )
     print( dagvis( self.dag, [ 3, 4, 5 ] ) )
+
+  def test_dag_next_nodes_insertion_order( self ):
+    """Ready nodes are always returned in order of node insertion regardless of when they became ready"""
+    for node in [ "d", "c", "b", "a", "e" ]:
+      self.dag.add_node( node )
+    self.dag.add_edge( "a", "e" )
+    self.dag.add_edge( "e", "c" )
+    self.dag.add_edge( "e", "d" )
+    self.dag.add_edge( "b", "d" )
+
+    traversal_list = self.dag.traversal_list( [ "c", "d" ] )
+    self.assertEqual( self.dag.get_next_nodes( traversal_list ), [ "b", "a" ] )
+    # Copies keep their own ready nodes
+    copied = traversal_list.copy()
+    self.dag.node_complete( "a", traversal_list )
+    self.assertEqual( self.dag.get_next_nodes( copied ), [] )
+    self.assertEqual( self.dag.get_next_nodes( traversal_list ), [ "e" ] )
+    self.dag.node_complete( "b", traversal_list )
+    self.dag.node_complete( "e", traversal_list )
+    self.assertEqual( self.dag.get_next_nodes( traversal_list ), [ "d", "c" ] )
+    self.assertEqual( traversal_list, {} )
+
+    # Plain dicts are still supported
+    traversal_list = dict( self.dag.traversal_list( [ "c", "d" ] ) )
+    self.assertEqual( self.dag.get_next_nodes( traversal_list ), [ "b", "a" ] )
+
+  @staticmethod
+  def reference_traversal_to( dag, nodes ):
+    # Original level-by-level walk kept to validate traversal_to against
+    traversal  = []
+    next_nodes = nodes.copy()
+    while len( next_nodes ) > 0:
+      current = next_nodes.copy()
+      next_nodes.clear()
+      visited = []
+      while len( current ) > 0:
+        key = current.pop()
+        next_nodes.extend( dag.parents( key ) )
+        visited.append( key )
+      traversal.append( list( set( visited ) ) )
+
+    for i in reversed( range( 0, len( traversal ) ) ):
+      for key in traversal[i]:
+        for j in range( 0, i ):
+          if key in traversal[j]:
+            traversal[j].remove( key )
+    return list( reversed( traversal ) )
+
+  def test_dag_traversal_to_random( self ):
+    """The traversal of random DAGs matches the original level-by-level walk"""
+    rng = random.Random( 1234 )
+    for trial in range( 200 ):
+      self.dag.clear()
+      nnodes = rng.randint( 1, 24 )
+      density = rng.random() * 0.4
+      for i in range( nnodes ):
+        self.dag.add_node( i )
+        for parent in range( i ):
+          if rng.random() < density:
+            self.dag.add_edge( parent, i )
+
+      nodes = rng.sample( range( nnodes ), rng.randint( 1, min( 4, nnodes ) ) )
+      expected = self.reference_traversal_to( self.dag, nodes )
+      traversal = self.dag.traversal_to( nodes )
+      self.assertEqual( [ sorted( level ) for level in traversal ], [ sorted( level ) for level in expected ] )
+      self.assertEqual(
+                        self.dag.traversal_list( nodes ),
+                        { key : len( self.dag.parents( key ) ) for level in expected for key in level }
+                        )
+
+  def test_dag_incremental_order( self ):
+    """The topological order stays valid as edges are added in any order and cycles are found on insertion"""
+    rng = random.Random( 4321 )
+    for trial in range( 100 ):
+      self.dag.clear()
+      nnodes = rng.randint( 1, 24 )
+      edges = [ ( p, c ) for c in range( nnodes ) for p in range( c ) if rng.random() < 0.2 ]
+      rng.shuffle( edges )
+      for node in rng.sample( range( nnodes ), nnodes ):
+        self.dag.add_node( node )
+      for parent, child in edges:
+        self.dag.add_edge( parent, child )
+        nodes, valid = self.dag.topological_sort()
+        self.dag_valid( nodes, valid )
+        position = { node : i for i, node in enumerate( nodes ) }
+        for p, c in edges[:edges.index( ( parent, child ) ) + 1]:
+          self.assertLess( position[p], position[c] )
+
+      if len( edges ) > 0:
+        parent, child = rng.choice( edges )
+        self.dag.add_edge( child, parent )
+        self.assertFalse( self.dag.valid )
+        nodes, valid = self.dag.topological_sort()
+        self.dag_invalid( nodes, valid )
+
+
+class CompactDagTests( DagTests ):
+  """Run all DAG tests against the compact integer-indexed backend"""
+  def setUp( self ):
+    self.dag = CompactDAG()
@@ -72,3 +72,20 @@ class EnvironmentTests( unittest.TestCase ):
     self.assertIn( "foo", self.environment.aliases )
     self.assertIn( "bar", self.environment.aliases )
     self.assertEqual( os.environ["foo"], "1:3" )
+
+  def test_environment_precompute_env( self ):
+    """Test the environment setup can be computed ahead of time only from env var commands"""
+    base = sane.Environment( "base" )
+    base.setup_env_vars( "set", "PRECOMPUTED_VARIABLE", "/base/" )
+    self.environment._base = base
+    self.environment.setup_env_vars( "append", "PRECOMPUTED_VARIABLE", "/usr/yesbin/" )
+    self.environment.setup_env_vars( "unset", "PRECOMPUTED_UNSET" )
+
+    env = dict( os.environ.copy() )
+    precomputed = self.environment.precompute_env( { "PRECOMPUTED_UNSET" : "1", "KEPT" : "2" } )
+    self.assertEqual( env, dict( os.environ.copy() ) )
+    self.assertEqual( precomputed, { "PRECOMPUTED_VARIABLE" : "/base/:/usr/yesbin/", "KEPT" : "2" } )
+
+    # Anything that must run in the action process cannot be precomputed
+    base.setup_lmod_cmds( "load", "gcc" )
+    self.assertIsNone( self.environment.precompute_env( {} ) )
@@ -10,3 +10,11 @@ class HostTests( unittest.TestCase ):
   def test_host_standalone( self ):
     """Ensure that a host can be created standalone"""
     pass
+
+  def test_host_max_workers( self ):
+    """Test the host worker limit defaults from its cpus resource and can be set from options"""
+    self.assertGreaterEqual( self.host.max_workers, 1 )
+    self.host.add_resources( { "cpus" : 12 } )
+    self.assertEqual( self.host.max_workers, 12 )
+    self.host.load_options( { "max_workers" : 3 }, origin="test" )
+    self.assertEqual( self.host.max_workers, 3 )
@@ -0,0 +1,131 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+import sane
+import sane.logger as slogger
+
+
+class LoggerTests( unittest.TestCase ):
+  def setUp( self ):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown( self ):
+    slogger.stop_listener()
+    shutil.rmtree( self.tmpdir )
+
+  def test_logger_listener( self ):
+    """Test that records queued from many threads are all written in order with their own indentation"""
+    actions = [ sane.Action( f"listener_{i}" ) for i in range( 4 ) ]
+    for action in actions:
+      action.log_location = self.tmpdir
+      action.setup_logs()
+
+    def work( action ):
+      for i in range( 200 ):
+        action.log_push()
+        action.log( f"message {i}" )
+        action.log_pop()
+
+    slogger.start_listener()
+    threads = [ threading.Thread( target=work, args=( action, ) ) for action in actions ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    slogger.stop_listener()
+    self.assertTrue( slogger.log_queue.empty() )
+
+    try:
+      for action in actions:
+        with open( action.logfile, "r" ) as f:
+          lines = f.read().splitlines()
+        self.assertEqual( len( lines ), 200 )
+        for i, line in enumerate( lines ):
+          self.assertIn( f"[{action.id}]", line )
+          self.assertTrue( line.endswith( f"   message {i}" ) )
+    finally:
+      for action in actions:
+        for handler in action.logger.handlers:
+          handler.close()
+        action.logger.handlers.clear()
+
+  def test_logger_formatter_dispatch( self ):
+    """Test that the longest matching logger name pattern picks the formatter and filtered messages are never built"""
+    raw = slogger.logging.LogRecord( "sane.action.test.raw", slogger.STDOUT, "", 0, "raw output", None, None )
+    act = slogger.logging.LogRecord( "sane.action.test", slogger.STDOUT, "", 0, "action output", None, None )
+    for _ in range( 2 ):
+      self.assertEqual( slogger.log_formatter.format( raw ), "raw output" )
+      self.assertRegex( slogger.log_formatter.format( act ), r"STDOUT\s+action output$" )
+    self.assertIn( "sane.action.test.raw", slogger.log_formatter._cache )
+
+    class Unprintable:
+      def __str__( self ):
+        raise AssertionError( "Filtered message was built" )
+
+    action = sane.Action( "filtered" )
+    action.log( Unprintable(), level=10 )
+
+  def test_logger_records( self ):
+    """Test that records keep the file and line they were logged from and the values logged at the time"""
+    records = []
+
+    class Collect( slogger.logging.Handler ):
+      def emit( self, record ):
+        records.append( record )
+
+    handler = Collect()
+    slogger.logger.addHandler( handler )
+    try:
+      log = slogger.Logger( "records" )
+      outputs = { "value" : 1 }
+      for listener in ( False, True ):
+        if listener:
+          slogger.start_listener()
+        log.log( "outputs", outputs )
+        line = sys._getframe().f_lineno - 1
+        outputs["value"] += 1
+        slogger.stop_listener()
+      self.assertEqual( len( records ), 2 )
+      for value, record in enumerate( records, start=1 ):
+        self.assertEqual( record.pathname, __file__ )
+        self.assertEqual( record.lineno, line )
+        self.assertEqual( record.funcName, "test_logger_records" )
+        self.assertTrue( record.getMessage().endswith( f"outputs {{'value': {value}}}" ) )
+    finally:
+      slogger.logger.removeHandler( handler )
+
+  def test_logger_file_pool( self ):
+    """Test that logfiles are only created once written to and that only a bounded number stay open"""
+    actions = [ sane.Action( f"pooled_{i}" ) for i in range( 6 ) ]
+    for action in actions:
+      action.log_location = self.tmpdir
+      action.setup_logs()
+    self.assertEqual( os.listdir( self.tmpdir ), [] )
+
+    max_open = slogger.log_file_pool.max_open
+    slogger.log_file_pool.max_open = 2
+    try:
+      for i in range( 3 ):
+        for action in actions[:-1]:
+          action.log( f"message {i}" )
+          self.assertLessEqual( len( slogger.log_file_pool ), 2 )
+      slogger.log_file_pool.close_all()
+      self.assertEqual( len( slogger.log_file_pool ), 0 )
+
+      for action in actions[:-1]:
+        with open( action.logfile, "r" ) as f:
+          lines = f.read().splitlines()
+        self.assertEqual( len( lines ), 3 )
+        for i, line in enumerate( lines ):
+          self.assertTrue( line.endswith( f"message {i}" ) )
+      self.assertFalse( os.path.exists( actions[-1].logfile ) )
+    finally:
+      slogger.log_file_pool.max_open = max_open
+      for action in actions:
+        for handler in action.logger.handlers:
+          handler.close()
+        action.logger.handlers.clear()
@@ -1,5 +1,9 @@
 import unittest
 import os
+import re
+import shutil
+import tempfile
+import time
 
 import sane
 
@@ -13,6 +17,13 @@ class OrchestratorTests( unittest.TestCase ):
   def setUp( self ):
     self.orch = sane.Orchestrator()
     self.root = os.path.abspath( os.path.join( os.path.dirname( __file__ ), ".." ) )
+    self.tmpdir = tempfile.mkdtemp()
+    self.cwd    = os.getcwd()
+
+  def tearDown( self ):
+    # Running actions may change the working directory
+    os.chdir( self.cwd )
+    shutil.rmtree( self.tmpdir )
 
   def test_orchestrator_standalone( self ):
     """Ensure that an environment can be created standalone"""
@@ -77,3 +88,519 @@ class OrchestratorTests( unittest.TestCase ):
     self.orch.load_options( { "patches" : { "actions" : { "unique_action_config" : { "environment" : "soup" } } } } )
     self.orch.process_patches()
     self.assertEqual( "soup", self.orch.actions["unique_action_config"].environment )
+
+  def _dummy_orchestrator( self, **attributes ):
+    # Fresh orchestrator for running actions locally, saving and logging into the test directory
+    self.orch = sane.Orchestrator()
+    for name, value in attributes.items():
+      setattr( self.orch, name, value )
+    self.orch.save_location = f"{self.tmpdir}/tmp"
+    self.orch.log_location  = f"{self.tmpdir}/log"
+    os.makedirs( self.orch.log_location, exist_ok=True )
+    self.orch.add_host( sane.Host( "dummy", aliases=[ "" ] ) )
+    self.orch.hosts["dummy"].add_environment( sane.Environment( "generic" ) )
+    self.orch.hosts["dummy"].default_env = "generic"
+    return self.orch
+
+  def _run_dependencies( self, **attributes ):
+    # Returns the files saved by the run
+    self._dummy_orchestrator( **attributes )
+    for id, command, deps in (
+                              ( "a", "true", [] ),
+                              ( "b", "true", [ "a" ] ),
+                              ( "c", "false", [ "a" ] ),
+                              ( "d", "true", [ "b", "c" ] ),
+                              ( "e", "true", [ ( "c", "afternotok" ) ] )
+                              ):
+      action = sane.Action( id )
+      action.config["command"] = command
+      action.add_dependencies( *deps )
+      self.orch.add_action( action )
+
+    success = self.orch.run_actions( [ "d", "e" ], as_host="dummy" )
+    saved_files = sorted( os.listdir( self.orch.save_location ) )
+
+    self.assertFalse( success )
+    self.assertEqual( self.orch.actions["a"].status, sane.ActionStatus.SUCCESS )
+    self.assertEqual( self.orch.actions["b"].status, sane.ActionStatus.SUCCESS )
+    self.assertEqual( self.orch.actions["c"].status, sane.ActionStatus.FAILURE )
+    self.assertEqual( self.orch.actions["d"].state, sane.ActionState.SKIPPED )
+    self.assertEqual( self.orch.actions["e"].status, sane.ActionStatus.SUCCESS )
+    return saved_files
+
+  def test_orchestrator_run_actions_dependencies( self ):
+    """Test that completed actions release only their dependents in the run loop"""
+    self._run_dependencies()
+
+  def test_orchestrator_run_actions_blocked( self ):
+    """Test that actions blocked on resources are only retried once resources are released"""
+    self._dummy_orchestrator()
+    self.orch.hosts["dummy"].add_resources( { "cpus" : 1 } )
+    for i in range( 6 ):
+      action = sane.Action( f"blocked_{i}" )
+      action.config["command"] = "sleep"
+      action.config["arguments"] = [ "0.1" ]
+      action.add_resource_requirements( { "cpus" : 1 } )
+      self.orch.add_action( action )
+
+    attempts = []
+    acquire_and_launch = self.orch._acquire_and_launch
+
+    def attempt( run, node, dependencies, batches ):
+      attempts.append( node )
+      acquire_and_launch( run, node, dependencies, batches )
+
+    self.orch._acquire_and_launch = attempt
+    launches = []
+    launch = self.orch._launch
+
+    def record_launch( run, node, launch_wrapper ):
+      launches.append( node )
+      launch( run, node, launch_wrapper )
+
+    self.orch._launch = record_launch
+    running = set()
+    journal = self.orch.journal
+
+    def record( action_id_list ):
+      running.update( node for node in action_id_list if self.orch.actions[node].state == sane.ActionState.RUNNING )
+      journal( action_id_list )
+
+    self.orch.journal = record
+    self.assertTrue( self.orch.run_actions( [ f"blocked_{i}" for i in range( 6 ) ], as_host="dummy" ) )
+    # After the first pass only one launch and one failed attempt for each release
+    self.assertLessEqual( len( attempts ), 6 + 2 * 5 )
+    # Waiting actions keep the order they became ready in
+    self.assertEqual( launches, [ f"blocked_{i}" for i in range( 6 ) ] )
+    # Every launch is journaled while it runs
+    self.assertEqual( running, { f"blocked_{i}" for i in range( 6 ) } )
+
+  def test_orchestrator_run_actions_backfill( self ):
+    """Test that blocked actions only hold back smaller ones when backfill is requested"""
+    for backfill, expected in ( ( False, [ "first", "small", "large" ] ), ( True, [ "first", "large", "small" ] ) ):
+      with self.subTest( backfill=backfill ):
+        self._dummy_orchestrator( backfill=backfill )
+        self.orch.hosts["dummy"].add_resources( { "cpus" : 4 } )
+        self.orch.runtimes = { "first" : 0.2 }
+        for id, cpus, duration in ( ( "first", 2, "0.2" ), ( "large", 4, "0" ), ( "small", 1, "0" ) ):
+          action = sane.Action( id )
+          action.config["command"] = "sleep"
+          action.config["arguments"] = [ duration ]
+          action.add_resource_requirements( { "cpus" : cpus } )
+          self.orch.add_action( action )
+
+        launches = []
+        launch = self.orch._launch
+
+        def record_launch( run, node, launch_wrapper ):
+          launches.append( node )
+          launch( run, node, launch_wrapper )
+
+        self.orch._launch = record_launch
+        self.assertTrue( self.orch.run_actions( [ "first", "large", "small" ], as_host="dummy" ) )
+        # Without its own runtime estimate the small action could delay the reservation for the large one
+        self.assertEqual( launches, expected )
+
+  def test_orchestrator_run_actions_asyncio( self ):
+    """Test that the asyncio engine runs the same workflow with the same results"""
+    self._run_dependencies( engine="asyncio" )
+    self.assertIsNotNone( self.orch.actions["c"].__time__ )
+
+  def test_orchestrator_run_actions_direct_exec( self ):
+    """Test that command-only actions run directly with the same results"""
+    for engine in ( "threads", "asyncio" ):
+      with self.subTest( engine=engine ):
+        self._run_dependencies( engine=engine, direct_exec=True )
+        self.assertTrue( self.orch.actions["a"].direct_exec_compatible() )
+        self.assertEqual( self.orch.actions["a"].__direct_env__, dict( os.environ ) )
+
+  def test_orchestrator_run_actions_fork_server( self ):
+    """Test that actions forked from the fork server run the same workflow with the same results"""
+    self._run_dependencies( fork_server=True )
+    # The server is stopped and cleaned up at the end of the run
+    self.assertFalse( os.path.exists( self.orch.actions["a"].__fork_server__ ) )
+
+  def test_orchestrator_run_actions_pipe_handoff( self ):
+    """Test that actions handed off through stdin run the same workflow without writing save files"""
+    for engine, fork_server in ( ( "threads", False ), ( "asyncio", False ), ( "threads", True ) ):
+      with self.subTest( engine=engine, fork_server=fork_server ):
+        saved_files = self._run_dependencies( engine=engine, fork_server=fork_server, pipe_handoff=True )
+        self.assertEqual( [ f for f in saved_files if f.startswith( ( "action_", "host_" ) ) ], [] )
+    with self.subTest( batch=True ):
+      self._run_batch( pipe_handoff=True )
+
+  def test_orchestrator_run_actions_result_cache( self ):
+    """Test that unchanged actions are restored from the result cache and changes re-run only their dependents"""
+    def run( messages, bypass=False ):
+      self._dummy_orchestrator( result_cache=True, bypass_result_cache=bypass )
+      for id, deps in ( ( "a", [] ), ( "b", [ "a" ] ), ( "c", [] ) ):
+        action = sane.Action( id )
+        action.config["command"] = "sh"
+        action.config["arguments"] = [ "-c", f"echo {messages[id]} >> {self.tmpdir}/{id}.txt" ]
+        action.outputs["message"] = messages[id]
+        action.add_dependencies( *deps )
+        self.orch.add_action( action )
+      self.assertTrue( self.orch.run_actions( [ "b", "c" ], as_host="dummy" ) )
+      for id in messages:
+        self.assertEqual( self.orch.actions[id].status, sane.ActionStatus.SUCCESS )
+        self.assertEqual( self.orch.actions[id].outputs["message"], messages[id] )
+      runs = {}
+      for id in messages:
+        with open( f"{self.tmpdir}/{id}.txt" ) as f:
+          runs[id] = len( f.readlines() )
+      return runs
+
+    messages = { "a" : "x", "b" : "y", "c" : "z" }
+    self.assertEqual( run( messages ), { "a" : 1, "b" : 1, "c" : 1 } )
+    self.assertEqual( run( messages ), { "a" : 1, "b" : 1, "c" : 1 } )
+    # Changing an action re-runs it and its dependents only
+    messages["a"] = "w"
+    self.assertEqual( run( messages ), { "a" : 2, "b" : 2, "c" : 1 } )
+    self.assertEqual( run( messages ), { "a" : 2, "b" : 2, "c" : 1 } )
+    self.assertEqual( run( messages, bypass=True ), { "a" : 3, "b" : 3, "c" : 2 } )
+
+  def test_orchestrator_run_actions_up_to_date( self ):
+    """Test that actions with outputs newer than their inputs are skipped and changes re-run downstream"""
+    tmpdir = self.tmpdir
+    for name in ( "src_a.txt", "src_c.txt" ):
+      with open( f"{tmpdir}/{name}", "w" ) as f:
+        f.write( name )
+
+    def run( up_to_date_hash=False ):
+      self._dummy_orchestrator( skip_up_to_date=True, up_to_date_hash=up_to_date_hash )
+      for id, inputs, source, deps in (
+                                        ( "a", [ "src_a.txt" ], "src_a.txt", [] ),
+                                        ( "b", [], "out_a.txt", [ "a" ] ),
+                                        ( "c", [ "src_c.txt" ], "src_c.txt", [] )
+                                        ):
+        action = sane.Action( id )
+        action.working_directory = tmpdir
+        action.input_files  = inputs
+        action.output_files = [ f"out_{id}.txt" ]
+        action.config["command"] = "sh"
+        action.config["arguments"] = [
+                                       "-c",
+                                       f"cat {tmpdir}/{source} > {tmpdir}/out_{id}.txt; echo >> {tmpdir}/ran_{id}.txt"
+                                       ]
+        action.add_dependencies( *deps )
+        self.orch.add_action( action )
+      self.assertTrue( self.orch.run_actions( [ "b", "c" ], as_host="dummy" ) )
+      runs = {}
+      for id in ( "a", "b", "c" ):
+        with open( f"{tmpdir}/ran_{id}.txt" ) as f:
+          runs[id] = len( f.readlines() )
+      return runs
+
+    def touch( name ):
+      future = time.time() + 10
+      os.utime( f"{tmpdir}/{name}", ( future, future ) )
+
+    self.assertEqual( run(), { "a" : 1, "b" : 1, "c" : 1 } )
+    self.assertEqual( run(), { "a" : 1, "b" : 1, "c" : 1 } )
+    # Only the changed input and what depends on it run again
+    touch( "src_a.txt" )
+    self.assertEqual( run( up_to_date_hash=True ), { "a" : 2, "b" : 2, "c" : 1 } )
+    # The content is unchanged so nothing needs to run with hashes, but does without them
+    touch( "src_a.txt" )
+    self.assertEqual( run( up_to_date_hash=True ), { "a" : 2, "b" : 2, "c" : 1 } )
+    self.assertEqual( run(), { "a" : 3, "b" : 3, "c" : 1 } )
+    # Rebuilding an action with identical output does not rebuild its dependents with hashes
+    os.remove( f"{tmpdir}/out_a.txt" )
+    self.assertEqual( run( up_to_date_hash=True ), { "a" : 4, "b" : 3, "c" : 1 } )
+
+  def _run_timeout( self, **attributes ):
+    self._dummy_orchestrator( **attributes )
+    slow = sane.Action( "slow" )
+    slow.timeout = 1.0
+    # The backgrounded sleep holds the output open unless the whole group is killed
+    slow.config["command"] = "sh"
+    slow.config["arguments"] = [ "-c", "sleep 30 & wait" ]
+    fast = sane.Action( "fast" )
+    fast.timeout = 30.0
+    fast.config["command"] = "true"
+    self.orch.add_action( slow )
+    self.orch.add_action( fast )
+
+    start = time.monotonic()
+    self.assertFalse( self.orch.run_actions( [ "slow", "fast" ], as_host="dummy" ) )
+    self.assertLess( time.monotonic() - start, 20.0 )
+    self.assertEqual( slow.status, sane.action.ActionStatus.FAILURE )
+    self.assertTrue( slow.results["timed_out"] )
+    self.assertEqual( fast.status, sane.action.ActionStatus.SUCCESS )
+    self.assertFalse( fast.results["timed_out"] )
+
+  def test_orchestrator_run_actions_timeout( self ):
+    """Test that an action running past its timeout is killed along with its child processes"""
+    self._run_timeout()
+
+  def test_orchestrator_run_actions_timeout_asyncio( self ):
+    """Test that the asyncio engine kills actions past their timeout"""
+    self._run_timeout( engine="asyncio" )
+
+  def test_orchestrator_run_actions_timeout_fork_server( self ):
+    """Test that forked launchers are killed past their timeout"""
+    self._run_timeout( fork_server=True )
+
+  def test_orchestrator_run_actions_timeout_direct_exec( self ):
+    """Test that directly executed commands are killed past their timeout"""
+    self._run_timeout( direct_exec=True )
+
+  def _run_fail_fast( self, fail_fast_pattern=None, **attributes ):
+    self._dummy_orchestrator( max_workers=4, fail_fast=True, fail_fast_pattern=fail_fast_pattern, **attributes )
+    stopped = fail_fast_pattern is None or re.search( fail_fast_pattern, "bad" ) is not None
+    for id, arguments, deps in (
+                                  ( "bad", [ "-c", "sleep 1; exit 1" ], [] ),
+                                  # The backgrounded sleep holds the output open unless the whole group is killed
+                                  ( "slow", [ "-c", "sleep 30 & wait" if stopped else "sleep 2" ], [] ),
+                                  ( "after", [ "-c", "true" ], [ "slow" ] )
+                                  ):
+      action = sane.Action( id )
+      action.config["command"] = "sh"
+      action.config["arguments"] = arguments
+      action.add_dependencies( *deps )
+      self.orch.add_action( action )
+
+    start = time.monotonic()
+    self.assertFalse( self.orch.run_actions( [ "bad", "after" ], as_host="dummy" ) )
+    self.assertLess( time.monotonic() - start, 20.0 )
+    self.assertEqual( self.orch.actions["bad"].status, sane.action.ActionStatus.FAILURE )
+    if not stopped:
+      self.assertEqual( self.orch.actions["slow"].status, sane.action.ActionStatus.SUCCESS )
+      self.assertEqual( self.orch.actions["after"].status, sane.action.ActionStatus.SUCCESS )
+      return
+
+    self.assertEqual( self.orch.actions["slow"].status, sane.action.ActionStatus.FAILURE )
+    self.assertTrue( self.orch.actions["slow"].results["cancelled"] )
+    self.assertEqual( self.orch.actions["after"].state, sane.action.ActionState.SKIPPED )
+    self.assertTrue( self.orch.actions["after"].results["cancelled"] )
+
+    # The save file and report agree
+    saved = self.orch._load_save_dict()
+    self.assertEqual( saved["actions"]["after"]["state"], "skipped" )
+    self.assertEqual( saved["actions"]["slow"]["status"], "failure" )
+    with open( self.orch.results_file, "r" ) as f:
+      report = f.read()
+    self.assertIn( "Cancelled after a failure", report )
+    self.assertIn( 'skipped="1"', report )
+
+  def test_orchestrator_run_actions_fail_fast( self ):
+    """Test that a failure stops running actions and skips everything not launched yet"""
+    self._run_fail_fast()
+
+  def test_orchestrator_run_actions_fail_fast_asyncio( self ):
+    """Test that the asyncio engine stops running actions on a failure"""
+    self._run_fail_fast( engine="asyncio" )
+
+  def test_orchestrator_run_actions_fail_fast_pattern( self ):
+    """Test that only failures of actions matching the fail-fast pattern stop the workflow"""
+    self._run_fail_fast( fail_fast_pattern="^critical" )
+
+  def _run_retry( self, **attributes ):
+    self._dummy_orchestrator( **attributes )
+    # Fails with the given exit code until it has run three times
+    script = "echo >> {0}/{1}.count; [ $( wc -l < {0}/{1}.count ) -ge 3 ] || {{ echo attempt\\ failed; exit {2}; }}"
+    for id, exit_code, output in ( ( "flaky", 75, [] ), ( "broken", 1, [] ), ( "matched", 1, [ "attempt fail" ] ) ):
+      action = sane.Action( id )
+      action.max_attempts = 3
+      action.retry_backoff = 0.1
+      action.retry_exit_codes = [ 75 ]
+      action.retry_output = output
+      action.config["command"] = "sh"
+      action.config["arguments"] = [ "-c", script.format( self.tmpdir, id, exit_code ) ]
+      self.orch.add_action( action )
+    after = sane.Action( "after" )
+    after.config["command"] = "true"
+    after.add_dependencies( "flaky" )
+    self.orch.add_action( after )
+
+    self.assertFalse( self.orch.run_actions( [ "after", "broken", "matched" ], as_host="dummy" ) )
+    for id in ( "flaky", "matched" ):
+      action = self.orch.actions[id]
+      retvals = [ attempt["retval"] for attempt in action.results["retries"] ]
+      self.assertEqual( action.status, sane.action.ActionStatus.SUCCESS )
+      self.assertEqual( retvals, [ 75 if id == "flaky" else 1 ] * 2 )
+      for attempt in action.results["retries"]:
+        self.assertIsNotNone( attempt["time"] )
+        with open( attempt["runlog"], "r" ) as f:
+          self.assertIn( "attempt failed", f.read() )
+      with open( action.runlog, "r" ) as f:
+        self.assertNotIn( "attempt failed", f.read() )
+    self.assertEqual( self.orch.actions["after"].status, sane.action.ActionStatus.SUCCESS )
+
+    # Exit code not retried
+    self.assertEqual( self.orch.actions["broken"].status, sane.action.ActionStatus.FAILURE )
+    self.assertEqual( self.orch.actions["broken"].results["retries"], [] )
+    with open( f"{self.tmpdir}/broken.count" ) as f:
+      self.assertEqual( len( f.readlines() ), 1 )
+
+  def test_orchestrator_run_actions_retry( self ):
+    """Test that failed launches are retried per action policy with each attempt recorded"""
+    self._run_retry()
+
+  def test_orchestrator_run_actions_retry_asyncio( self ):
+    """Test that the asyncio engine retries failed launches"""
+    self._run_retry( engine="asyncio" )
+
+  def _run_batch( self, **attributes ):
+    self._dummy_orchestrator( batch_size=3, **attributes )
+    ids = [ f"batch_{i}" for i in range( 5 ) ]
+    for id in ids:
+      action = sane.Action( id )
+      action.batch = True
+      action.config["command"] = "sh"
+      action.config["arguments"] = [ "-c", f"echo output of {id}; test {id} != batch_3" ]
+      self.orch.add_action( action )
+
+    self.assertFalse( self.orch.run_actions( ids, as_host="dummy" ) )
+    for id in ids:
+      expected = sane.ActionStatus.FAILURE if id == "batch_3" else sane.ActionStatus.SUCCESS
+      self.assertEqual( self.orch.actions[id].status, expected )
+      self.assertIsNotNone( self.orch.actions[id].__time__ )
+      with open( self.orch.actions[id].runlog ) as f:
+        runlog = f.read()
+      self.assertIn( f"output of {id}", runlog )
+      for other in ids:
+        if other != id:
+          self.assertNotIn( f"output of {other}", runlog )
+
+  def test_orchestrator_run_actions_batch( self ):
+    """Test that batched actions share a launcher while keeping their own status and runlog"""
+    self._run_batch()
+
+  def _incremental_dag( self ):
+    self.orch.log_location = self.tmpdir
+    for id in ( "a", "b", "c" ):
+      self.orch.add_action( sane.Action( id ) )
+    self.orch.actions["b"].add_dependencies( "a" )
+    self.assertEqual( self.orch.traversal_list( [ "b" ] ), { "a" : 0, "b" : 1 } )
+
+    self.orch.actions["c"].add_dependencies( "b" )
+    self.assertEqual( self.orch.traversal_list( [ "c" ] ), { "a" : 0, "b" : 1, "c" : 1 } )
+
+    self.orch.actions["a"].add_dependencies( "c" )
+    with self.assertRaises( Exception ):
+      self.orch.construct_dag()
+
+  def test_orchestrator_incremental_dag( self ):
+    """Test that dependencies added at any time are reflected in the DAG and cycles are rejected"""
+    self._incremental_dag()
+
+  def test_orchestrator_compact_dag( self ):
+    """Test the orchestrator DAG using the compact backend"""
+    self.orch.compact_dag = True
+    self._incremental_dag()
+
+  def test_orchestrator_critical_path( self ):
+    """Test the remaining critical path of actions using runtimes and priorities"""
+    # Only used when asked for
+    self.assertEqual( self.orch.schedule, "fifo" )
+    self.orch.log_location = self.tmpdir
+    #   a -> b -> c
+    #   d
+    for id in ( "d", "a", "b", "c" ):
+      self.orch.add_action( sane.Action( id ) )
+    self.orch.actions["b"].add_dependencies( "a" )
+    self.orch.actions["c"].add_dependencies( "b" )
+
+    # No runtimes known, so the chain is ordered by length
+    self.assertEqual( self.orch.critical_path( [ "c", "d" ] ), { "a" : 3.0, "b" : 2.0, "c" : 1.0, "d" : 1.0 } )
+
+    self.orch.runtimes = { "a" : 1.0, "b" : 2.0, "d" : 10.0 }
+    self.orch.actions["c"].priority = 0.5
+    path = self.orch.critical_path( [ "c", "d" ] )
+    self.assertEqual( path, { "a" : 3.5, "b" : 2.5, "c" : 0.5, "d" : 10.0 } )
+    # Unknown runtimes use the average of known ones
+    self.orch.actions["c"].priority = None
+    self.assertAlmostEqual( self.orch.critical_path( [ "c" ] )["a"], 1.0 + 2.0 + 1.5 )
+
+  def test_orchestrator_save_journal( self ):
+    """Test that state changes are journaled and compacted into the save file snapshot"""
+    self.orch.save_location = self.tmpdir
+    self.orch.log_location  = self.tmpdir
+    self.orch.add_host( sane.Host( "dummy" ) )
+    self.orch._current_host = "dummy"
+    for id in ( "a", "b" ):
+      self.orch.add_action( sane.Action( id ) )
+      self.orch.actions[id].set_state_pending()
+
+    self.orch.save( [ "a", "b" ] )
+    self.assertFalse( os.path.isfile( self.orch.journal_file ) )
+
+    self.orch.actions["a"].set_status_failure()
+    self.orch.journal( [ "a" ] )
+    self.assertTrue( os.path.isfile( self.orch.journal_file ) )
+    save_dict = sane.orchestrator.load_save_file( self.orch.save_file )
+    self.assertEqual( save_dict["actions"]["a"]["status"], "failure" )
+    self.assertEqual( save_dict["actions"]["b"]["state"], "pending" )
+
+    # A truncated trailing record from an interrupted run is ignored
+    with open( self.orch.journal_file, "a" ) as f:
+      f.write( '{ "actions" : { "b" : ' )
+    save_dict = sane.orchestrator.load_save_file( self.orch.save_file )
+    self.assertEqual( save_dict["actions"]["a"]["status"], "failure" )
+
+    self.orch.save( [ "a", "b" ] )
+    self.assertFalse( os.path.isfile( self.orch.journal_file ) )
+    self.orch.actions["a"].set_state_pending()
+    self.orch.load( clear_failures=False )
+    self.assertEqual( self.orch.actions["a"].status, sane.ActionStatus.FAILURE )
+
+    # Only a journal, e.g. from a run that never got to its first snapshot
+    os.remove( self.orch.save_file )
+    self.orch.actions["b"].set_status_success()
+    self.orch.journal( [ "a", "b" ] )
+    del self.orch.actions["a"]
+    self.orch.load()
+    self.assertEqual( self.orch.actions["b"].status, sane.ActionStatus.SUCCESS )
+    self.assertTrue( os.path.isfile( self.orch.journal_file + ".backup" ) )
+
+  def test_orchestrator_save_sqlite( self ):
+    """Test that the SQLite save backend records runs and can be queried and loaded"""
+    self.orch.save_location = self.tmpdir
+    self.orch.log_location  = self.tmpdir
+    self.orch.save_backend  = "sqlite"
+    self.orch.add_host( sane.Host( "dummy" ) )
+    self.orch._current_host = "dummy"
+    for id in ( "a", "b" ):
+      self.orch.add_action( sane.Action( id ) )
+      self.orch.actions[id].set_state_pending()
+
+    try:
+      self.assertEqual( os.path.splitext( self.orch.save_file )[1], ".db" )
+      self.orch.__timestamp__ = "2000-01-01T00:00:00"
+      self.orch.save( [ "a", "b" ] )
+      self.orch.actions["a"].set_status_failure()
+      self.orch.journal( [ "a" ] )
+      self.assertFalse( os.path.isfile( self.orch.journal_file ) )
+
+      # A second run only touching b
+      self.orch.__timestamp__ = "2000-01-02T00:00:00"
+      self.orch.actions["b"].set_status_success()
+      self.orch.journal( [ "b" ] )
+
+      with sane.state_db.StateDB( self.orch.save_file, readonly=True ) as db:
+        self.assertEqual( db.runs(), [ "2000-01-01T00:00:00", "2000-01-02T00:00:00" ] )
+        self.assertEqual( list( db.actions( status="failure" ).keys() ), [ "a" ] )
+        self.assertEqual( list( db.actions( last_run=True ).keys() ), [ "b" ] )
+        self.assertEqual( db.actions( last_run=True, status="failure" ), {} )
+        # Each run keeps its own results
+        history = db.history( "b" )
+        self.assertEqual( list( history.keys() ), [ "2000-01-01T00:00:00", "2000-01-02T00:00:00" ] )
+        self.assertEqual( history["2000-01-01T00:00:00"]["status"], "none" )
+        self.assertEqual( history["2000-01-02T00:00:00"]["status"], "success" )
+        self.assertEqual( list( db.history( "a" ).keys() ), [ "2000-01-01T00:00:00" ] )
+
+      self.orch.actions["a"].set_state_pending()
+      self.orch.load( clear_failures=False )
+      self.assertEqual( self.orch.actions["a"].status, sane.ActionStatus.FAILURE )
+      self.assertEqual( self.orch.actions["b"].status, sane.ActionStatus.SUCCESS )
+
+      # A removed database is created again instead of written to through the old connection
+      for filename in ( self.orch.save_file, self.orch.save_file + "-wal", self.orch.save_file + "-shm" ):
+        if os.path.exists( filename ):
+          os.remove( filename )
+      self.orch.save( [ "a", "b" ] )
+      with sane.state_db.StateDB( self.orch.save_file, readonly=True ) as db:
+        self.assertEqual( db.runs(), [ "2000-01-02T00:00:00" ] )
+    finally:
+      self.orch._close_state_db()
@@ -211,3 +211,37 @@ class ResourceTests( unittest.TestCase ):
     result = copy.deepcopy( lhs )
     with self.assertRaises( ValueError ):
       result -= rhs_num
+
+  def test_provider_backfill_reservation( self ):
+    """Test that a reservation holds resources for a large request while allowing backfill"""
+    provider = res.ResourceProvider( logname="provider" )
+    provider.add_resources( { "cpus" : 8 } )
+
+    def requestor( name, estimate=None ):
+      requestor = res.ResourceRequestor( logname=name )
+      requestor.runtime_estimate = estimate
+      return requestor
+
+    long_small = requestor( "long_small", 100 )
+    self.assertTrue( provider.acquire_resources( { "cpus" : 6 }, long_small ) )
+
+    # The large request cannot start, reserve for it once long_small is done
+    large = requestor( "large" )
+    self.assertFalse( provider.acquire_resources( { "cpus" : 8 }, large ) )
+    provider.reserve_resources( { "cpus" : 8 }, large )
+
+    # Finishes before the reservation starts
+    self.assertTrue( provider.acquire_resources( { "cpus" : 1 }, requestor( "short", 10 ) ) )
+    # Would delay the reservation
+    self.assertFalse( provider.acquire_resources( { "cpus" : 1 }, requestor( "long", 1000 ) ) )
+    self.assertFalse( provider.acquire_resources( { "cpus" : 1, "timelimit" : "01:00:00" }, requestor( "timelimit" ) ) )
+    self.assertFalse( provider.acquire_resources( { "cpus" : 1 }, requestor( "unknown" ) ) )
+
+    provider.clear_reservation()
+    self.assertTrue( provider.acquire_resources( { "cpus" : 1 }, requestor( "unknown" ) ) )
+
+    # Anything is allowed if it only uses resources spare at the reservation start
+    provider.release_resources( { "cpus" : 6 }, long_small )
+    provider.reserve_resources( { "cpus" : 4 }, large )
+    self.assertTrue( provider.acquire_resources( { "cpus" : 4 }, large ) )
+    self.assertIsNone( provider._reservation )
@@ -0,0 +1,50 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import sane.result_cache as result_cache
+
+
+class ResultCacheTests( unittest.TestCase ):
+  def setUp( self ):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join( self.tmpdir, "result_cache.json" )
+
+  def tearDown( self ):
+    shutil.rmtree( self.tmpdir )
+
+  def test_result_cache_lru_eviction( self ):
+    """Test that the least recently used results are evicted once over the size limit"""
+    results = { "state" : "finished", "status" : "success", "outputs" : { "x" : 0 } }
+    cache = result_cache.ResultCache( self.filename, max_size=0 )
+    cache.put( "a", results )
+    self.assertEqual( len( cache ), 0 )
+
+    # Room for exactly three entries
+    cache.max_size = 3 * len( json.dumps( results ) )
+    for key in ( "a", "b", "c" ):
+      cache.put( key, results )
+    self.assertEqual( len( cache ), 3 )
+    # Using "a" makes "b" the least recently used
+    self.assertEqual( cache.get( "a" ), results )
+    cache.put( "d", results )
+    self.assertIsNone( cache.get( "b" ) )
+    for key in ( "a", "c", "d" ):
+      self.assertEqual( cache.get( key ), results )
+
+  def test_result_cache_save( self ):
+    """Test that results and their order of use persist across loads"""
+    cache = result_cache.ResultCache( self.filename, max_size=1024 )
+    cache.put( "a", { "outputs" : 1 } )
+    cache.put( "b", { "outputs" : 2 } )
+    cache.get( "a" )
+    cache.save()
+
+    cache = result_cache.ResultCache( self.filename, max_size=1024 )
+    self.assertEqual( len( cache ), 2 )
+    cache.max_size = cache.size - 1
+    cache.put( "b", { "outputs" : 2 } )
+    self.assertIsNone( cache.get( "a" ) )
+    self.assertEqual( cache.get( "b" ), { "outputs" : 2 } )
@@ -96,3 +96,16 @@ class SaneRunnerTests( unittest.TestCase ):
       action = f"action_{i:03d}"
       self.assertNotIn( action, output )
       self.assertTrue( os.path.isfile( f"{self.root}/log/{action}.log") )
+
+  def test_sane_runner_new_sqlite( self ):
+    """Test that a new run with the sqlite backend starts a fresh database and keeps the runtimes"""
+    # Keep the save location in the log directory cleaned up by tearDown
+    save_location = f"{self.root}/log/save"
+    argv = [ "foo", "-p", f"{self.root}/demo/", "-n", "-r", "-a", "action_000", "-sb", "sqlite", "-sl", save_location ]
+    for i in range( 2 ):
+      sys.argv = list( argv )
+      self.exit_ok( sane.sane_runner.main )
+
+    with sane.state_db.StateDB( os.path.join( save_location, "orchestrator.db" ), readonly=True ) as db:
+      self.assertEqual( len( db.runs() ), 1 )
+      self.assertEqual( db.actions()["action_000"]["status"], "success" )
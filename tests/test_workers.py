@@ -0,0 +1,51 @@
+import threading
+import unittest
+
+import sane.workers as workers
+
+
+class WorkerPoolTests( unittest.TestCase ):
+  def test_worker_pool_on_demand( self ):
+    """Test workers are only created as needed, up to the maximum"""
+    pool = workers.WorkerPool( max_workers=4, idle_timeout=5.0 )
+    self.assertEqual( pool.num_workers, 0 )
+    self.assertEqual( pool.submit( sum, [ 1, 2, 3 ] ).result(), 6 )
+    # The idle worker is reused rather than starting a new one
+    self.assertEqual( pool.submit( max, 1, 2 ).result(), 2 )
+    self.assertEqual( pool.statistics()["threads_started"], 1 )
+
+    release = threading.Event()
+    names = set()
+
+    def block():
+      names.add( threading.current_thread().name )
+      release.wait()
+    futures = [ pool.submit( block ) for i in range( 6 ) ]
+    self.assertLessEqual( pool.num_workers, 4 )
+    release.set()
+    for future in futures:
+      future.result()
+    pool.shutdown( wait=True )
+    self.assertEqual( pool.num_workers, 0 )
+    self.assertTrue( names.issubset( { f"thread_{i}" for i in range( 4 ) } ) )
+
+    stats = pool.statistics()
+    self.assertEqual( stats["submitted"], 8 )
+    self.assertEqual( stats["peak_workers"], 4 )
+    self.assertGreaterEqual( stats["peak_queue_depth"], 2 )
+    self.assertRaises( RuntimeError, pool.submit, sum, [] )
+
+  def test_worker_pool_reaps_idle( self ):
+    """Test idle workers exit and exceptions are passed to the future"""
+    pool = workers.WorkerPool( max_workers=2, idle_timeout=0.01 )
+    future = pool.submit( int, "not a number" )
+    self.assertRaises( ValueError, future.result )
+    for i in range( 100 ):
+      if pool.num_workers == 0:
+        break
+      threading.Event().wait( 0.01 )
+    self.assertEqual( pool.num_workers, 0 )
+    # A new worker is started once more work arrives
+    self.assertEqual( pool.submit( abs, -1 ).result(), 1 )
+    self.assertEqual( pool.statistics()["threads_started"], 2 )
+    pool.shutdown( wait=True )
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Benchmark building and walking a DAG traversal
+
+The traversal to the last layer of nodes is timed, followed by the walk where
+each wake completes one node and retrieves any newly ready nodes, as done by
+the orchestrator run loop. The cost per wake should stay flat as the number
+of nodes grows. With --memory the memory held by the graph and a traversal
+of the whole graph is also reported, excluding the node id strings themselves.
+"""
+import argparse
+import collections
+import functools
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.append( os.path.abspath( os.path.join( os.path.dirname( __file__ ), ".." ) ) )
+
+from sane.dag import DAG, CompactDAG  # noqa: E402
+
+backends = { "dict" : DAG, "compact" : CompactDAG }
+
+
+def build_dag( backend, names, width, fan_in ):
+  dag = backends[backend]()
+  # Layers of width nodes where each node depends on fan_in nodes of the previous layer
+  for i, name in enumerate( names ):
+    dag.add_node( name )
+    if i >= width:
+      layer_start = ( i // width - 1 ) * width
+      for j in range( fan_in ):
+        dag.add_edge( names[layer_start + ( i + j ) % width], name )
+  return dag
+
+
+def measure_memory( backend, names, width, fan_in ):
+  tracemalloc.start()
+  dag = build_dag( backend, names, width, fan_in )
+  # Make sure any lazily built structures are included
+  dag.topological_sort()
+  graph = tracemalloc.get_traced_memory()[0]
+  traversal_list = dag.traversal_list( names[-width:] )
+  traversal = tracemalloc.get_traced_memory()[0] - graph
+  tracemalloc.stop()
+  return graph, traversal
+
+
+def legacy_get_next_nodes( names, traversal_list ):
+  # The original scan of every remaining node, ordered by searching the list of nodes in insertion order
+  nodes = sorted( [ key for key, count in traversal_list.items() if count == 0 ], key=list( names ).index )
+  for n in nodes:
+    del traversal_list[n]
+  return nodes
+
+
+def legacy_node_complete( dag, node, traversal_list ):
+  for child in dag.children( node ):
+    if child in traversal_list:
+      traversal_list[child] -= 1
+
+
+def walk( get_next_nodes, node_complete, traversal_list ):
+  ready = collections.deque( get_next_nodes( traversal_list ) )
+  wakes = 0
+  while len( ready ) > 0:
+    node = ready.popleft()
+    node_complete( node, traversal_list )
+    ready.extend( get_next_nodes( traversal_list ) )
+    wakes += 1
+  return wakes
+
+
+def main():
+  parser = argparse.ArgumentParser( description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter )
+  parser.add_argument( "-n", "--nodes", type=int, nargs="+", default=[ 1000, 10000, 50000 ] )
+  parser.add_argument( "-w", "--width", type=int, default=100 )
+  parser.add_argument( "-f", "--fan_in", type=int, default=2 )
+  parser.add_argument( "-b", "--backend", choices=list( backends.keys() ), nargs="+", default=list( backends.keys() ) )
+  parser.add_argument(
+                      "-l", "--legacy",
+                      action="store_true",
+                      help="Also time the original full scan of a plain dict traversal per wake"
+                      )
+  parser.add_argument( "-m", "--memory", action="store_true", help="Report memory of the graph and traversal" )
+  options = parser.parse_args()
+
+  header = f"{'nodes':>8} {'backend':>8} {'traversal':>10} {'build ms':>10} {'us/wake':>10}"
+  if options.memory:
+    header += f" {'graph MB':>10} {'trav. MB':>10}"
+  print( header )
+  for nnodes in options.nodes:
+    names = [ f"action_{i}" for i in range( nnodes ) ]
+    nodes = names[-options.width:]
+    for backend in options.backend:
+      dag = build_dag( backend, names, options.width, options.fan_in )
+      kinds = [ ( "heap", dag.traversal_list, dag.get_next_nodes, dag.node_complete ) ]
+      if options.legacy:
+        kinds.append( (
+                        "scan",
+                        lambda n: dict( dag.traversal_list( n ) ),
+                        functools.partial( legacy_get_next_nodes, names ),
+                        functools.partial( legacy_node_complete, dag )
+                        ) )
+      memory = ""
+      if options.memory:
+        graph, traversal = measure_memory( backend, names, options.width, options.fan_in )
+        memory = f" {graph / 1024**2:>10.2f} {traversal / 1024**2:>10.2f}"
+      for kind, make_traversal, get_next_nodes, node_complete in kinds:
+        start = timeit.default_timer()
+        traversal_list = make_traversal( nodes )
+        build = timeit.default_timer() - start
+        start = timeit.default_timer()
+        wakes = walk( get_next_nodes, node_complete, traversal_list )
+        elapsed = timeit.default_timer() - start
+        print( f"{nnodes:>8} {backend:>8} {kind:>10} {build * 1e3:>10.2f} {elapsed / wakes * 1e6:>10.2f}" + memory )
+
+
+if __name__ == "__main__":
+  main()
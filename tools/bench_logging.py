@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Benchmark Logger.log calls per second at enabled and filtered levels
+
+An action logs to its logfile (and the console, sent to /dev/null) the way it does
+during a workflow run, either directly or through the listener thread the orchestrator
+uses while running actions. The time spent in the logging thread is reported along with
+the total time, which for queued records includes writing them all out.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append( os.path.abspath( os.path.join( os.path.dirname( __file__ ), ".." ) ) )
+
+import sane  # noqa: E402
+import sane.logger as slogger  # noqa: E402
+
+
+def measure( action, calls, level, listener ):
+  if listener:
+    slogger.start_listener()
+  start = time.perf_counter()
+  for i in range( calls ):
+    action.log( "Message", i, "of", calls, level=level )
+  caller = time.perf_counter() - start
+  if listener:
+    slogger.stop_listener()
+  return caller, time.perf_counter() - start
+
+
+def main():
+  parser = argparse.ArgumentParser( description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter )
+  parser.add_argument( "-n", "--calls", type=int, default=100000 )
+  options = parser.parse_args()
+
+  with tempfile.TemporaryDirectory() as tmpdir, open( os.devnull, "w" ) as devnull:
+    slogger.console_handler.stream = devnull
+    action = sane.Action( "bench" )
+    action.log_location = tmpdir
+    action.setup_logs()
+
+    levels = [ ( "enabled", slogger.ACT_INFO ), ( "filtered", 10 ) ]
+    print( f"{'level':>9} {'listener':>9} {'caller s':>9} {'total s':>8} {'calls/s':>10}" )
+    for name, level in levels:
+      for listener in ( False, True ):
+        caller, total = measure( action, options.calls, level, listener )
+        print( f"{name:>9} {str( listener ):>9} {caller:>9.3f} {total:>8.3f} {options.calls / caller:>10.0f}" )
+
+    for handler in action.logger.handlers:
+      handler.close()
+
+
+if __name__ == "__main__":
+  main()
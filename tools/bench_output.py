@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Benchmark reading the output of chatty commands through Action.execute_subprocess
+
+A command writing a number of lines as fast as it can is run the way the orchestrator
+launches actions: output captured, written to a runlog, and logged to the action
+logfile. The wall time, the CPU time spent in this process, and the throughput are
+reported for the chunked reader and, as a baseline, the previous line by line reader.
+"""
+import argparse
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append( os.path.abspath( os.path.join( os.path.dirname( __file__ ), ".." ) ) )
+
+import sane  # noqa: E402
+import sane.logger as slogger  # noqa: E402
+
+
+class LegacyTee:
+  # Line by line reader as it was before chunked reads
+  def __init__( self, logfile, log ):
+    self._logfile = open( logfile, "w+", buffering=1 )
+    self._output = io.BytesIO()
+    self._log = log
+
+  def write( self, line ):
+    self._logfile.write( line.decode( "utf-8", "replace" ) )
+    self._logfile.flush()
+    self._output.write( line )
+    self._log( line.decode( "utf-8", "replace" ).rstrip( "\n" ) )
+
+  def close( self ):
+    self._logfile.close()
+    return self._output.getvalue().decode( "utf-8" )
+
+
+def legacy_execute( action, args ):
+  output = LegacyTee( action.runlog, lambda msg: action.log( msg, level=slogger.STDOUT ) )
+  proc = subprocess.Popen( args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT )
+  for line in iter( proc.stdout.readline, b"" ):
+    output.write( line )
+  proc.stdout.close()
+  return proc.wait(), output.close()
+
+
+def chunked_execute( action, args ):
+  return action.execute_subprocess( args[0], args[1:], logfile=action.runlog, capture=True, verbose=True )
+
+
+def measure( execute, action, args ):
+  wall = time.perf_counter()
+  cpu  = time.process_time()
+  retval, content = execute( action, args )
+  cpu  = time.process_time() - cpu
+  wall = time.perf_counter() - wall
+  if retval != 0:
+    raise RuntimeError( f"Command failed with {retval}" )
+  return wall, cpu, len( content )
+
+
+def main():
+  parser = argparse.ArgumentParser( description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter )
+  parser.add_argument( "-n", "--lines", type=int, nargs="+", default=[ 10000, 100000, 500000 ] )
+  parser.add_argument( "-w", "--width", type=int, default=80, help="Characters per line" )
+  options = parser.parse_args()
+
+  readers = [ ( "readline", legacy_execute ), ( "chunked", chunked_execute ) ]
+
+  with tempfile.TemporaryDirectory() as tmpdir:
+    action = sane.Action( "bench" )
+    action.log_location = tmpdir
+    action.setup_logs()
+
+    print( f"{'lines':>8} {'reader':>8} {'wall s':>8} {'cpu s':>8} {'MB/s':>8} {'klines/s':>9}" )
+    for nlines in options.lines:
+      script = f"import sys; sys.stdout.write( ( 'x' * {options.width} + '\\n' ) * {nlines} )"
+      args = [ sys.executable, "-c", script ]
+      for name, execute in readers:
+        wall, cpu, size = measure( execute, action, args )
+        throughput = f"{size / 1024**2 / wall:>8.1f} {nlines / 1e3 / wall:>9.1f}"
+        print( f"{nlines:>8} {name:>8} {wall:>8.3f} {cpu:>8.3f} {throughput}" )
+
+
+if __name__ == "__main__":
+  main()